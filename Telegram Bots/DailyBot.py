@@ -1,4 +1,5 @@
 import os
+import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
@@ -11,11 +12,26 @@ from telegram.ext import (
 )
 from dotenv import load_dotenv
 import requests
+import metrics
+import profiling
+import prompts
+import resilience
+from suggestion_library import SuggestionLibrary, SUGGESTION_LOOKUPS
 
 # Load environment variables
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN_DAILY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY_DAILY")
+METRICS_PORT = int(os.getenv("METRICS_PORT_DAILY", "9103"))
+BOT_NAME = "DailyBot"
+# Optional overrides so the bot can run against local stand-ins (see bench/loadtest.py)
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE")
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+# Learned suggestions live in this database
+STATE_DB = "DailyBot.db"
+# Schedules whose third-best library match scores below this go to Gemini
+SUGGESTION_MIN_SIMILARITY = float(os.getenv("SUGGESTION_MIN_SIMILARITY", "0.35"))
+SUGGESTION_LIBRARY_MAX = int(os.getenv("SUGGESTION_LIBRARY_MAX", "2000"))
 
 # Conversation states
 PLANNING, REVIEW_SUGGESTIONS, FINALIZING = range(3)
@@ -23,8 +39,14 @@ PLANNING, REVIEW_SUGGESTIONS, FINALIZING = range(3)
 class DailyTaskBot:
     def __init__(self):
         self.user_plans = {}  # Stores user_id: {tasks: [], suggestions: [], selected: []}
+        self.library = SuggestionLibrary(STATE_DB, max_learned=SUGGESTION_LIBRARY_MAX)
         
-        self.application = Application.builder().token(TELEGRAM_TOKEN).build()
+        builder = Application.builder().token(TELEGRAM_TOKEN)
+        if TELEGRAM_API_BASE:
+            builder = builder.base_url(f"{TELEGRAM_API_BASE}/bot").base_file_url(f"{TELEGRAM_API_BASE}/file/bot")
+        if profiling.ENABLED:
+            builder = builder.request(profiling.ptb_request())
+        self.application = builder.build()
         
         conv_handler = ConversationHandler(
             entry_points=[CommandHandler('start', self.start)],
@@ -45,6 +67,7 @@ class DailyTaskBot:
         self.application.add_handler(conv_handler)
         self.application.add_handler(CommandHandler('view', self.view_tasks))
     
+    @metrics.instrument_handler(BOT_NAME)
     async def start(self, update: Update, context: CallbackContext) -> int:
         """Start conversation and request tasks"""
         await update.message.reply_text(
@@ -56,6 +79,7 @@ class DailyTaskBot:
         )
         return PLANNING
     
+    @metrics.instrument_handler(BOT_NAME)
     async def receive_tasks(self, update: Update, context: CallbackContext) -> int:
         """Store user tasks and get Gemini suggestions"""
         user_id = update.effective_user.id
@@ -68,54 +92,82 @@ class DailyTaskBot:
             'selected_suggestions': []
         }
         
-        # Get exactly 3 suggestions from Gemini
-        suggestions = await self.get_health_suggestions(tasks)
+        # Get exactly 3 suggestions, from the local library when it has good matches
+        suggestions, source = await self.get_health_suggestions(tasks)
         self.user_plans[user_id]['suggestions'] = suggestions[:3]  # Take only first 3
+        self.user_plans[user_id]['source'] = source
         
         # Create toggle buttons for each suggestion
+        await update.message.reply_text(
+            "🔍 Here are 3 suggestions to improve your plan:\n"
+            "(Toggle the ones you want to include)",
+            reply_markup=self.suggestion_keyboard(suggestions[:3], self.user_plans[user_id]['selected_suggestions'])
+        )
+        return REVIEW_SUGGESTIONS
+    
+    @staticmethod
+    def suggestion_keyboard(suggestions: list, selected: list) -> InlineKeyboardMarkup:
+        """Toggle button per suggestion, ticked when selected"""
         keyboard = []
-        for i, suggestion in enumerate(suggestions[:3]):
-            emoji = "✅" if i in self.user_plans[user_id]['selected_suggestions'] else "◻️"
+        for i, suggestion in enumerate(suggestions):
+            emoji = "✅" if i in selected else "◻️"
             keyboard.append([InlineKeyboardButton(
                 f"{emoji} Suggestion {i+1}: {suggestion}",
                 callback_data=f"toggle_{i}"
             )])
         
         keyboard.append([InlineKeyboardButton("Done Reviewing", callback_data="done_review")])
-        
-        await update.message.reply_text(
-            "🔍 Here are 3 suggestions to improve your plan:\n"
-            "(Toggle the ones you want to include)",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        return REVIEW_SUGGESTIONS
+        return InlineKeyboardMarkup(keyboard)
     
-    async def get_health_suggestions(self, tasks: list) -> list:
-        """Get exactly 3 health suggestions from Gemini"""
-        url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-pro:generateContent?key={GEMINI_API_KEY}"
-        prompt = (
-            "Provide exactly 3 specific suggestions to improve this daily schedule "
-            "for someone with chronic health conditions. Focus on:\n"
-            "1. Better activity timing\n"
-            "2. Healthier alternatives\n"
-            "3. Important additions\n"
-            "Format each suggestion as a short bullet point starting with '* '\n\n"
-            "Current schedule:\n" + "\n".join(tasks)
+    @staticmethod
+    def task_text(tasks: list, completed: list) -> str:
+        return "\n".join(
+            f"{'✅' if comp else '◻️'} {task}"
+            for task, comp in zip(tasks, completed)
         )
-        
-        try:
-            response = requests.post(url, json={"contents": [{"parts": [{"text": prompt}]}]})
-            response.raise_for_status()
-            text = response.json()['candidates'][0]['content']['parts'][0]['text']
-            return [line[2:].strip() for line in text.split('\n') if line.startswith('* ')]
-        except Exception as e:
-            print(f"Gemini error: {e}")
-            return [
+    
+    @staticmethod
+    def task_keyboard(count: int) -> InlineKeyboardMarkup:
+        keyboard = [
+            [InlineKeyboardButton(f"Toggle Task {i+1}", callback_data=f"complete_{i}")]
+            for i in range(count)
+        ]
+        keyboard.append([InlineKeyboardButton("Finish Day", callback_data="finish")])
+        return InlineKeyboardMarkup(keyboard)
+    
+    async def get_health_suggestions(self, tasks: list) -> tuple:
+        """Get exactly 3 health suggestions and where they came from ("library", "gemini" or "fallback")"""
+        matches = self.library.search(tasks, min_similarity=SUGGESTION_MIN_SIMILARITY)
+        if len(matches) == 3 and matches[-1][1] >= SUGGESTION_MIN_SIMILARITY:
+            SUGGESTION_LOOKUPS.inc(bot=BOT_NAME, source="library")
+            return [suggestion for suggestion, _ in matches], "library"
+
+        url = f"{GEMINI_API_BASE}/v1/models/gemini-1.5-pro:generateContent?key={GEMINI_API_KEY}"
+        prompt = prompts.HEALTH_SUGGESTIONS.render(tasks="\n".join(tasks))
+
+        # Weak library matches still beat the stock list when Gemini is unavailable
+        fallback = [suggestion for suggestion, score in matches if score > 0]
+        if len(fallback) < 3:
+            fallback = [
                 "Add 10-minute stretching between tasks",
                 "Replace sugary snacks with fruits/nuts",
                 "Include a 15-minute mindfulness session"
             ]
+
+        def post(timeout: float):
+            with metrics.track(metrics.GEMINI_SECONDS, metrics.GEMINI_ERRORS, bot=BOT_NAME, call="suggestions"):
+                response = requests.post(url, json={"contents": [{"parts": [{"text": prompt}]}]}, timeout=timeout)
+                response.raise_for_status()
+            text = response.json()['candidates'][0]['content']['parts'][0]['text']
+            return [line[2:].strip() for line in text.split('\n') if line.startswith('* ')]
+
+        # Open circuit, spent deadline, API error or an empty answer all fall back
+        suggestions = await asyncio.to_thread(resilience.call, "gemini", post, fallback=lambda: None, timeout=30)
+        source = "gemini" if suggestions else "fallback"
+        SUGGESTION_LOOKUPS.inc(bot=BOT_NAME, source=source)
+        return (suggestions, source) if suggestions else (fallback, source)
     
+    @metrics.instrument_handler(BOT_NAME)
     async def handle_suggestion_toggle(self, update: Update, context: CallbackContext) -> int:
         """Toggle selection of suggestions"""
         query = update.callback_query
@@ -134,19 +186,11 @@ class DailyTaskBot:
             self.user_plans[user_id]['selected_suggestions'].append(suggestion_idx)
         
         # Update the message with new toggle states
-        keyboard = []
-        for i, suggestion in enumerate(self.user_plans[user_id]['suggestions']):
-            emoji = "✅" if i in self.user_plans[user_id]['selected_suggestions'] else "◻️"
-            keyboard.append([InlineKeyboardButton(
-                f"{emoji} Suggestion {i+1}: {suggestion}",
-                callback_data=f"toggle_{i}"
-            )])
-        
-        keyboard.append([InlineKeyboardButton("Done Reviewing", callback_data="done_review")])
-        
         await query.edit_message_text(
             text="🔍 Here are 3 suggestions to improve your plan:\n(Select the ones you want to include)",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=self.suggestion_keyboard(
+                self.user_plans[user_id]['suggestions'], self.user_plans[user_id]['selected_suggestions']
+            )
         )
         return REVIEW_SUGGESTIONS
     
@@ -162,28 +206,23 @@ class DailyTaskBot:
         for idx in selected:
             final_tasks.append(suggestions[idx])
         
+        # Suggestions the user kept from Gemini answer similar schedules locally next time
+        if selected and self.user_plans[user_id].get('source') == "gemini":
+            await asyncio.to_thread(self.library.learn, original_tasks, [suggestions[idx] for idx in selected])
+        
         # Store final tasks
         self.user_plans[user_id]['final_tasks'] = final_tasks
         self.user_plans[user_id]['completed'] = [False] * len(final_tasks)
         
         # Display with checkboxes
-        task_text = "\n".join(
-            f"{'✅' if completed else '◻️'} {task}"
-            for task, completed in zip(final_tasks, self.user_plans[user_id]['completed'])
-        )
-        
-        keyboard = [
-            [InlineKeyboardButton(f"Toggle Task {i+1}", callback_data=f"complete_{i}")]
-            for i in range(len(final_tasks))
-        ]
-        keyboard.append([InlineKeyboardButton("Finish Day", callback_data="finish")])
-        
+        task_text = self.task_text(final_tasks, self.user_plans[user_id]['completed'])
         await query.edit_message_text(
             f"📋 Your Final Plan:\n\n{task_text}",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=self.task_keyboard(len(final_tasks))
         )
         return FINALIZING
     
+    @metrics.instrument_handler(BOT_NAME)
     async def finalize_plan(self, update: Update, context: CallbackContext) -> int:
         """Handle task completion toggles"""
         query = update.callback_query
@@ -199,26 +238,14 @@ class DailyTaskBot:
         self.user_plans[user_id]['completed'][task_idx] = not self.user_plans[user_id]['completed'][task_idx]
         
         # Update the message
-        task_text = "\n".join(
-            f"{'✅' if completed else '◻️'} {task}"
-            for task, completed in zip(
-                self.user_plans[user_id]['final_tasks'],
-                self.user_plans[user_id]['completed']
-            )
-        )
-        
-        keyboard = [
-            [InlineKeyboardButton(f"Toggle Task {i+1}", callback_data=f"complete_{i}")]
-            for i in range(len(self.user_plans[user_id]['final_tasks']))
-        ]
-        keyboard.append([InlineKeyboardButton("Finish Day", callback_data="finish")])
-        
+        task_text = self.task_text(self.user_plans[user_id]['final_tasks'], self.user_plans[user_id]['completed'])
         await query.edit_message_text(
             text=f"📋 Your Final Plan:\n\n{task_text}",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=self.task_keyboard(len(self.user_plans[user_id]['final_tasks']))
         )
         return FINALIZING
     
+    @metrics.instrument_handler(BOT_NAME)
     async def view_tasks(self, update: Update, context: CallbackContext):
         """View current tasks"""
         user_id = update.effective_user.id
@@ -226,24 +253,14 @@ class DailyTaskBot:
             tasks = self.user_plans[user_id]['final_tasks']
             completed = self.user_plans[user_id]['completed']
             
-            task_text = "\n".join(
-                f"{'✅' if comp else '◻️'} {task}"
-                for task, comp in zip(tasks, completed)
-            )
-            
-            keyboard = [
-                [InlineKeyboardButton(f"Toggle Task {i+1}", callback_data=f"complete_{i}")]
-                for i in range(len(tasks))
-            ]
-            keyboard.append([InlineKeyboardButton("Finish Day", callback_data="finish")])
-            
             await update.message.reply_text(
-                f"📋 Your Current Plan:\n\n{task_text}",
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                f"📋 Your Current Plan:\n\n{self.task_text(tasks, completed)}",
+                reply_markup=self.task_keyboard(len(tasks))
             )
         else:
             await update.message.reply_text("No active plan. Use /start to create one.")
     
+    @metrics.instrument_handler(BOT_NAME)
     async def cancel(self, update: Update, context: CallbackContext) -> int:
         """Cancel the current operation"""
         await update.message.reply_text("Operation cancelled.")
@@ -251,6 +268,9 @@ class DailyTaskBot:
     
     def run(self):
         """Run the bot"""
+        metrics.QUEUE_DEPTH.set_function(self.application.update_queue.qsize, bot=BOT_NAME, queue="updates")
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.user_plans), bot=BOT_NAME, queue="active_plans")
+        metrics.start_metrics_server(METRICS_PORT)
         self.application.run_polling()
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+import time
+import sqlite3
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Event codes stored in the log, kept as small integers
+SENT, TAKEN, SNOOZED, SKIPPED = 0, 1, 2, 3
+ACTIONS = {"taken": TAKEN, "snooze": SNOOZED, "skip": SKIPPED}
+
+
+class AdherenceStore:
+    """Append-only dose event log plus running per-medicine aggregates.
+
+    Every reminder sent and every button press is appended to dose_events;
+    the counters and streaks in adherence_stats are updated in the same
+    transaction, so reading a user's adherence never touches the log.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dose_events ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " chat_id TEXT NOT NULL,"
+                " reminder_id INTEGER NOT NULL,"
+                " dose_at INTEGER NOT NULL,"  # scheduled dose time, epoch seconds UTC
+                " action INTEGER NOT NULL,"
+                " at INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_dose_events_dose ON dose_events (reminder_id, dose_at)"
+            )
+            if "medicine" not in {row[1] for row in self._conn.execute("PRAGMA table_info(dose_events)")}:
+                # Set on SENT events, so a dose can be answered after its reminder row is gone
+                self._conn.execute("ALTER TABLE dose_events ADD COLUMN medicine TEXT")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS adherence_stats ("
+                " chat_id TEXT NOT NULL,"
+                " medicine TEXT NOT NULL,"
+                " sent INTEGER NOT NULL DEFAULT 0,"
+                " taken INTEGER NOT NULL DEFAULT 0,"
+                " skipped INTEGER NOT NULL DEFAULT 0,"
+                " snoozed INTEGER NOT NULL DEFAULT 0,"
+                " streak INTEGER NOT NULL DEFAULT 0,"
+                " best_streak INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (chat_id, medicine))"
+            )
+
+    def record_sent(self, chat_id, reminder_id: int, medicine: str, dose_at: int) -> None:
+        chat_id = str(chat_id)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO dose_events (chat_id, reminder_id, dose_at, action, at, medicine)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (chat_id, reminder_id, dose_at, SENT, int(time.time()), medicine),
+            )
+            self._conn.execute(
+                "INSERT INTO adherence_stats (chat_id, medicine, sent) VALUES (?, ?, 1)"
+                " ON CONFLICT(chat_id, medicine) DO UPDATE SET sent = sent + 1",
+                (chat_id, medicine),
+            )
+
+    def sent_medicine(self, chat_id, reminder_id: int, dose_at: int):
+        """Medicine of the dose sent to chat_id, or None if no such dose was sent to it"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT medicine FROM dose_events WHERE reminder_id = ? AND dose_at = ? AND action = ?"
+                " AND chat_id = ? AND medicine IS NOT NULL LIMIT 1",
+                (reminder_id, dose_at, SENT, str(chat_id)),
+            ).fetchone()
+        return row[0] if row else None
+
+    def record_response(self, chat_id, reminder_id: int, medicine: str, dose_at: int, action: int) -> bool:
+        """Log a button press; False if this dose was already answered as taken or skipped"""
+        chat_id = str(chat_id)
+        with self._lock, self._conn:
+            answered = self._conn.execute(
+                "SELECT 1 FROM dose_events WHERE reminder_id = ? AND dose_at = ? AND action IN (?, ?) LIMIT 1",
+                (reminder_id, dose_at, TAKEN, SKIPPED),
+            ).fetchone()
+            if answered:
+                return False
+            self._conn.execute(
+                "INSERT INTO dose_events (chat_id, reminder_id, dose_at, action, at) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, reminder_id, dose_at, action, int(time.time())),
+            )
+            if action == TAKEN:
+                update = ("taken = taken + 1, streak = streak + 1,"
+                          " best_streak = MAX(best_streak, streak + 1)")
+            elif action == SKIPPED:
+                update = "skipped = skipped + 1, streak = 0"
+            else:
+                update = "snoozed = snoozed + 1"
+            self._conn.execute(
+                "INSERT OR IGNORE INTO adherence_stats (chat_id, medicine) VALUES (?, ?)", (chat_id, medicine)
+            )
+            self._conn.execute(
+                f"UPDATE adherence_stats SET {update} WHERE chat_id = ? AND medicine = ?", (chat_id, medicine)
+            )
+            return True
+
+    def stats(self, chat_id):
+        """[(medicine, sent, taken, skipped, snoozed, streak, best_streak)] for a chat"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT medicine, sent, taken, skipped, snoozed, streak, best_streak FROM adherence_stats"
+                " WHERE chat_id = ? ORDER BY medicine",
+                (str(chat_id),),
+            ).fetchall()
+
+    def has_chat(self, chat_id) -> bool:
+        """Whether a chat has adherence counters; every logged dose has them"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM adherence_stats WHERE chat_id = ? LIMIT 1", (str(chat_id),)
+            ).fetchone() is not None
+
+    def delete_chat(self, chat_id) -> int:
+        """Drop a chat's counters and dose history; returns the dose events removed"""
+        chat_id = str(chat_id)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM adherence_stats WHERE chat_id = ?", (chat_id,))
+            return self._conn.execute("DELETE FROM dose_events WHERE chat_id = ?", (chat_id,)).rowcount
+
+    def _stream(self, columns: str, table: str, order: str, chat_id=None):
+        """Iterate a table on a separate connection, so a long export never holds the store lock"""
+        sql = f"SELECT {columns} FROM {table}"
+        params = ()
+        if chat_id is not None:
+            sql += " WHERE chat_id = ?"
+            params = (str(chat_id),)
+        conn = sqlite3.connect(self._path, timeout=30)
+        try:
+            yield from conn.execute(f"{sql} ORDER BY {order}", params)
+        finally:
+            conn.close()
+
+    def export_stats(self, chat_id=None):
+        """(chat_id, medicine, sent, taken, skipped, snoozed, streak, best_streak) rows"""
+        return self._stream("chat_id, medicine, sent, taken, skipped, snoozed, streak, best_streak",
+                            "adherence_stats", "chat_id, medicine", chat_id)
+
+    def export_events(self, chat_id=None):
+        """(chat_id, reminder_id, dose_at, action, at, medicine) rows, oldest first"""
+        return self._stream("chat_id, reminder_id, dose_at, action, at, medicine", "dose_events", "id", chat_id)
+
+    def import_stats(self, rows, batch_size: int = 5000) -> int:
+        """Upsert stats rows as exported; imported counters replace existing ones"""
+        return self._import(
+            "INSERT INTO adherence_stats (chat_id, medicine, sent, taken, skipped, snoozed, streak, best_streak)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(chat_id, medicine) DO UPDATE SET"
+            " sent = excluded.sent, taken = excluded.taken, skipped = excluded.skipped,"
+            " snoozed = excluded.snoozed, streak = excluded.streak, best_streak = excluded.best_streak",
+            rows, batch_size,
+        )
+
+    def import_events(self, rows, batch_size: int = 5000) -> int:
+        return self._import(
+            "INSERT INTO dose_events (chat_id, reminder_id, dose_at, action, at, medicine) VALUES (?, ?, ?, ?, ?, ?)",
+            rows, batch_size,
+        )
+
+    def _import(self, sql: str, rows, batch_size: int) -> int:
+        rows = iter(rows)
+        count = 0
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return count
+            with self._lock, self._conn:
+                self._conn.executemany(sql, batch)
+            count += len(batch)
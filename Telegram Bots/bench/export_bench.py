@@ -0,0 +1,141 @@
+"""Throughput benchmark for the streaming export and import (data_export.py).
+
+Writes a synthetic JSON-lines archive of roughly --size-mb, imports it into
+empty databases, then exports everything back out as JSON lines and as a
+ZIP. Reports MB/s, records/s and the process's peak RSS after each phase;
+peak RSS should stay flat as --size-mb grows.
+
+    python bench/export_bench.py --size-mb 2048
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BOTS_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BOTS_DIR)
+
+import data_export
+
+WORDS = ("haemoglobin", "platelets", "normal", "elevated", "glucose", "fasting", "lipid", "profile",
+         "cholesterol", "within", "range", "advised", "follow-up", "weeks", "mg/dL", "vitamin", "deficiency")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_records(rng, reports_per_chat: int, report_words: int):
+    """Endless stream of chats, each with a profile, reminders, reports and dose history"""
+    chat = 100000
+    reminder_id = 0
+    while True:
+        chat += 1
+        chat_id = str(chat)
+        yield {"type": "profile", "chat_id": chat_id, "timezone": "Asia/Kolkata",
+               "meal_times": {"morning": "08:30:00"}, "language": rng.choice(["en", "hi", "ta"])}
+        ids = []
+        for slot in ("morning", "night"):
+            reminder_id += 1
+            ids.append(reminder_id)
+            yield {"type": "reminder", "id": reminder_id, "chat_id": chat_id, "medicine": "Metformin",
+                   "dosage": "500mg", "message": "Take Metformin 500mg", "fire_at": "2026-01-01 03:00:00",
+                   "created_at": "2025-12-01 10:00:00", "slot": slot, "snooze_until": None, "snooze_dose": None}
+        for n in range(reports_per_chat):
+            yield {"type": "report", "id": n, "chat_id": chat_id, "file_name": f"record_{n}.jpg",
+                   "upload_time": "2025-12-01 10:00:00",
+                   "record_details": {"type": "Blood Test",
+                                      "key_findings": [" ".join(rng.choices(WORDS, k=12)) for _ in range(4)],
+                                      "summary": " ".join(rng.choices(WORDS, k=report_words))}}
+        yield {"type": "adherence", "chat_id": chat_id, "medicine": "Metformin", "sent": 60, "taken": 55,
+               "skipped": 2, "snoozed": 3, "streak": 9, "best_streak": 21}
+        for day in range(30):
+            for rid in ids:
+                yield {"type": "dose_event", "chat_id": chat_id, "reminder_id": rid,
+                       "dose_at": 1767236400 + day * 86400, "action": 1, "at": 1767236500 + day * 86400}
+
+
+def write_dataset(path: str, size_mb: float, seed: int) -> int:
+    rng = random.Random(seed)
+    limit = size_mb * 1024 * 1024
+    written = 0
+    records = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for record in synthetic_records(rng, reports_per_chat=20, report_words=120):
+            line = json.dumps(record) + "\n"
+            f.write(line)
+            written += len(line)
+            records += 1
+            if written >= limit and record["type"] == "dose_event":
+                break
+    return records
+
+
+def phase(name: str, size_bytes: int, records: int, start: float) -> dict:
+    elapsed = time.perf_counter() - start
+    result = {
+        "phase": name,
+        "seconds": round(elapsed, 2),
+        "mb_per_s": round(size_bytes / (1024 * 1024) / elapsed, 1),
+        "records_per_s": round(records / elapsed),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    print(f"{name:<14}{result['seconds']:>10}s{result['mb_per_s']:>10} MB/s"
+          f"{result['records_per_s']:>12} rec/s   peak RSS {result['peak_rss_mb']} MB")
+    return result
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=256, help="approximate size of the synthetic archive")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", help="directory for the databases and archives (default: a temp dir)")
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="export_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    print(f"Working directory: {workdir}")
+
+    source = os.path.join(workdir, "synthetic.jsonl")
+    start = time.perf_counter()
+    records = write_dataset(source, args.size_mb, args.seed)
+    size = os.path.getsize(source)
+    results = [phase("generate", size, records, start)]
+
+    db = os.path.join(workdir, "bench.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+    stores = data_export.open_stores(db, db, 16)
+
+    start = time.perf_counter()
+    counts = data_export.import_records(data_export.read_records(source), *stores, batch_size=args.batch_size)
+    results.append(phase("import", size, sum(counts.values()), start))
+
+    for fmt in data_export.FORMATS:
+        target = os.path.join(workdir, f"export.{fmt}")
+        start = time.perf_counter()
+        with open(target, "wb") as out:
+            counts = data_export.export(out, *stores, fmt=fmt)
+        results.append(phase(f"export {fmt}", size, sum(counts.values()), start))
+        results[-1]["output_mb"] = round(os.path.getsize(target) / (1024 * 1024), 1)
+
+    print(f"\nrecords: {json.dumps(counts)}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"size_mb": round(size / (1024 * 1024), 1), "counts": counts, "phases": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
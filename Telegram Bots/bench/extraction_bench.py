@@ -0,0 +1,191 @@
+"""Offline comparison of the document extraction backends (extraction.py).
+
+Runs a sample set of document photos through EasyOCR plus a text-only
+call, through a single multimodal call with the image, and through the
+"auto" policy, all against the local Gemini stand-in. Reports end-to-end
+latency, the CPU time this process spent per document (EasyOCR's torch
+threads included) and how much was uploaded per request.
+
+Samples come from --samples (a directory of JPG/PNG files), or are
+rendered as synthetic prescriptions at each of --sizes. The OCR and auto
+runs need easyocr and its downloaded models; without them they are
+reported as skipped.
+
+    python bench/extraction_bench.py --sizes 1280x960,4000x3000 --gemini-latency 900 --image-latency 1600
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BOTS_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BOTS_DIR)
+
+import prompts
+import extraction
+from extraction import DocumentType, Extractor, Photo
+from model_cache import ModelCache
+from fake_telegram import LatencyProfile
+from stub_gemini import StubGeminiServer
+from loadtest import percentile
+
+LINES = (
+    "Dr. A. Sharma MBBS MD  Reg No 45821", "City Care Clinic, MG Road", "Name: R. Kumar   Age: 54   Date: 12/03/2026",
+    "Rx", "Tab Metformin 500mg 1-0-1 after food x 30 days", "Tab Amlodipine 5mg 0-0-1 x 30 days",
+    "Cap Pantoprazole 40mg 1-0-0 before breakfast", "Syp Cetirizine 5ml at night x 5 days",
+    "Review after 4 weeks with fasting sugar report", "Signature",
+)
+
+
+def render_samples(sizes, per_size: int, seed: int) -> list:
+    """Synthetic prescription photos as (name, JPEG bytes)"""
+    import cv2
+    import numpy as np
+    rng = random.Random(seed)
+    samples = []
+    for width, height in sizes:
+        for n in range(per_size):
+            image = np.full((height, width, 3), 245, dtype=np.uint8)
+            scale = width / 1000
+            y = int(60 * scale)
+            for line in LINES:
+                cv2.putText(image, line, (int(40 * scale), y), cv2.FONT_HERSHEY_SIMPLEX, 0.8 * scale,
+                            (20, 20, 20), max(1, int(2 * scale)), cv2.LINE_AA)
+                y += int(rng.uniform(55, 75) * scale)
+            # Camera noise, so JPEG sizes look like real photos
+            noise = np.random.default_rng(seed + n).integers(0, 12, image.shape, dtype=np.uint8)
+            ok, encoded = cv2.imencode(".jpg", cv2.subtract(image, noise), [cv2.IMWRITE_JPEG_QUALITY, 85])
+            samples.append((f"prescription_{width}x{height}_{n}.jpg", encoded.tobytes()))
+    return samples
+
+
+def load_samples(directory: str) -> list:
+    return [(name, open(os.path.join(directory, name), "rb").read())
+            for name in sorted(os.listdir(directory)) if name.lower().endswith((".jpg", ".jpeg", ".png"))]
+
+
+def gemini_client(base_url: str):
+    """(prompt, image part or None) -> (response text, request bytes) against the stand-in"""
+    url = f"{base_url}/v1/models/{prompts.DEFAULT_MODEL}:generateContent?key=bench"
+
+    def generate(prompt: str, image=None):
+        parts = [{"text": prompt}] + ([{"inline_data": image}] if image else [])
+        body = json.dumps({"contents": [{"parts": parts}]}).encode()
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            reply = json.load(response)
+        return reply["candidates"][0]["content"]["parts"][0]["text"], len(body)
+    return generate
+
+
+def prescription_document(generate, uploads: list) -> DocumentType:
+    def from_text(text):
+        reply, sent = generate(prompts.PRESCRIPTION.render(format_hint="", text=prompts.compact_ocr(text)))
+        uploads.append(sent)
+        return reply
+
+    def from_image(data, mime_type):
+        image = {"mime_type": mime_type, "data": base64.b64encode(data).decode("ascii")}
+        reply, sent = generate(prompts.PRESCRIPTION_IMAGE.render(format_hint=""), image)
+        uploads.append(sent)
+        return "", reply
+    return DocumentType("prescription", " ", from_text, from_image)
+
+
+def ocr_readers():
+    """Warm EasyOCR reader cache, or (None, reason) when EasyOCR can't run here"""
+    try:
+        import easyocr
+        readers = ModelCache("bench", lambda langs: easyocr.Reader(list(langs), gpu=False),
+                             budget_mb=4096, idle_seconds=3600)
+        with readers.use(("en",)):
+            pass
+        return readers, None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def run_mode(mode: str, samples, readers, generate, queue_depth: int) -> dict:
+    from image_io import decode_image
+    uploads = []
+    document = prescription_document(generate, uploads)
+    extractor = Extractor("bench", mode, readers)
+    latencies, cpu, backends = [], [], {}
+    for name, data in samples:
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        # Decoding is part of the OCR path's cost; the multimodal path only needs it for the policy
+        photo = Photo(data, decode_image(data), extraction.mime_type(name.rsplit(".", 1)[-1]), ("en",))
+        result = extractor.extract(document, photo, queue_depth=queue_depth)
+        latencies.append(time.perf_counter() - wall_start)
+        cpu.append(time.process_time() - cpu_start)
+        backends[result.backend] = backends.get(result.backend, 0) + 1
+    return {
+        "mode": mode,
+        "documents": len(samples),
+        "p50_s": round(percentile(latencies, 50), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        "cpu_s_per_doc": round(sum(cpu) / len(cpu), 3),
+        "upload_kb_per_doc": round(sum(uploads) / len(samples) / 1024, 1),
+        "backends": backends,
+    }
+
+
+def parse_size(text: str):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", help="directory of JPG/PNG documents (default: synthetic prescriptions)")
+    parser.add_argument("--sizes", default="1280x960,4000x3000", help="synthetic photo sizes, comma-separated")
+    parser.add_argument("--per-size", type=int, default=5)
+    parser.add_argument("--gemini-latency", type=float, default=900, help="median ms for text-only calls")
+    parser.add_argument("--image-latency", type=float, default=1600, help="median ms for calls with an image")
+    parser.add_argument("--gemini-sigma", type=float, default=0.25)
+    parser.add_argument("--queue-depth", type=int, default=0, help="upload queue depth the auto policy sees")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    samples = load_samples(args.samples) if args.samples else render_samples(
+        [parse_size(size) for size in args.sizes.split(",")], args.per_size, args.seed)
+    print(f"{len(samples)} samples, {sum(len(data) for _, data in samples) / len(samples) / 1024:.0f} KB average")
+
+    gemini = StubGeminiServer(
+        profile=LatencyProfile(args.gemini_latency, args.gemini_sigma),
+        image_profile=LatencyProfile(args.image_latency, args.gemini_sigma),
+    ).start()
+    generate = gemini_client(gemini.base_url)
+    readers, reason = ocr_readers()
+
+    results = []
+    print(f"\n{'mode':<12}{'p50':>9}{'p95':>9}{'CPU/doc':>10}{'upload/doc':>13}   backends used")
+    try:
+        for mode in (extraction.OCR, extraction.MULTIMODAL, extraction.AUTO):
+            if readers is None and mode != extraction.MULTIMODAL:
+                print(f"{mode:<12}skipped ({reason})")
+                results.append({"mode": mode, "skipped": reason})
+                continue
+            result = run_mode(mode, samples, readers, generate, args.queue_depth)
+            results.append(result)
+            print(f"{mode:<12}{result['p50_s']:>8}s{result['p95_s']:>8}s{result['cpu_s_per_doc']:>9}s"
+                  f"{result['upload_kb_per_doc']:>10} KB   {result['backends']}")
+    finally:
+        gemini.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"samples": len(samples), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Minimal local stand-in for the Telegram Bot API.
+
+Answers every bot method with a plausible result so python-telegram-bot and
+pyTelegramBotAPI handlers can run end to end without network access.
+"""
+import json
+import time
+import zlib
+import struct
+import random
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_png(width: int = 640, height: int = 480) -> bytes:
+    """Build a small greyscale PNG with a few dark bars, using only the stdlib"""
+    rows = []
+    for y in range(height):
+        shade = 30 if (y // 24) % 3 == 1 and 40 < y < height - 40 else 235
+        rows.append(b"\x00" + bytes([shade]) * width)
+    raw = b"".join(rows)
+
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+class LatencyProfile:
+    """Log-normal latency around a median, plus a random error rate"""
+
+    def __init__(self, median_ms: float = 0, sigma: float = 0.0, error_rate: float = 0.0, error_status: int = 500):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def delay(self):
+        if self.median_ms <= 0:
+            return
+        factor = random.lognormvariate(0, self.sigma) if self.sigma > 0 else 1.0
+        time.sleep(self.median_ms * factor / 1000.0)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class FakeTelegramServer:
+    """Threaded HTTP server implementing the subset of the Bot API the bots use"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, profile: LatencyProfile = None, photo: bytes = None):
+        self.profile = profile or LatencyProfile()
+        self.photo = photo or make_png()
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _record(self, method: str):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self._message_id += 1
+            return self._message_id
+
+    def _result(self, method: str, params: dict, message_id: int):
+        chat_id = params.get("chat_id", 0)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            chat_id = 0
+        user = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": user,
+            "text": params.get("text", ""),
+        }
+        if method == "getMe":
+            return {**user, "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+        if method == "getFile":
+            return {"file_id": params.get("file_id", "file"), "file_unique_id": "u1", "file_size": len(self.photo), "file_path": "photos/file_0.png"}
+        if method == "getUpdates":
+            return []
+        if method in ("sendMessage", "editMessageText", "sendVoice", "sendDocument", "sendPhoto", "editMessageReplyMarkup"):
+            return message
+        return True
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _params(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                params = {k: v[0] for k, v in parse_qs(self.path.partition("?")[2]).items()}
+                content_type = self.headers.get("Content-Type", "")
+                try:
+                    if "application/json" in content_type and body:
+                        params.update(json.loads(body))
+                    elif "application/x-www-form-urlencoded" in content_type and body:
+                        params.update({k: v[0] for k, v in parse_qs(body.decode()).items()})
+                except ValueError:
+                    pass
+                return params
+
+            def _reply(self, status: int, body: bytes, content_type: str = "application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                params = self._params()
+                path = self.path.partition("?")[0]
+                server.profile.delay()
+                if path.startswith("/file/"):
+                    server._record("downloadFile")
+                    self._reply(200, server.photo, "image/png")
+                    return
+                method = path.rstrip("/").rsplit("/", 1)[-1]
+                message_id = server._record(method)
+                if server.profile.should_fail():
+                    payload = {"ok": False, "error_code": server.profile.error_status, "description": "Injected error"}
+                    self._reply(server.profile.error_status, json.dumps(payload).encode())
+                    return
+                payload = {"ok": True, "result": server._result(method, params, message_id)}
+                self._reply(200, json.dumps(payload).encode())
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
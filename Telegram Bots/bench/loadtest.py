@@ -0,0 +1,341 @@
+"""Offline load test for the Telegram bots.
+
+Starts a fake Bot API server and a stub Gemini endpoint, imports the bots
+pointed at them, and replays a scripted conversation for N simulated users.
+Reports p50/p95/p99 handler latency, throughput and peak Python memory.
+A step's latency runs until its queued OCR/Gemini job and any non-blocking
+handler task it started have finished, and where a bot's scripts make a
+fixed number of Gemini calls the stub's count is checked against it.
+
+    python bench/loadtest.py --bot all --users 50 --gemini-latency 800
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import importlib
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BOTS_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BOTS_DIR)
+
+from fake_telegram import FakeTelegramServer, LatencyProfile
+from stub_gemini import StubGeminiServer
+
+TASKS = "8:00 AM - Morning walk\n10:00 AM - Work project\n12:00 PM - Healthy lunch\n6:00 PM - Gym"
+PRESCRIPTION_TEXT = "Paracetamol 500mg tablet twice daily after food for 5 days"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+class UpdateFactory:
+    """Builds raw Bot API update dicts for simulated users"""
+
+    def __init__(self):
+        self.update_id = 0
+        self.message_id = 0
+
+    def _ids(self):
+        self.update_id += 1
+        self.message_id += 1
+        return self.update_id, self.message_id
+
+    @staticmethod
+    def _user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+    def message(self, user_id, text=None, photo=False, caption=None):
+        update_id, message_id = self._ids()
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+            "from": self._user(user_id),
+        }
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if photo:
+            message["photo"] = [{"file_id": f"photo{message_id}", "file_unique_id": f"u{message_id}", "width": 640, "height": 480}]
+            if caption:
+                message["caption"] = caption
+        return {"update_id": update_id, "message": message}
+
+    def callback(self, user_id, data):
+        update_id, message_id = self._ids()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "text": "plan",
+                },
+            },
+        }
+
+
+def daily_script(factory, user_id):
+    return [
+        ("start", factory.message(user_id, "/start")),
+        ("receive_tasks", factory.message(user_id, TASKS)),
+        ("toggle", factory.callback(user_id, "toggle_0")),
+        ("done_review", factory.callback(user_id, "done_review")),
+        ("complete", factory.callback(user_id, "complete_0")),
+        ("finish", factory.callback(user_id, "finish")),
+    ]
+
+
+def diet_script(factory, user_id, with_photos):
+    steps = [
+        ("start", factory.message(user_id, "/start")),
+        ("name", factory.message(user_id, f"User{user_id}")),
+        ("diet_type", factory.message(user_id, "Vegetarian")),
+        ("meal_prefs", factory.message(user_id, "Dal, Paneer, Salad")),
+        ("spice_level", factory.message(user_id, "Medium")),
+        ("allergies", factory.message(user_id, "None")),
+        ("chronic_disease", factory.message(user_id, "Diabetes")),
+    ]
+    if with_photos:
+        steps.append(("handle_photo", factory.message(user_id, photo=True)))
+    else:
+        steps.append(("done", factory.message(user_id, "/done")))
+    return steps
+
+
+def med_script(factory, user_id, with_photos):
+    steps = [
+        ("start", factory.message(user_id, "/start")),
+        ("prescription_text", factory.message(user_id, PRESCRIPTION_TEXT)),
+        ("view_medical", factory.message(user_id, "/view_medical")),
+        ("remove_pres", factory.message(user_id, "/remove_pres")),
+        ("remove_selected", factory.message(user_id, "1")),
+    ]
+    if with_photos:
+        steps.insert(2, ("medical_record_photo", factory.message(user_id, photo=True)))
+    return steps
+
+
+async def settled(application, update_id):
+    """Wait for the non-blocking (block=False) handler tasks started for an update"""
+    # dietBot's LedgerApplication counts them per update; other applications block
+    open_tasks = getattr(application, "_open_tasks", {})
+    while update_id in open_tasks:
+        await asyncio.sleep(0.005)
+
+
+async def run_ptb(application, scripts, concurrency, upload_queue=None):
+    from telegram import Update
+
+    await application.initialize()
+    latencies = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_user(script):
+        async with semaphore:
+            for step, data in script:
+                update = Update.de_json(data, application.bot)
+                start = time.perf_counter()
+                await application.process_update(update)
+                await settled(application, update.update_id)
+                latencies.setdefault(step, []).append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_user(script) for script in scripts))
+    # Anything still running (a task no update tracks, a job nobody awaits) is part of the load too
+    others = asyncio.all_tasks() - {asyncio.current_task()}
+    await asyncio.gather(*others, return_exceptions=True)
+    if upload_queue is not None:
+        await asyncio.to_thread(upload_queue.join)
+    elapsed = time.perf_counter() - started
+    await application.shutdown()
+    return latencies, elapsed
+
+
+def run_daily(args, factory):
+    DailyBot = importlib.import_module("DailyBot")
+    bot = DailyBot.DailyTaskBot()
+    scripts = [daily_script(factory, 10_000 + i) for i in range(args.users)]
+    latencies, elapsed = asyncio.run(run_ptb(bot.application, scripts, args.concurrency))
+    # No exact count: the suggestion library learns from each finished day, so how many
+    # users still need Gemini depends on how the conversations interleave
+    return latencies, elapsed, None
+
+
+def run_diet(args, factory):
+    dietBot = importlib.import_module("dietBot")
+    application = dietBot.build_application()
+    dietBot.upload_queue.start()
+    scripts = [diet_script(factory, 20_000 + i, args.with_photos) for i in range(args.users)]
+    latencies, elapsed = asyncio.run(run_ptb(application, scripts, args.concurrency, dietBot.upload_queue))
+    # One diet plan per user; ingredient photos may go to Gemini once or twice depending on the extractor
+    return latencies, elapsed, None if args.with_photos else args.users
+
+
+def run_med(args, factory):
+    import telebot
+
+    med_remind = importlib.import_module("med_remind")
+    med_remind.upload_queue.start()
+    scripts = [med_script(factory, 30_000 + i, args.with_photos) for i in range(args.users)]
+    latencies = {}
+
+    def run_user(script):
+        for step, data in script:
+            update = telebot.types.Update.de_json(data)
+            chat_id = update.message.chat.id
+            start = time.perf_counter()
+            med_remind.bot.process_new_updates([update])
+            med_remind.upload_queue.join(chat_id)
+            latencies.setdefault(step, []).append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    # The production bot polls with threaded=False, so concurrency defaults to 1
+    with ThreadPoolExecutor(max_workers=args.med_concurrency) as pool:
+        list(pool.map(run_user, scripts))
+    med_remind.upload_queue.join()
+    elapsed = time.perf_counter() - started
+
+    # The typed prescription goes to Gemini only if the local sig parse is unsure of it
+    parse = med_remind.sig_parser.parse_prescription(PRESCRIPTION_TEXT, lexicon=med_remind.drug_names)
+    per_user = 0 if parse["medicines"] and parse["confidence"] >= med_remind.LOCAL_PARSE_MIN_CONFIDENCE else 1
+    return latencies, elapsed, None if args.with_photos else per_user * args.users
+
+
+RUNNERS = {"daily": run_daily, "diet": run_diet, "med": run_med}
+
+
+def summarize(name, latencies, elapsed, peak_bytes):
+    all_latencies = [v for values in latencies.values() for v in values]
+    summary = {
+        "bot": name,
+        "updates": len(all_latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ups": round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        "peak_python_mb": round(peak_bytes / 1_048_576, 2),
+        "p50_ms": round(percentile(all_latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(all_latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(all_latencies, 99) * 1000, 2),
+        "steps": {},
+    }
+    for step, values in latencies.items():
+        summary["steps"][step] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n== {summary['bot']} ==")
+    print(
+        f"updates={summary['updates']} elapsed={summary['elapsed_s']}s "
+        f"throughput={summary['throughput_ups']} upd/s peak_mem={summary['peak_python_mb']} MB"
+    )
+    print(f"latency p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms")
+    print(f"{'step':<24}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for step, stats in summary["steps"].items():
+        print(f"{step:<24}{stats['count']:>8}{stats['p50_ms']:>12}{stats['p95_ms']:>12}{stats['p99_ms']:>12}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the Telegram bots")
+    parser.add_argument("--bot", choices=["daily", "diet", "med", "all"], default="all")
+    parser.add_argument("--users", type=int, default=20, help="simulated users per bot")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent users for the async bots")
+    parser.add_argument("--med-concurrency", type=int, default=1, help="worker threads feeding med_remind")
+    parser.add_argument("--with-photos", action="store_true", help="include photo uploads (runs EasyOCR)")
+    parser.add_argument("--gemini-latency", type=float, default=500, help="median Gemini latency in ms")
+    parser.add_argument("--gemini-sigma", type=float, default=0.3, help="log-normal spread of Gemini latency")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-error-status", type=int, default=503)
+    parser.add_argument("--telegram-latency", type=float, default=20, help="median Bot API latency in ms")
+    parser.add_argument("--telegram-sigma", type=float, default=0.2)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    telegram = FakeTelegramServer(profile=LatencyProfile(
+        args.telegram_latency, args.telegram_sigma, args.telegram_error_rate, 500
+    )).start()
+    gemini = StubGeminiServer(profile=LatencyProfile(
+        args.gemini_latency, args.gemini_sigma, args.gemini_error_rate, args.gemini_error_status
+    )).start()
+
+    os.environ.update({
+        "TELEGRAM_API_BASE": telegram.base_url,
+        "GEMINI_API_BASE": gemini.base_url,
+        "METRICS_PORT_MED": "0",
+        "METRICS_PORT_DIET": "0",
+        "METRICS_PORT_DAILY": "0",
+    })
+    for prefix in ("TELEGRAM_BOT_TOKEN", "GEMINI_API_KEY"):
+        for suffix in ("MED", "DIET", "DAILY"):
+            os.environ.setdefault(f"{prefix}_{suffix}", "123456:LOADTEST" if prefix.startswith("TELEGRAM") else "loadtest")
+
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    # The bots write their data files to the working directory
+    workdir = tempfile.mkdtemp(prefix="bot-loadtest-")
+    os.chdir(workdir)
+    print(f"Working directory: {workdir}")
+
+    bots = list(RUNNERS) if args.bot == "all" else [args.bot]
+    factory = UpdateFactory()
+    results = []
+    try:
+        for name in bots:
+            gemini_calls_before = gemini.calls
+            tracemalloc.start()
+            latencies, elapsed, expected_calls = RUNNERS[name](args, factory)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            summary = summarize(name, latencies, elapsed, peak)
+            summary["gemini_calls"] = gemini.calls - gemini_calls_before
+            summary["expected_gemini_calls"] = expected_calls
+            print_summary(summary)
+            results.append(summary)
+            # Injected errors are retried, so only an error-free run has an exact count
+            if expected_calls is not None and not args.gemini_error_rate and summary["gemini_calls"] != expected_calls:
+                raise AssertionError(
+                    f"{name}: stub Gemini answered {summary['gemini_calls']} calls, expected {expected_calls}"
+                )
+    finally:
+        telegram.stop()
+        gemini.stop()
+
+    print(f"\nBot API calls: {json.dumps(telegram.calls, sort_keys=True)}")
+    print(f"Gemini calls: {gemini.calls} (errors injected: {gemini.errors})")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""Microbenchmarks for the bots' hot pure functions, with regression tracking.
+
+Each case runs on synthetic inputs at a realistic size and, with
+--tier extreme, at the sizes we want to survive (20 KB diet plans, 10k
+users, 1M stored reminders). Results are the best and median seconds per
+call over --repeat runs. --save-baseline records them; later runs compare
+their best times against it and exit non-zero when a case got slower by
+more than --threshold. Baselines are only comparable on the same machine,
+so keep one per machine rather than committing it.
+
+Cases whose bot can't be imported (missing telegram / telebot / easyocr)
+are reported as skipped; the store-level cases underneath
+set_medicine_reminders and clean_old_reminders always run.
+
+    python bench/microbench.py --tier all --save-baseline
+    python bench/microbench.py --tier all --threshold 0.15
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import tempfile
+import importlib
+from datetime import timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BOTS_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BOTS_DIR)
+
+from reminder_store import ReminderStore, utc_now, TIME_FORMAT
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "microbench_baseline.json")
+TIERS = ("realistic", "extreme")
+# Per-call loops for fast cases are sized so one timed run lasts at least this long
+MIN_RUN_SECONDS = 0.2
+MEDICINES = ("Metformin", "Amlodipine", "Atorvastatin", "Paracetamol", "Pantoprazole", "Cetirizine",
+             "Losartan", "Azithromycin", "Levothyroxine", "Vitamin D3")
+FREQUENCIES = ("once daily", "twice daily", "thrice daily", "at night", "1-0-1", "as needed")
+# Same defaults as med_remind.MEAL_TIMES
+MEAL_TIMES = {"morning": "08:00:00", "afternoon": "13:00:00", "night": "20:00:00", "bedtime": "22:00:00"}
+FOODS = ("oats", "moong dal", "brown rice", "paneer", "spinach", "curd", "chickpeas", "ragi", "almonds", "tofu")
+
+CASES = []
+
+
+def case(name: str, sizes: dict):
+    """Register a benchmark; prepare(size, workdir) returns (setup or None, run)"""
+    def register(prepare):
+        CASES.append((name, sizes, prepare))
+        return prepare
+    return register
+
+
+def import_bot(module: str):
+    """Import a bot module from a scratch working directory, as bench/loadtest.py does"""
+    for prefix in ("TELEGRAM_BOT_TOKEN", "GEMINI_API_KEY"):
+        for suffix in ("MED", "DIET", "DAILY"):
+            os.environ.setdefault(f"{prefix}_{suffix}", "123456:BENCH" if prefix.startswith("TELEGRAM") else "bench")
+    return importlib.import_module(module)
+
+
+# Synthetic inputs
+
+def diet_plan_text(size_bytes: int, rng) -> str:
+    """A plan in the layout the DIET_PLAN prompt asks Gemini for, padded to about size_bytes"""
+    per_section = 3
+    while True:
+        parts = ["**Overview:** A balanced vegetarian plan with steady carbohydrates and plenty of fibre.\n"]
+        for meal in ("Breakfast", "Lunch", "Dinner"):
+            parts.append(f"**{meal}:**\n**Meal Name:** {rng.choice(FOODS).title()} bowl\n**Ingredients:**\n")
+            parts.extend(f"- {rng.randint(1, 200)} g {rng.choice(FOODS)}\n" for _ in range(per_section))
+            parts.append("**Instructions:**\n")
+            parts.extend(f"{i}. Cook the {rng.choice(FOODS)} over low heat for {rng.randint(2, 20)} minutes.\n"
+                         for i in range(1, per_section + 1))
+        parts.append("**Snacks:**\n")
+        parts.extend(f"* A handful of roasted {rng.choice(FOODS)}\n" for _ in range(per_section))
+        parts.append("**Important Notes:**\n")
+        parts.extend(f"* Keep portions of {rng.choice(FOODS)} moderate.\n" for _ in range(per_section))
+        text = "".join(parts)
+        if len(text.encode("utf-8")) >= size_bytes:
+            return text
+        per_section = max(per_section + 1, int(per_section * size_bytes / len(text)))
+
+
+def prescription(rng, medicines: int = 5) -> dict:
+    return {"medicines": [
+        {"name": name, "dosage": f"{rng.choice((250, 500, 650))}mg", "frequency": rng.choice(FREQUENCIES)}
+        for name in rng.sample(MEDICINES, medicines)
+    ]}
+
+
+def reminder_rows(users: int, reminders: int, rng, old_share: float = 0.1):
+    """EXPORT_COLUMNS rows: daily reminders, plus one-shot reminders from before the cleanup cutoff"""
+    old = (utc_now() - timedelta(days=45)).strftime(TIME_FORMAT)
+    recent = utc_now().strftime(TIME_FORMAT)
+    for n in range(reminders):
+        chat_id = str(100000 + n % users)
+        medicine = MEDICINES[n // users % len(MEDICINES)]
+        if rng.random() < old_share:
+            yield (n, chat_id, medicine, "500mg", f"Take {medicine} 500mg", old, old, None, None, None)
+        else:
+            slot = ("morning", "afternoon", "night")[n % 3]
+            yield (n, chat_id, medicine, "500mg", f"Take {medicine} 500mg", recent, recent, slot, None, None)
+
+
+def seeded_store(workdir: str, users: int, reminders: int) -> str:
+    """Path to a reminder database holding `reminders` rows across `users` chats, built once per size"""
+    path = os.path.join(workdir, f"reminders_{users}_{reminders}.db")
+    if not os.path.exists(path):
+        print(f"  seeding {reminders:,} reminders for {users:,} users...", flush=True)
+        open_store(path).import_rows(reminder_rows(users, reminders, random.Random(users)), batch_size=20000)
+    return path
+
+
+def open_store(path: str) -> ReminderStore:
+    return ReminderStore(path, default_meal_times=MEAL_TIMES, default_timezone="UTC")
+
+
+def medical_records(users: int, rng) -> list:
+    return [{
+        "chat_id": str(100000 + n),
+        "medical_reports": [{
+            "file_name": f"record_{r}.jpg",
+            "upload_time": "2026-01-01 10:00:00",
+            "record_details": {"type": "Blood Test",
+                               "key_findings": [f"{rng.choice(FOODS)} within range" for _ in range(4)],
+                               "summary": " ".join(rng.choices(FOODS, k=40))},
+        } for r in range(rng.randint(1, 4))],
+    } for n in range(users)]
+
+
+# Cases
+
+@case("DietPlanParser.parse_diet_plan", {"realistic": 2_000, "extreme": 20_000})
+def bench_parse_diet_plan(size, workdir):
+    parser = import_bot("dietBot").DietPlanParser
+    text = diet_plan_text(size, random.Random(size))
+    return None, lambda: parser.parse_diet_plan(text)
+
+
+@case("DietPlanParser.format_diet_plan_message", {"realistic": 2_000, "extreme": 20_000})
+def bench_format_diet_plan(size, workdir):
+    parser = import_bot("dietBot").DietPlanParser
+    plan = parser.parse_diet_plan(diet_plan_text(size, random.Random(size)))
+    return None, lambda: parser.format_diet_plan_message(plan)
+
+
+@case("DailyTaskBot keyboards", {"realistic": 10, "extreme": 100})
+def bench_daily_keyboards(size, workdir):
+    bot = import_bot("DailyBot").DailyTaskBot
+    tasks = [f"{8 + n % 12}:00 - Task {n}" for n in range(size)]
+    completed = [n % 2 == 0 for n in range(size)]
+    suggestions = ["Drink a glass of water", "Take a 10 minute walk", "Stretch for 5 minutes"]
+
+    def run():
+        bot.suggestion_keyboard(suggestions, [0, 2])
+        bot.task_text(tasks, completed)
+        bot.task_keyboard(len(tasks))
+    return None, run
+
+
+@case("SuggestionLibrary.search", {"realistic": 0, "extreme": 2_000})
+def bench_suggestion_search(size, workdir):
+    from suggestion_library import SuggestionLibrary, load_corpus
+    library = SuggestionLibrary(os.path.join(workdir, f"suggestions_{size}.db"), max_learned=size)
+    rng = random.Random(size)
+    for _ in range(size - len(library) + len(load_corpus())):
+        library.learn([f"{rng.choice(FOODS)} {rng.randrange(10**6)}", rng.choice(MEDICINES)],
+                      [f"Learned tip {rng.randrange(10**9)}"])
+    tasks = ["8:00 AM - Morning walk", "10:00 AM - Work project", "12:00 PM - Healthy lunch", "6:00 PM - Gym"]
+    return None, lambda: library.search(tasks, min_similarity=0.35)
+
+
+@case("InteractionIndex.check", {"realistic": 10, "extreme": 100})
+def bench_interaction_check(size, workdir):
+    import drug_interactions
+    index = drug_interactions.load_index()
+    rng = random.Random(size)
+    active = [rng.choice(MEDICINES) for _ in range(size)]
+    return None, lambda: index.check(["Warfarin", "Combiflam 400", "Thyronorm 50"], active)
+
+
+@case("ReminderStore.replace_medicine", {"realistic": (1_000, 10_000), "extreme": (10_000, 1_000_000)})
+def bench_replace_medicine(size, workdir):
+    users, reminders = size
+    store = open_store(seeded_store(workdir, users, reminders))
+    rng = random.Random(7)
+    return None, lambda: store.replace_medicine(
+        str(100000 + rng.randrange(users)), "Metformin", "500mg", "Take Metformin 500mg", ["morning", "night"]
+    )
+
+
+@case("ReminderStore.delete_older_than", {"realistic": (1_000, 10_000), "extreme": (10_000, 1_000_000)})
+def bench_delete_older_than(size, workdir):
+    users, reminders = size
+    store = open_store(seeded_store(workdir, users, reminders))
+    # The deleted one-shot reminders are put back before every run
+    old = [row for row in reminder_rows(users, reminders, random.Random(users)) if row[7] is None]
+    cutoff = utc_now() - timedelta(days=30)
+    return lambda: store.import_rows(old), lambda: store.delete_older_than(cutoff)
+
+
+@case("set_medicine_reminders", {"realistic": (1_000, 10_000), "extreme": (10_000, 1_000_000)})
+def bench_set_medicine_reminders(size, workdir):
+    users, reminders = size
+    med_remind = import_bot("med_remind")
+    med_remind.reminder_store = open_store(seeded_store(workdir, users, reminders))
+    rng = random.Random(7)
+    data = prescription(rng)
+    return None, lambda: med_remind.set_medicine_reminders(data, 100000 + rng.randrange(users))
+
+
+@case("clean_old_reminders", {"realistic": (1_000, 10_000), "extreme": (10_000, 1_000_000)})
+def bench_clean_old_reminders(size, workdir):
+    users, reminders = size
+    med_remind = import_bot("med_remind")
+    store = med_remind.reminder_store = open_store(seeded_store(workdir, users, reminders))
+    old = [row for row in reminder_rows(users, reminders, random.Random(users)) if row[7] is None]
+    return lambda: store.import_rows(old), med_remind.clean_old_reminders
+
+
+@case("save_json_data", {"realistic": 1_000, "extreme": 10_000})
+def bench_save_json_data(size, workdir):
+    med_remind = import_bot("med_remind")
+    records = medical_records(size, random.Random(size))
+    return None, lambda: med_remind.save_json_data(records, med_remind.MEDICAL_RECORDS_FILE)
+
+
+@case("load_json_data", {"realistic": 1_000, "extreme": 10_000})
+def bench_load_json_data(size, workdir):
+    med_remind = import_bot("med_remind")
+    path = os.path.join(workdir, f"records_{size}.json")
+    with open(path, "w") as f:
+        json.dump(medical_records(size, random.Random(size)), f, indent=4)
+    return None, lambda: med_remind.load_json_data(path)
+
+
+# Harness
+
+def measure(setup, run, repeat: int) -> list:
+    """Seconds per call for each of `repeat` timed runs"""
+    number = 1
+    if setup is None:
+        # Loop fast calls so timer resolution doesn't dominate
+        start = time.perf_counter()
+        run()
+        once = time.perf_counter() - start
+        number = max(1, int(MIN_RUN_SECONDS / max(once, 1e-9)))
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        timings.append((time.perf_counter() - start) / number)
+    return timings
+
+
+def run_cases(tiers, only, repeat: int, workdir: str) -> dict:
+    results = {}
+    for name, sizes, prepare in CASES:
+        if only and not any(pattern.lower() in name.lower() for pattern in only):
+            continue
+        for tier in tiers:
+            key = f"{name} [{tier}]"
+            try:
+                setup, run = prepare(sizes[tier], workdir)
+            except ImportError as e:
+                results[key] = {"skipped": str(e)}
+                print(f"{key:<58}skipped ({e})")
+                continue
+            timings = measure(setup, run, repeat)
+            results[key] = {"size": sizes[tier], "best": min(timings), "median": statistics.median(timings)}
+            print(f"{key:<58}{format_seconds(results[key]['best']):>12}{format_seconds(results[key]['median']):>12}")
+    return results
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Cases whose best time is more than threshold slower than the baseline's"""
+    regressions = []
+    print(f"\n{'case':<58}{'baseline':>12}{'now':>12}{'change':>10}")
+    for key, result in results.items():
+        before = baseline.get("results", {}).get(key)
+        if "best" not in result or not before or "best" not in before:
+            continue
+        change = result["best"] / before["best"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{key:<58}{format_seconds(before['best']):>12}{format_seconds(result['best']):>12}{change:>+10.1%}{flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def machine() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu": platform.processor(),
+            "cpus": os.cpu_count()}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tier", choices=TIERS + ("all",), default="realistic")
+    parser.add_argument("--only", action="append", help="run cases whose name contains this (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="record these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--workdir", help="directory for seeded databases, reused between runs (default: a temp dir)")
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for option in ("baseline", "json"):
+        if getattr(args, option):
+            setattr(args, option, os.path.abspath(getattr(args, option)))
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="microbench_"))
+    os.makedirs(workdir, exist_ok=True)
+    # The bots create their data files in the working directory on import
+    os.chdir(workdir)
+    print(f"Working directory: {workdir}")
+
+    tiers = TIERS if args.tier == "all" else (args.tier,)
+    print(f"\n{'case':<58}{'best':>12}{'median':>12}")
+    results = run_cases(tiers, args.only, args.repeat, workdir)
+    report = {"machine": machine(), "created": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != report["machine"]:
+            print(f"\nWarning: baseline was recorded on {baseline.get('machine')}; timings may not be comparable")
+        regressions = compare(results, baseline, args.threshold)
+    elif not args.save_baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                # Keep cases (or tiers) that weren't run this time
+                report["results"] = {**json.load(f).get("results", {}), **results}
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
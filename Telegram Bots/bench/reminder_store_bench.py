@@ -0,0 +1,169 @@
+"""Memory and scan-time comparison of ReminderStore's SQLite queries with dicts.
+
+The baseline is the original in-memory model: a list of reminder dicts
+with TIME_FORMAT strings, where each poll parses every "time" with
+strptime to find the due window and each cleanup parses them again to find
+expired one-shot reminders. The same rows are imported into a
+ReminderStore and queried the way the bot does: due() for the poll, and
+the range query delete_older_than() runs for the cleanup (counted rather
+than deleted, so every repeat sees the same rows). Memory is what
+tracemalloc sees allocated for the dicts, against the store's size on disk.
+
+    python bench/reminder_store_bench.py --rows 100000,1000000
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BOTS_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BOTS_DIR)
+
+from reminder_store import ReminderStore, TIME_FORMAT
+
+MEDICINES = ("Metformin", "Amlodipine", "Atorvastatin", "Paracetamol", "Pantoprazole", "Cetirizine",
+             "Losartan", "Azithromycin", "Levothyroxine", "Vitamin D3")
+DOSAGES = ("250mg", "500mg", "650mg", "1 tablet", "5ml")
+SLOTS = ("morning", "afternoon", "night", "bedtime")
+NOW = datetime(2026, 6, 1, 8, 0, 0)
+PARTITIONS = 16
+
+
+def reminder_rows(count: int, users: int, rng):
+    """ReminderStore.EXPORT_COLUMNS rows, fire times spread over the last 60 days and the next day;
+    one in ten is a one-shot reminder"""
+    for n in range(count):
+        medicine = MEDICINES[rng.randrange(len(MEDICINES))]
+        dosage = DOSAGES[rng.randrange(len(DOSAGES))]
+        one_shot = rng.random() < 0.1
+        fire_at = NOW + timedelta(seconds=rng.randrange(-60 * 86400 if one_shot else -60, 86400))
+        created_at = fire_at - timedelta(days=rng.randrange(1, 30))
+        yield (n + 1, str(100000 + rng.randrange(users)), medicine, dosage, f"Take {medicine} {dosage}",
+               fire_at.strftime(TIME_FORMAT), created_at.strftime(TIME_FORMAT),
+               None if one_shot else SLOTS[n % len(SLOTS)], None, None, None)
+
+
+def as_dict(row) -> dict:
+    reminder_id, chat_id, medicine, dosage, message, fire_at, created_at, slot = row[:8]
+    return {"id": reminder_id, "chat_id": chat_id, "medicine": medicine, "dosage": dosage,
+            "message": message, "time": fire_at, "created_at": created_at, "slot": slot}
+
+
+def dict_due(reminders, since, until):
+    return [r for r in reminders if since <= datetime.strptime(r["time"], TIME_FORMAT) <= until]
+
+
+def dict_older_than(reminders, cutoff):
+    return [r for r in reminders if r["slot"] is None and datetime.strptime(r["time"], TIME_FORMAT) < cutoff]
+
+
+def store_older_than(conn, cutoff):
+    """The rows ReminderStore.delete_older_than(cutoff) would remove"""
+    return conn.execute(
+        "SELECT COUNT(*) FROM reminders WHERE slot IS NULL AND fire_at < ?", (cutoff.strftime(TIME_FORMAT),)
+    ).fetchone()[0]
+
+
+def measured(build):
+    """(result, seconds, bytes allocated) for building one model"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, seconds, allocated
+
+
+def best_of(repeat: int, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def disk_bytes(path: str) -> int:
+    return sum(os.path.getsize(path + suffix) for suffix in ("", "-wal") if os.path.exists(path + suffix))
+
+
+def run_size(count: int, users: int, repeat: int, seed: int, workdir: str) -> dict:
+    rows = list(reminder_rows(count, users, random.Random(seed)))
+    since, until = NOW - timedelta(seconds=60), NOW
+    cutoff = NOW - timedelta(days=30)
+
+    # The dict model as it was loaded from medicine_reminders.json, owning all of its strings
+    serialized = json.dumps([as_dict(row) for row in rows])
+    dicts, dict_build, dict_bytes = measured(lambda: json.loads(serialized))
+
+    path = os.path.join(workdir, f"reminders-{count}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    store = ReminderStore(path, partitions=PARTITIONS)
+    start = time.perf_counter()
+    store.import_rows(rows, batch_size=20000)
+    store_build = time.perf_counter() - start
+    conn = sqlite3.connect(path)
+    partitions = list(range(PARTITIONS))
+
+    dict_hits, dict_scan = best_of(repeat, lambda: dict_due(dicts, since, until))
+    store_hits, store_scan = best_of(repeat, lambda: store.due(partitions, since, until))
+    dict_old, dict_clean = best_of(repeat, lambda: dict_older_than(dicts, cutoff))
+    store_old, store_clean = best_of(repeat, lambda: store_older_than(conn, cutoff))
+    conn.close()
+    if len(dict_hits) != len(store_hits) or len(dict_old) != store_old:
+        raise AssertionError("the two models disagree on the query results")
+
+    return {
+        "rows": count,
+        "due": len(store_hits),
+        "expired": store_old,
+        "dict": {"mb": round(dict_bytes / 2**20, 1), "build_s": round(dict_build, 3),
+                 "due_scan_ms": round(dict_scan * 1000, 2), "cleanup_scan_ms": round(dict_clean * 1000, 2)},
+        "sqlite": {"mb": round(disk_bytes(path) / 2**20, 1), "build_s": round(store_build, 3),
+                   "due_scan_ms": round(store_scan * 1000, 2), "cleanup_scan_ms": round(store_clean * 1000, 2)},
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="100000,1000000", help="table sizes, comma-separated")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3, help="scans per query; the best is reported")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", help="where the SQLite files go (default: a temporary directory)")
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="reminder_store_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    print(f"{'rows':>10}  {'model':<7}{'memory':>10}{'build':>9}{'due scan':>12}{'cleanup scan':>15}")
+    for count in (int(size) for size in args.rows.split(",")):
+        result = run_size(count, args.users, args.repeat, args.seed, workdir)
+        results.append(result)
+        for model in ("dict", "sqlite"):
+            r = result[model]
+            print(f"{count:>10}  {model:<7}{r['mb']:>7} MB{r['build_s']:>8}s{r['due_scan_ms']:>9} ms"
+                  f"{r['cleanup_scan_ms']:>12} ms")
+        print(f"{'':>10}  {result['due']} due, {result['expired']} expired; sqlite memory is the file on disk")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Local stand-in for the generativelanguage (Gemini) REST endpoint.
+
+Returns canned responses shaped like the real API, picked by looking at the
+prompt, with configurable latency and error injection. Requests carrying an
+inline image can be given their own latency, since multimodal calls take
+longer server-side.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_telegram import LatencyProfile
+
+SUGGESTIONS = (
+    "* Take a 10-minute walk after lunch to help blood sugar control\n"
+    "* Swap the mid-morning snack for a handful of unsalted nuts\n"
+    "* Add a fixed 10:30 PM wind-down to protect your sleep\n"
+)
+
+DIET_PLAN = """**Overview:** A balanced, low-glycaemic plan with steady protein and fibre across the day.
+
+**Breakfast:**
+**Meal Name:** Vegetable Oats Upma
+**Ingredients:**
+- 1 cup rolled oats
+- 1/2 cup mixed vegetables
+- 1 tsp mustard seeds
+**Instructions:**
+1. Dry roast the oats.
+2. Temper mustard seeds and saute the vegetables.
+3. Add oats and water and cook for 5 minutes.
+
+**Lunch:**
+**Meal Name:** Dal with Brown Rice
+**Ingredients:**
+- 1 cup moong dal
+- 1/2 cup brown rice
+**Instructions:**
+1. Pressure cook the dal.
+2. Serve with steamed brown rice.
+
+**Dinner:**
+**Meal Name:** Grilled Paneer Salad
+**Ingredients:**
+- 100 g paneer
+- Cucumber, tomato and lettuce
+**Instructions:**
+1. Grill the paneer.
+2. Toss with the vegetables and lemon juice.
+
+**Snacks:**
+* Roasted chana
+* A small apple
+
+**Important Notes:**
+* Drink 8 glasses of water a day.
+* Keep added salt under 5 g a day.
+"""
+
+RECIPE = """🍴 **Recipe Name**: Garden Stir Fry
+
+📝 **Ingredients**:
+- Capsicum
+- Tomatoes
+
+👩‍🍳 **Instructions**:
+1. Chop the vegetables.
+2. Stir fry for 6 minutes.
+
+⏱ **Prep Time**: 15 mins
+🔥 **Difficulty**: Easy
+"""
+
+PRESCRIPTION = {
+    "medicines": [
+        {"name": "Paracetamol", "dosage": "500 mg", "frequency": "twice daily"},
+        {"name": "Metformin", "dosage": "500 mg", "frequency": "once daily"},
+    ],
+    "notes": "Take after food.",
+}
+
+MEDICAL_RECORD = {
+    "type": "Blood Test",
+    "date": "2024-05-02",
+    "patient_info": "Adult patient",
+    "key_findings": ["HbA1c 7.2%", "Fasting glucose 142 mg/dL"],
+    "diagnosis": ["Type 2 diabetes, suboptimal control"],
+    "recommendations": ["Review metformin dose", "Repeat HbA1c in 3 months"],
+    "summary": "Glycaemic control is above target.",
+}
+
+
+def canned_text(prompt: str, json_mode: bool = False) -> str:
+    lowered = prompt.lower()
+    if "prescription" in lowered:
+        if json_mode:
+            return json.dumps(PRESCRIPTION, separators=(",", ":"))
+        return "```json\n" + json.dumps(PRESCRIPTION, indent=2) + "\n```"
+    if "medical document" in lowered:
+        if json_mode:
+            return json.dumps(MEDICAL_RECORD, separators=(",", ":"))
+        return json.dumps(MEDICAL_RECORD, indent=2)
+    if "daily schedule" in lowered:
+        return SUGGESTIONS
+    if "diet plan" in lowered:
+        return DIET_PLAN
+    if "recipe" in lowered:
+        return RECIPE
+    return "OK"
+
+
+class StubGeminiServer:
+    """Threaded HTTP server answering :generateContent calls for any model"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, profile: LatencyProfile = None,
+                 image_profile: LatencyProfile = None):
+        self.profile = profile or LatencyProfile()
+        self.image_profile = image_profile or self.profile
+        self.calls = 0
+        self.images = 0
+        self.image_bytes = 0
+        self.errors = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, payload: dict):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    request = {}
+                parts = [part for content in request.get("contents", []) for part in content.get("parts", [])]
+                prompt = " ".join(part.get("text", "") for part in parts)
+                images = [part.get("inline_data") or part.get("inlineData") for part in parts
+                          if part.get("inline_data") or part.get("inlineData")]
+                (server.image_profile if images else server.profile).delay()
+                with server._lock:
+                    server.calls += 1
+                    server.prompt_chars += len(prompt)
+                    server.images += len(images)
+                    # base64 text, as sent over the wire
+                    server.image_bytes += sum(len(image.get("data", "")) for image in images)
+                if ":generateContent" not in self.path:
+                    self._reply(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+                    return
+                if server.profile.should_fail():
+                    with server._lock:
+                        server.errors += 1
+                    status = server.profile.error_status
+                    self._reply(status, {"error": {"code": status, "message": "Injected error", "status": "UNAVAILABLE"}})
+                    return
+                config = request.get("generationConfig") or request.get("generation_config") or {}
+                json_mode = (config.get("responseMimeType") or config.get("response_mime_type")) == "application/json"
+                text = canned_text(prompt, json_mode)
+                self._reply(200, {
+                    "candidates": [{
+                        "content": {"parts": [{"text": text}], "role": "model"},
+                        "finishReason": "STOP",
+                        "index": 0,
+                    }],
+                    "usageMetadata": {
+                        "promptTokenCount": len(prompt) // 4,
+                        "candidatesTokenCount": len(text) // 4,
+                        "totalTokenCount": (len(prompt) + len(text)) // 4,
+                    },
+                })
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
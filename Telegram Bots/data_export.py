@@ -0,0 +1,209 @@
+"""Streaming export and import of user data.
+
+Everything stored about a chat (profile, reminders, medical reports,
+adherence counters and dose history) is written as JSON lines, one record
+per line tagged with its "type", either as a bare .jsonl (optionally
+gzipped) or as a ZIP with one member per type. Rows are streamed straight
+from SQLite cursors and written in small chunks, and imports are read line
+by line and inserted in batches, so memory use does not grow with the
+size of the dataset.
+
+Imports leave alone any chat that already has data here, so loading the
+same archive twice changes nothing; --replace swaps that data for the
+archive's instead.
+
+Admin CLI:
+
+    python data_export.py export --chat 123456 -o user.zip
+    python data_export.py export --format jsonl -o - | gzip > everyone.jsonl.gz
+    python data_export.py import everyone.jsonl.gz
+    python data_export.py import --replace user.zip
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import logging
+import zipfile
+import argparse
+import itertools
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("zip", "jsonl")
+# Written in this order; reminders come before the dose events that refer to them
+RECORD_TYPES = ("profile", "reminder", "report", "adherence", "dose_event")
+REMINDER_FIELDS = ("id", "chat_id", "medicine", "dosage", "message", "fire_at", "created_at",
+                   "slot", "snooze_until", "snooze_dose", "ends_at")
+ADHERENCE_FIELDS = ("chat_id", "medicine", "sent", "taken", "skipped", "snoozed", "streak", "best_streak")
+DOSE_EVENT_FIELDS = ("chat_id", "reminder_id", "dose_at", "action", "at", "medicine")
+FLUSH_LINES = 512
+
+
+def iter_lines(reminders, reports, adherence, chat_id=None):
+    """(record type, JSON line) for everything stored about chat_id, or about every chat"""
+    for chat, timezone_name, meal_times, language in reminders.export_profiles(chat_id):
+        yield "profile", json.dumps({
+            "type": "profile", "chat_id": chat, "timezone": timezone_name,
+            "meal_times": json.loads(meal_times) if meal_times else None, "language": language,
+        }, ensure_ascii=False)
+    for row in reminders.export_reminders(chat_id):
+        yield "reminder", json.dumps({"type": "reminder", **dict(zip(REMINDER_FIELDS, row))}, ensure_ascii=False)
+    for report_id, chat, file_name, upload_time, details in reports.export_rows(chat_id):
+        # details is already JSON; splice it in rather than decoding and re-encoding every report
+        head = json.dumps({"type": "report", "id": report_id, "chat_id": chat,
+                           "file_name": file_name, "upload_time": upload_time}, ensure_ascii=False)
+        yield "report", f'{head[:-1]}, "record_details": {details}}}'
+    for row in adherence.export_stats(chat_id):
+        yield "adherence", json.dumps({"type": "adherence", **dict(zip(ADHERENCE_FIELDS, row))}, ensure_ascii=False)
+    for row in adherence.export_events(chat_id):
+        yield "dose_event", json.dumps({"type": "dose_event", **dict(zip(DOSE_EVENT_FIELDS, row))})
+
+
+def _write(out, lines) -> int:
+    count = 0
+    for chunk in iter(lambda: list(itertools.islice(lines, FLUSH_LINES)), []):
+        out.write(("\n".join(chunk) + "\n").encode("utf-8"))
+        count += len(chunk)
+    return count
+
+
+def export(out, reminders, reports, adherence, chat_id=None, fmt: str = "zip") -> dict:
+    """Write an archive to the binary file out; returns {record type: count}"""
+    counts = dict.fromkeys(RECORD_TYPES, 0)
+    grouped = itertools.groupby(iter_lines(reminders, reports, adherence, chat_id), key=lambda item: item[0])
+    if fmt == "jsonl":
+        for record_type, items in grouped:
+            counts[record_type] += _write(out, (line for _, line in items))
+        return counts
+
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for record_type, items in grouped:
+            with archive.open(f"{record_type}.jsonl", "w", force_zip64=True) as member:
+                counts[record_type] += _write(member, (line for _, line in items))
+    return counts
+
+
+def read_records(path: str):
+    """Records from a .zip, .jsonl or .jsonl.gz archive, one at a time"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                with archive.open(name) as member:
+                    yield from _parse(io.TextIOWrapper(member, encoding="utf-8"))
+    elif path == "-":
+        yield from _parse(sys.stdin)
+    else:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            yield from _parse(f)
+
+
+def _parse(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            logger.error(f"Skipping malformed line {number}")
+
+
+def import_records(records, reminders, reports, adherence, batch_size: int = 5000, replace: bool = False) -> dict:
+    """Insert streamed records; reminders get new ids and dose events follow them.
+
+    Records for a chat that already has reminders, reports or adherence
+    data are skipped and the chat counted in "skipped_chats", unless
+    replace is set, in which case that data is deleted before the chat's
+    first record goes in.
+    """
+    counts = dict.fromkeys(RECORD_TYPES, 0)
+    counts["skipped_chats"] = 0
+    reminder_ids = {}
+    admitted = {}  # chat_id -> whether this import writes its records
+
+    def admit(record) -> bool:
+        chat_id = str(record["chat_id"])
+        if chat_id not in admitted:
+            existing = reminders.has_chat(chat_id) or reports.count(chat_id) or adherence.has_chat(chat_id)
+            if existing and replace:
+                reminders.delete_chat(chat_id)
+                reports.delete_chat(chat_id)
+                adherence.delete_chat(chat_id)
+            elif existing:
+                logger.warning(f"Skipping chat {chat_id}, which already has data (use --replace to overwrite it)")
+                counts["skipped_chats"] += 1
+            admitted[chat_id] = replace or not existing
+        return admitted[chat_id]
+
+    for record_type, group in itertools.groupby(records, key=lambda record: record.get("type")):
+        group = (record for record in group if admit(record))
+        if record_type == "profile":
+            counts[record_type] += reminders.import_profiles((
+                (str(r["chat_id"]), r.get("timezone"),
+                 json.dumps(r["meal_times"]) if r.get("meal_times") else None, r.get("language"))
+                for r in group), batch_size)
+        elif record_type == "reminder":
+            ids = reminders.import_rows((tuple(r.get(field) for field in REMINDER_FIELDS) for r in group), batch_size)
+            reminder_ids.update(ids)
+            counts[record_type] += len(ids)
+        elif record_type == "report":
+            counts[record_type] += reports.import_rows((
+                (str(r["chat_id"]), r.get("file_name"), r.get("upload_time"),
+                 json.dumps(r.get("record_details") or {}, ensure_ascii=False))
+                for r in group), batch_size)
+        elif record_type == "adherence":
+            counts[record_type] += adherence.import_stats(
+                (tuple(r.get(field) for field in ADHERENCE_FIELDS) for r in group), batch_size)
+        elif record_type == "dose_event":
+            counts[record_type] += adherence.import_events((
+                (str(r["chat_id"]), reminder_ids.get(r["reminder_id"], r["reminder_id"]),
+                 r["dose_at"], r["action"], r["at"], r.get("medicine"))
+                for r in group), batch_size)
+        else:
+            logger.warning(f"Skipping records of unknown type {record_type!r}")
+    return counts
+
+
+def open_stores(state_db: str, reminder_db: str, partitions: int):
+    from adherence import AdherenceStore
+    from report_store import ReportStore
+    from reminder_store import ReminderStore
+    return ReminderStore(reminder_db, partitions=partitions), ReportStore(state_db), AdherenceStore(reminder_db)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Export or import MedGuardian user data")
+    parser.add_argument("--db", default="med_remind.db", help="bot state database (medical reports)")
+    parser.add_argument("--reminder-db", default=os.getenv("REMINDER_DB"),
+                        help="reminder and adherence database (default: REMINDER_DB, else --db)")
+    parser.add_argument("--partitions", type=int, default=int(os.getenv("REMINDER_PARTITIONS", "16")))
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write an archive")
+    export_parser.add_argument("--chat", help="only this chat id (default: everyone)")
+    export_parser.add_argument("--format", choices=FORMATS, default="zip")
+    export_parser.add_argument("-o", "--output", required=True, help="archive path, or - for stdout")
+    import_parser = commands.add_parser("import", help="load an archive")
+    import_parser.add_argument("archive", help=".zip, .jsonl or .jsonl.gz path, or - for stdin")
+    import_parser.add_argument("--batch-size", type=int, default=5000)
+    import_parser.add_argument("--replace", action="store_true",
+                               help="overwrite chats that already have data instead of skipping them")
+    args = parser.parse_args(argv)
+
+    stores = open_stores(args.db, args.reminder_db or args.db, args.partitions)
+    if args.command == "export":
+        if args.output == "-":
+            counts = export(sys.stdout.buffer, *stores, chat_id=args.chat, fmt=args.format)
+        else:
+            with open(args.output, "wb") as out:
+                counts = export(out, *stores, chat_id=args.chat, fmt=args.format)
+    else:
+        counts = import_records(read_records(args.archive), *stores, batch_size=args.batch_size,
+                                replace=args.replace)
+    print(json.dumps(counts), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
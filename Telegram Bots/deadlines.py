@@ -0,0 +1,36 @@
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Time budget for handling one Telegram update, end to end
+UPDATE_DEADLINE_SECONDS = float(os.getenv("UPDATE_DEADLINE_SECONDS", "25"))
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Bound everything inside to `seconds`; an enclosing, earlier deadline still wins"""
+    current = _deadline.get()
+    target = time.monotonic() + seconds
+    token = _deadline.set(target if current is None else min(current, target))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(default: float) -> float:
+    """Seconds left before the current deadline, capped at default; raises once it has passed"""
+    current = _deadline.get()
+    if current is None:
+        return default
+    left = current - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("update deadline exceeded")
+    return min(left, default)
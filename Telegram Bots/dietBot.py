@@ -2,10 +2,12 @@ import csv
 import os
 import json
 import re
+import base64
 import asyncio
 import requests
 from typing import Dict, List
-from apscheduler.schedulers.background import BackgroundScheduler
+from datetime import datetime, time as dt_time
+from zoneinfo import ZoneInfo
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     Application,
@@ -18,6 +20,19 @@ from telegram.ext import (
 from dotenv import load_dotenv
 import easyocr
 import logging
+import metrics
+import profiling
+import prompts
+import resilience
+from image_io import decode_image
+from meal_schedule import MealScheduleStore
+import work_queue
+from work_queue import ChatWorkQueue
+import languages
+from model_cache import ModelCache
+import extraction
+from extraction import Extractor, DocumentType, Photo
+from update_ledger import UpdateLedger
 
 # Define conversation states
 NAME, DIET_TYPE, MEAL_PREFS, SPICE_LEVEL, ALLERGIES, CHRONIC_DISEASE, PHOTO_HANDLER, INGREDIENTS_INPUT = range(8)
@@ -33,9 +48,43 @@ if not os.path.exists(CSV_FILE):
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY_DIET")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN_DIET")
+METRICS_PORT = int(os.getenv("METRICS_PORT_DIET", "9102"))
+BOT_NAME = "dietBot"
+# Optional overrides so the bot can run against local stand-ins (see bench/loadtest.py)
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE")
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com")
+# Meal reminders survive restarts in this database
+STATE_DB = "dietBot.db"
+# Timezone meal reminder times are given in (empty: the server's local time)
+REMINDER_TIMEZONE = os.getenv("DIET_REMINDER_TIMEZONE")
 
-# Initialize EasyOCR reader
-reader = easyocr.Reader(['en'])
+# Default reminder time and emoji per meal
+MEAL_REMINDERS = {
+    "breakfast": {"time": "08:00", "emoji": "☀️"},
+    "lunch": {"time": "13:00", "emoji": "🌞"},
+    "dinner": {"time": "20:00", "emoji": "🌙"},
+}
+# Reminders sent concurrently by one time-slot job
+REMINDER_SEND_CONCURRENCY = 20
+# Threads shared by every chat's OCR/Gemini jobs, and the per-chat request limit
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+UPLOAD_RATE_LIMIT = int(os.getenv("UPLOAD_RATE_LIMIT", "5"))  # per minute
+# Memory allowed for loaded OCR language models, and how long an unused one is kept
+OCR_MEMORY_BUDGET_MB = float(os.getenv("OCR_MEMORY_BUDGET_MB", "1024"))
+OCR_MODEL_IDLE_SECONDS = float(os.getenv("OCR_MODEL_IDLE_SECONDS", "1800"))
+# How ingredient photos are read: "ocr" (EasyOCR, then text-only Gemini), "multimodal" (the photo to Gemini) or "auto"
+EXTRACTION_BACKEND = os.getenv("EXTRACTION_BACKEND_DIET", extraction.OCR)
+
+MEAL_REMINDERS_SENT = metrics.REGISTRY.counter(
+    "meal_reminders_sent_total", "Meal reminders delivered, by meal"
+)
+
+# EasyOCR readers by language list, loaded on demand and evicted when idle or over budget
+ocr_readers = ModelCache(
+    "ocr", lambda langs: easyocr.Reader(list(langs)),
+    budget_mb=OCR_MEMORY_BUDGET_MB, idle_seconds=OCR_MODEL_IDLE_SECONDS,
+)
+extractor = Extractor(BOT_NAME, EXTRACTION_BACKEND, ocr_readers)
 
 # Set up logging
 logging.basicConfig(
@@ -44,6 +93,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+meal_schedule = MealScheduleStore(STATE_DB)
+
+# Updates already handled, so ones redelivered after a restart aren't processed twice
+update_ledger = UpdateLedger(STATE_DB, BOT_NAME)
+
+# One expensive job per chat at a time, shared fairly between chats
+upload_queue = ChatWorkQueue("uploads", workers=UPLOAD_WORKERS, max_jobs=UPLOAD_RATE_LIMIT, per_seconds=60)
+
 class DietPlanParser:
     @staticmethod
     def parse_diet_plan(diet_plan_text: str) -> Dict[str, Dict[str, str]]:
@@ -180,18 +237,68 @@ async def send_message_in_chunks(text: str, chat_id: int, bot, parse_mode="Markd
             except Exception as e:
                 logger.error(f"Failed to send plain text chunk: {e}")
 
-async def set_meal_reminders(update: Update, context: CallbackContext, diet_plan: str):
-    """Improved reminder setup with async support"""
+def reminder_timezone():
+    if REMINDER_TIMEZONE:
+        return ZoneInfo(REMINDER_TIMEZONE)
+    return datetime.now().astimezone().tzinfo
+
+def ensure_meal_job(job_queue, remind_at: str) -> None:
+    """One daily job per distinct reminder time, shared by every user due then"""
+    if job_queue is None:
+        logger.error("JobQueue unavailable, install python-telegram-bot[job-queue] for meal reminders")
+        return
+    name = f"meal_reminders:{remind_at}"
+    if job_queue.get_jobs_by_name(name):
+        return
+    hour, minute = (int(part) for part in remind_at.split(":"))
+    job_queue.run_daily(
+        send_meal_reminders,
+        time=dt_time(hour, minute, tzinfo=reminder_timezone()),
+        name=name,
+        data=remind_at,
+    )
+
+async def send_meal_reminders(context: CallbackContext) -> None:
+    """Fan one time slot's reminders out to all of its users"""
+    remind_at = context.job.data
+    with profiling.request(BOT_NAME, "send_meal_reminders"):
+        await _send_meal_slot(context, remind_at)
+
+async def _send_meal_slot(context: CallbackContext, remind_at: str) -> None:
+    due = meal_schedule.due_at(remind_at)
+    semaphore = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+
+    async def send(chat_id, meal, meal_name):
+        emoji = MEAL_REMINDERS.get(meal, {}).get("emoji", "🍽️")
+        text = f"{emoji} Time for {meal}!"
+        if meal_name:
+            text += f"\nToday's plan: {meal_name}"
+        async with semaphore:
+            try:
+                await context.bot.send_message(chat_id=chat_id, text=text)
+                MEAL_REMINDERS_SENT.inc(bot=BOT_NAME, meal=meal)
+            except Exception as e:
+                logger.error(f"Error sending {meal} reminder to {chat_id}: {e}")
+
+    await asyncio.gather(*(send(*row) for row in due))
+
+async def set_meal_reminders(update: Update, context: CallbackContext, diet_plan: Dict):
+    """Store daily meal reminders for the user and make sure their time slots are scheduled"""
     user_id = update.message.chat_id
-    meals = {
-        "Breakfast": {"hour": 8, "emoji": "☀️"},
-        "Lunch": {"hour": 13, "emoji": "🌞"},
-        "Dinner": {"hour": 20, "emoji": "🌙"}
-    }
+    meals = []
+    for meal, details in MEAL_REMINDERS.items():
+        meal_name = diet_plan.get("meals", {}).get(meal, {}).get("name", "") if diet_plan else ""
+        meals.append((meal, details["time"], meal_name))
+
+    meal_schedule.set_reminders(user_id, meals)
+    for _, remind_at, _ in meals:
+        ensure_meal_job(context.job_queue, remind_at)
     
     reminder_msg = "⏰ *Meal Reminders Set:*\n"
-    for meal, details in meals.items():
-        reminder_msg += f"{details['emoji']} *{meal}* at {details['hour']}:00\n"
+    for meal, remind_at, meal_name in meals:
+        reminder_msg += f"{MEAL_REMINDERS[meal]['emoji']} *{meal.capitalize()}* at {remind_at}"
+        reminder_msg += f" – {meal_name}\n" if meal_name else "\n"
+    reminder_msg += "\nSend /cancel to stop meal reminders."
     
     await context.bot.send_message(
         chat_id=user_id,
@@ -199,44 +306,68 @@ async def set_meal_reminders(update: Update, context: CallbackContext, diet_plan
         parse_mode="Markdown"
     )
 
+async def restore_meal_jobs(application: Application) -> None:
+    """Re-create the time-slot jobs for reminders stored before a restart"""
+    for remind_at in meal_schedule.times():
+        ensure_meal_job(application.job_queue, remind_at)
+    logger.info(f"Restored {meal_schedule.count()} meal reminders")
+
+@metrics.instrument_handler(BOT_NAME)
+async def cancel_reminders(update: Update, context: CallbackContext) -> None:
+    removed = meal_schedule.cancel(update.message.chat_id)
+    if removed:
+        await update.message.reply_text("🔕 Your meal reminders have been cancelled.")
+    else:
+        await update.message.reply_text("You don't have any meal reminders set.")
+
+@metrics.instrument_handler(BOT_NAME)
+async def cancel(update: Update, context: CallbackContext) -> int:
+    """/cancel within the conversation, which shadows cancel_reminders: ends it and stops meal reminders too"""
+    if meal_schedule.cancel(update.message.chat_id):
+        await update.message.reply_text("Operation cancelled. 🔕 Your meal reminders have been cancelled too.")
+    else:
+        await update.message.reply_text("Operation cancelled.")
+    return ConversationHandler.END
+
+@metrics.instrument_handler(BOT_NAME)
+async def set_language(update: Update, context: CallbackContext) -> None:
+    """/language <code>: the language ingredient photos are read in"""
+    if not context.args:
+        current = context.user_data.get("language", languages.DEFAULT_LANGUAGE)
+        await update.message.reply_text(
+            f"🗣 Photos are read as: {languages.LANGUAGES[current][0]}\n\n"
+            "Usage: /language <code>\n" + languages.menu()
+        )
+        return
+    code = languages.resolve_language(" ".join(context.args))
+    if code is None:
+        await update.message.reply_text("⚠️ Unknown language. Send /language to see the ones available.")
+        return
+    context.user_data["language"] = code
+    await update.message.reply_text(f"✅ Language set to {languages.LANGUAGES[code][0]}.")
+
+class JobFailed(Exception):
+    """Raised by a queued job that failed, with the text to show the user.
+
+    run_job returns the text to the handler; the update ledger doesn't
+    memoise it, so a redelivered update runs the job again.
+    """
+
+NO_INGREDIENTS_FOUND = (
+    "⚠️ Couldn't identify any ingredients in the photo. Please try with clearer text or type ingredients."
+)
+
 def get_diet_plan(user_data: Dict) -> str:
     """Improved Gemini API request with better prompt and error handling"""
-    url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-pro:generateContent?key={GEMINI_API_KEY}"
-    
-    prompt = f"""
-    Create a detailed personalized diet plan for a {user_data['diet_type']} person with these characteristics:
-    - Chronic disease: {user_data['chronic_disease']}
-    - Favorite meals: {user_data['meal_prefs']}
-    - Spice preference: {user_data['spice_level']}
-    - Allergies: {user_data['allergies']}
-
-    Suggest a suitable diet plan for a 4-year-old female child weighing 13.25 kg, diagnosed with an upper respiratory tract infection (URTI) and prescribed Calpol (for fever), Delcon (for cold), Levolin (for breathing issues), and Meftal-P (for pain relief). The diet should include easily digestible, nutritious foods that help with recovery, hydration, and boosting immunity. Avoid foods that may worsen congestion or irritate the throat
-    
-    Provide the response in this EXACT format:
+    url = f"{GEMINI_API_BASE}/v1/models/gemini-1.5-pro:generateContent?key={GEMINI_API_KEY}"
     
-    **Overview:** [2-3 sentence overview of the diet plan]
-    
-    **Breakfast:**
-    **Meal Name:** [name]
-    **Ingredients:**
-    - [ingredient 1]
-    - [ingredient 2]
-    **Instructions:**
-    1. [step 1]
-    2. [step 2]
-    
-    **Lunch:** [same format as breakfast]
-    
-    **Dinner:** [same format as breakfast]
-    
-    **Snacks:**
-    * [snack 1]
-    * [snack 2]
-    
-    **Important Notes:**
-    * [note 1]
-    * [note 2]
-    """
+    prompt = prompts.DIET_PLAN.render(
+        diet_type=user_data['diet_type'],
+        chronic_disease=user_data['chronic_disease'],
+        meal_prefs=user_data['meal_prefs'],
+        spice_level=user_data['spice_level'],
+        allergies=user_data['allergies'],
+    )
     
     payload = {
         "contents": [{
@@ -244,90 +375,142 @@ def get_diet_plan(user_data: Dict) -> str:
         }]
     }
     
+    def post(timeout: float):
+        with metrics.track(metrics.GEMINI_SECONDS, metrics.GEMINI_ERRORS, bot=BOT_NAME, call="diet_plan"):
+            response = requests.post(url, json=payload, timeout=timeout)
+            response.raise_for_status()
+        return response.json()
+
     try:
-        response = requests.post(url, json=payload, timeout=30)
-        response.raise_for_status()
-        response_data = response.json()
-        
-        if not response_data.get('candidates'):
-            return "Error: No candidates in API response"
-            
-        candidate = response_data['candidates'][0]
-        if 'content' not in candidate or 'parts' not in candidate['content']:
-            return "Error: Malformed API response"
-            
-        return candidate['content']['parts'][0].get('text', "Error: Empty response text")
-        
+        response_data = resilience.call("gemini", post, timeout=30)
+    except resilience.CircuitOpenError:
+        raise JobFailed("Error: The diet planner is unavailable right now, please try again in a minute")
+    except TimeoutError:
+        raise JobFailed("Error: The diet planner took too long to answer")
     except requests.exceptions.RequestException as e:
         logger.error(f"API Error: {e}")
-        return f"API Error: {str(e)}"
+        raise JobFailed(f"API Error: {str(e)}")
     except Exception as e:
         logger.error(f"Unexpected Error: {e}")
-        return f"Unexpected Error: {str(e)}"
+        raise JobFailed(f"Unexpected Error: {str(e)}")
 
-async def get_recipe_from_photo(photo_file, user_data: Dict) -> str:
-    """Use EasyOCR to extract ingredients and generate a recipe"""
+    if not response_data.get('candidates'):
+        raise JobFailed("Error: No candidates in API response")
+
+    candidate = response_data['candidates'][0]
+    if 'content' not in candidate or 'parts' not in candidate['content']:
+        raise JobFailed("Error: Malformed API response")
+
+    text = candidate['content']['parts'][0].get('text')
+    if not text:
+        raise JobFailed("Error: Empty response text")
+    return text
+
+def recipe_from_photo(photo_bytes: bytes, user_data: Dict) -> str:
+    """Read the ingredients from a photo (EasyOCR or Gemini directly) and generate a recipe"""
     try:
-        # Download the photo as bytes
-        photo_bytes = await photo_file.download_as_bytearray()
-        
-        # Convert to bytes (if it's not already)
-        if isinstance(photo_bytes, bytearray):
-            photo_bytes = bytes(photo_bytes)
-        
-        # Use EasyOCR to extract text
-        result = reader.readtext(photo_bytes)
-        ingredients_text = " ".join([detection[1] for detection in result])
-        
-        if not ingredients_text.strip():
-            return "⚠️ Couldn't identify any ingredients in the photo. Please try with clearer text or type ingredients."
-        
-        # Generate recipe using Gemini API
-        return await generate_recipe_from_text(ingredients_text, user_data)
-        
+        # Decode in memory, without copying the buffer
+        image = decode_image(photo_bytes)
+        if image is None:
+            raise JobFailed("⚠️ Couldn't read that image. Please send a JPG or PNG photo.")
+
+        document = DocumentType(
+            "ingredients", "\n",
+            lambda text: recipe_from_text(text, user_data),
+            lambda data, mime_type: ("", recipe_from_image(data, mime_type, user_data)),
+        )
+        # Telegram re-encodes every photo as JPEG
+        photo = Photo(photo_bytes, image, "image/jpeg", languages.ocr_languages(user_data.get("language")))
+        recipe = extractor.extract(document, photo, queue_depth=upload_queue.pending()).result
+    except JobFailed:
+        raise
     except Exception as e:
         logger.error(f"Error processing photo: {e}")
-        return f"Error processing photo: {str(e)}"
+        raise JobFailed(f"Error processing photo: {str(e)}")
+
+    if recipe is None:
+        raise JobFailed(NO_INGREDIENTS_FOUND)
+    return recipe
 
-async def generate_recipe_from_text(ingredients: str, user_data: Dict) -> str:
+def recipe_from_text(ingredients: str, user_data: Dict) -> str:
     """Generate recipe from text ingredients using Gemini API"""
-    url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-pro:generateContent?key={GEMINI_API_KEY}"
-    
-    prompt = f"""
-    Create a healthy recipe using these ingredients: {ingredients}
+    url = f"{GEMINI_API_BASE}/v1/models/gemini-1.5-pro:generateContent?key={GEMINI_API_KEY}"
     
-    Dietary Requirements:
-    - Diet: {user_data.get('diet_type', 'No restrictions')}
-    - Allergies: {user_data.get('allergies', 'None')}
-    - Health Condition: {user_data.get('chronic_disease', 'None')}
-    - Spice Level: {user_data.get('spice_level', 'Medium')}
-    
-    Format:
-    
-    🍴 **Recipe Name**: [Creative name]
-    
-    📝 **Ingredients**:
-    - [Ingredient 1]
-    - [Ingredient 2]
-    
-    👩‍🍳 **Instructions**:
-    1. [Step 1]
-    2. [Step 2]
-    
-    ⏱ **Prep Time**: [X mins]
-    🔥 **Difficulty**: [Easy/Medium/Hard]
-    """
+    prompt = prompts.RECIPE.render(
+        ingredients=prompts.compact_ocr(ingredients),
+        diet_type=user_data.get('diet_type', 'No restrictions'),
+        allergies=user_data.get('allergies', 'None'),
+        chronic_disease=user_data.get('chronic_disease', 'None'),
+        spice_level=user_data.get('spice_level', 'Medium'),
+    )
     
     payload = {"contents": [{"parts": [{"text": prompt}]}]}
     
-    try:
-        response = requests.post(url, json=payload, timeout=30)
-        response.raise_for_status()
+    def post(timeout: float):
+        with metrics.track(metrics.GEMINI_SECONDS, metrics.GEMINI_ERRORS, bot=BOT_NAME, call="recipe"):
+            response = requests.post(url, json=payload, timeout=timeout)
+            response.raise_for_status()
         return response.json()['candidates'][0]['content']['parts'][0]['text']
+
+    try:
+        recipe = resilience.call("gemini", post, fallback=lambda: None, timeout=30)
     except Exception as e:
         logger.error(f"Error generating recipe: {e}")
-        return f"⚠️ Failed to generate recipe. Error: {str(e)}"
+        raise JobFailed(f"⚠️ Failed to generate recipe. Error: {str(e)}")
+    if recipe is None:
+        raise JobFailed("⚠️ The recipe generator is busy right now. Please try again in a minute.")
+    return recipe
+
+def recipe_from_image(photo_bytes: bytes, mime_type: str, user_data: Dict) -> str:
+    """Generate a recipe from an ingredient photo in one multimodal Gemini call"""
+    url = f"{GEMINI_API_BASE}/v1/models/gemini-1.5-pro:generateContent?key={GEMINI_API_KEY}"
+    
+    prompt = prompts.RECIPE_IMAGE.render(
+        diet_type=user_data.get('diet_type', 'No restrictions'),
+        allergies=user_data.get('allergies', 'None'),
+        chronic_disease=user_data.get('chronic_disease', 'None'),
+        spice_level=user_data.get('spice_level', 'Medium'),
+    )
+    
+    payload = {"contents": [{"parts": [
+        {"text": prompt},
+        {"inline_data": {"mime_type": mime_type, "data": base64.b64encode(photo_bytes).decode("ascii")}},
+    ]}]}
+    
+    def post(timeout: float):
+        with metrics.track(metrics.GEMINI_SECONDS, metrics.GEMINI_ERRORS, bot=BOT_NAME, call="recipe_image"):
+            response = requests.post(url, json=payload, timeout=timeout)
+            response.raise_for_status()
+        return response.json()['candidates'][0]['content']['parts'][0]['text']
+
+    # No fallback here: the extractor falls back to OCR if this fails
+    return resilience.call("gemini", post, timeout=30)
+
+async def run_job(update: Update, kind: str, fn, *args):
+    """Run an OCR/Gemini job through the per-chat queue; None if it was refused or replaced,
+    and the failure text if the job failed"""
+    chat_id = update.effective_chat.id
+    # A restart mid-job reuses the answer instead of calling Gemini again
+    outcome, future = upload_queue.submit(chat_id, kind, update_ledger.memo, update.update_id, kind, fn, *args)
+    if outcome == work_queue.THROTTLED:
+        await update.message.reply_text(
+            f"🐢 You're sending requests faster than I can handle them. "
+            f"Please try again in {upload_queue.retry_after(chat_id)} seconds."
+        )
+        return None
+    if outcome in (work_queue.QUEUED, work_queue.SUPERSEDED):
+        await update.message.reply_text("⏳ Still working on your previous request. Yours is next in line.")
+    try:
+        return await asyncio.wrap_future(future)
+    except JobFailed as e:
+        return str(e)
+    except asyncio.CancelledError:
+        if future.cancelled():
+            # Replaced by a newer submission of the same kind before it started
+            return None
+        raise
 
+@metrics.instrument_handler(BOT_NAME)
 async def start(update: Update, context: CallbackContext) -> int:
     try:
         await update.message.reply_text(
@@ -340,6 +523,7 @@ async def start(update: Update, context: CallbackContext) -> int:
         logger.error(f"Error in start: {e}")
         return ConversationHandler.END
 
+@metrics.instrument_handler(BOT_NAME)
 async def name(update: Update, context: CallbackContext) -> int:
     try:
         context.user_data["name"] = update.message.text
@@ -357,6 +541,7 @@ async def name(update: Update, context: CallbackContext) -> int:
         logger.error(f"Error in name: {e}")
         return ConversationHandler.END
 
+@metrics.instrument_handler(BOT_NAME)
 async def diet_type(update: Update, context: CallbackContext) -> int:
     try:
         context.user_data["diet_type"] = update.message.text
@@ -369,6 +554,7 @@ async def diet_type(update: Update, context: CallbackContext) -> int:
         logger.error(f"Error in diet_type: {e}")
         return ConversationHandler.END
 
+@metrics.instrument_handler(BOT_NAME)
 async def meal_prefs(update: Update, context: CallbackContext) -> int:
     try:
         context.user_data["meal_prefs"] = update.message.text
@@ -386,6 +572,7 @@ async def meal_prefs(update: Update, context: CallbackContext) -> int:
         logger.error(f"Error in meal_prefs: {e}")
         return ConversationHandler.END
 
+@metrics.instrument_handler(BOT_NAME)
 async def spice_level(update: Update, context: CallbackContext) -> int:
     try:
         context.user_data["spice_level"] = update.message.text
@@ -398,6 +585,7 @@ async def spice_level(update: Update, context: CallbackContext) -> int:
         logger.error(f"Error in spice_level: {e}")
         return ConversationHandler.END
 
+@metrics.instrument_handler(BOT_NAME)
 async def allergies(update: Update, context: CallbackContext) -> int:
     try:
         context.user_data["allergies"] = update.message.text
@@ -410,6 +598,7 @@ async def allergies(update: Update, context: CallbackContext) -> int:
         logger.error(f"Error in allergies: {e}")
         return ConversationHandler.END
 
+@metrics.instrument_handler(BOT_NAME)
 async def chronic_disease(update: Update, context: CallbackContext) -> int:
     try:
         context.user_data["chronic_disease"] = update.message.text
@@ -434,7 +623,9 @@ async def chronic_disease(update: Update, context: CallbackContext) -> int:
         )
         
         # Get diet plan
-        diet_plan_text = get_diet_plan(context.user_data)
+        diet_plan_text = await run_job(update, "diet_plan", get_diet_plan, dict(context.user_data))
+        if diet_plan_text is None:
+            return CHRONIC_DISEASE
         
         if "Error" in diet_plan_text:
             await update.message.reply_text(
@@ -469,6 +660,7 @@ async def chronic_disease(update: Update, context: CallbackContext) -> int:
         )
         return ConversationHandler.END
 
+@metrics.instrument_handler(BOT_NAME)
 async def handle_photo(update: Update, context: CallbackContext) -> int:
     try:
         if not update.message.photo:
@@ -482,9 +674,12 @@ async def handle_photo(update: Update, context: CallbackContext) -> int:
             action="typing"
         )
         
-        recipe = await get_recipe_from_photo(photo_file, context.user_data)
+        photo_bytes = await photo_file.download_as_bytearray()
+        recipe = await run_job(update, "recipe", recipe_from_photo, photo_bytes, dict(context.user_data))
+        if recipe is None:
+            return PHOTO_HANDLER
         
-        if recipe.startswith("⚠️ Couldn't identify any ingredients"):
+        if recipe == NO_INGREDIENTS_FOUND:
             await update.message.reply_text(
                 "I couldn't read the ingredients from the photo. "
                 "Please type them out for me (comma separated):\n\n"
@@ -503,6 +698,7 @@ async def handle_photo(update: Update, context: CallbackContext) -> int:
         )
         return INGREDIENTS_INPUT
 
+@metrics.instrument_handler(BOT_NAME)
 async def process_ingredients(update: Update, context: CallbackContext) -> int:
     try:
         ingredients = update.message.text
@@ -513,7 +709,9 @@ async def process_ingredients(update: Update, context: CallbackContext) -> int:
         )
         
         # Generate recipe from text input
-        recipe = await generate_recipe_from_text(ingredients, context.user_data)
+        recipe = await run_job(update, "recipe", recipe_from_text, ingredients, dict(context.user_data))
+        if recipe is None:
+            return INGREDIENTS_INPUT
         await send_message_in_chunks(recipe, update.message.chat_id, context.bot)
         
         return ConversationHandler.END
@@ -525,6 +723,7 @@ async def process_ingredients(update: Update, context: CallbackContext) -> int:
         )
         return INGREDIENTS_INPUT
 
+@metrics.instrument_handler(BOT_NAME)
 async def done(update: Update, context: CallbackContext) -> int:
     await update.message.reply_text(
         "Great! Your diet plan is complete. 🎉\n\n"
@@ -532,6 +731,12 @@ async def done(update: Update, context: CallbackContext) -> int:
     )
     return ConversationHandler.END
 
+@metrics.instrument_handler(BOT_NAME)
+async def still_working(update: Update, context: CallbackContext) -> None:
+    """Answer messages that arrive while this chat's diet plan or recipe is being made"""
+    if update.message:
+        await update.message.reply_text("⏳ Still working on your previous request, please wait a moment.")
+
 async def error_handler(update: Update, context: CallbackContext) -> None:
     """Log errors caused by updates."""
     logger.error(f"Update {update} caused error {context.error}")
@@ -540,34 +745,93 @@ async def error_handler(update: Update, context: CallbackContext) -> None:
         text="⚠️ An error occurred. Please try again or use /start to begin anew."
     )
 
+class LedgerApplication(Application):
+    """Application that handles each update once, across restarts too (see update_ledger).
+
+    An update is finished once its handlers have returned and every
+    non-blocking handler task started for it has completed.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._open_tasks = {}  # update_id -> handler runs still in progress
+
+    async def process_update(self, update: object) -> None:
+        if not isinstance(update, Update):
+            await super().process_update(update)
+            return
+        if not update_ledger.begin(update.update_id):
+            return
+        self._open_tasks[update.update_id] = 1
+        try:
+            await super().process_update(update)
+        finally:
+            self._release(update.update_id)
+
+    def create_task(self, coroutine, update: object = None, **kwargs):
+        task = super().create_task(coroutine, update=update, **kwargs)
+        if isinstance(update, Update) and update.update_id in self._open_tasks:
+            self._open_tasks[update.update_id] += 1
+            task.add_done_callback(lambda _: self._release(update.update_id))
+        return task
+
+    def _release(self, update_id: int) -> None:
+        self._open_tasks[update_id] -= 1
+        if not self._open_tasks[update_id]:
+            del self._open_tasks[update_id]
+            update_ledger.finish(update_id)
+
+def build_application() -> Application:
+    """Build the application with all handlers registered."""
+    builder = (
+        Application.builder().application_class(LedgerApplication)
+        .token(TELEGRAM_BOT_TOKEN).post_init(restore_meal_jobs)
+    )
+    if TELEGRAM_API_BASE:
+        builder = builder.base_url(f"{TELEGRAM_API_BASE}/bot").base_file_url(f"{TELEGRAM_API_BASE}/file/bot")
+    if profiling.ENABLED:
+        builder = builder.request(profiling.ptb_request())
+    application = builder.build()
+
+    conv_handler = ConversationHandler(
+        entry_points=[CommandHandler("start", start)],
+        states={
+            NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, name)],
+            DIET_TYPE: [MessageHandler(filters.TEXT & ~filters.COMMAND, diet_type)],
+            MEAL_PREFS: [MessageHandler(filters.TEXT & ~filters.COMMAND, meal_prefs)],
+            SPICE_LEVEL: [MessageHandler(filters.TEXT & ~filters.COMMAND, spice_level)],
+            ALLERGIES: [MessageHandler(filters.TEXT & ~filters.COMMAND, allergies)],
+            # OCR and Gemini run in the upload queue; block=False keeps other chats' updates flowing meanwhile
+            CHRONIC_DISEASE: [MessageHandler(filters.TEXT & ~filters.COMMAND, chronic_disease, block=False)],
+            PHOTO_HANDLER: [
+                MessageHandler(filters.PHOTO, handle_photo, block=False),
+                CommandHandler("done", done)
+            ],
+            INGREDIENTS_INPUT: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, process_ingredients, block=False),
+                CommandHandler("done", done)
+            ],
+            ConversationHandler.WAITING: [MessageHandler(filters.ALL, still_working)],
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+    )
+
+    application.add_handler(conv_handler)
+    # Outside a conversation, /cancel stops meal reminders; inside one the fallback does
+    application.add_handler(CommandHandler("cancel", cancel_reminders))
+    application.add_handler(CommandHandler("language", set_language))
+    application.add_error_handler(error_handler)
+
+    metrics.QUEUE_DEPTH.set_function(application.update_queue.qsize, bot=BOT_NAME, queue="updates")
+    metrics.QUEUE_DEPTH.set_function(meal_schedule.count, bot=BOT_NAME, queue="meal_reminders")
+    return application
+
 def main() -> None:
     """Run the bot."""
     try:
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-        
-        conv_handler = ConversationHandler(
-            entry_points=[CommandHandler("start", start)],
-            states={
-                NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, name)],
-                DIET_TYPE: [MessageHandler(filters.TEXT & ~filters.COMMAND, diet_type)],
-                MEAL_PREFS: [MessageHandler(filters.TEXT & ~filters.COMMAND, meal_prefs)],
-                SPICE_LEVEL: [MessageHandler(filters.TEXT & ~filters.COMMAND, spice_level)],
-                ALLERGIES: [MessageHandler(filters.TEXT & ~filters.COMMAND, allergies)],
-                CHRONIC_DISEASE: [MessageHandler(filters.TEXT & ~filters.COMMAND, chronic_disease)],
-                PHOTO_HANDLER: [
-                    MessageHandler(filters.PHOTO, handle_photo),
-                    CommandHandler("done", done)
-                ],
-                INGREDIENTS_INPUT: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, process_ingredients),
-                    CommandHandler("done", done)
-                ],
-            },
-            fallbacks=[CommandHandler("cancel", lambda update, context: update.message.reply_text("Operation cancelled."))],
-        )
-        
-        application.add_handler(conv_handler)
-        application.add_error_handler(error_handler)
+        application = build_application()
+        metrics.start_metrics_server(METRICS_PORT)
+        upload_queue.start()
         
         logger.info("Starting bot...")
         application.run_polling()
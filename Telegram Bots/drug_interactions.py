@@ -0,0 +1,293 @@
+"""Drug-drug interaction checks for a chat's medicines.
+
+The bundled interaction list (data/drug_interactions.txt) is compiled into
+a sparse pair index (data/drug_interactions.idx) that is memory-mapped at
+startup. Names resolve to drug ids through a sorted term table (generic
+names, plus brands that map to one or more generics), and each interacting
+pair of ids is one key in a sorted array, so checking a new medicine
+against k others is k binary searches.
+
+File layout, all integers little-endian uint32:
+    header      magic "DRIA", version, term count, drug count, pair count, note count
+    term_offs   (terms + 1) offsets into the term blob, terms sorted
+    term_drugs  (terms + 1) offsets into term_ids
+    term_ids    drug ids per term
+    drug_offs   (drugs + 1) offsets into the drug name blob
+    pair_keys   sorted (lower id << 16 | higher id)
+    pair_info   severity rank << 24 | note id, per pair
+    note_offs   (notes + 1) offsets into the note blob
+    blobs       terms, drug names, notes; UTF-8
+"""
+import os
+import sys
+import mmap
+import array
+import struct
+import bisect
+import logging
+from typing import NamedTuple
+
+import metrics
+from drug_lexicon import WORD_RE, normalize
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_FILE = os.path.join(BASE_DIR, "data", "drug_interactions.txt")
+INDEX_FILE = os.path.join(BASE_DIR, "data", "drug_interactions.idx")
+
+MAGIC = b"DRIA"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIII")
+MAX_DRUGS = 1 << 16
+
+# Ranked, so higher is worse
+SEVERITIES = ("minor", "moderate", "major")
+
+INTERACTIONS_FOUND = metrics.REGISTRY.counter(
+    "drug_interactions_found_total", "Interactions flagged when reminders were set, by severity"
+)
+
+
+class Interaction(NamedTuple):
+    first: str  # medicine names as the user's reminders have them
+    second: str
+    severity: str
+    note: str
+
+
+def read_source(path: str = SOURCE_FILE):
+    """(aliases {name: [generics]}, pairs [(drug, drug, severity, note)]) from the interaction list"""
+    aliases = {}
+    pairs = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "|" in line:
+                fields = [field.strip() for field in line.split("|")]
+                if len(fields) != 4 or fields[2] not in SEVERITIES or not fields[0] or not fields[1]:
+                    raise ValueError(f"{path}:{number}: expected 'drug | drug | severity | note'")
+                pairs.append(tuple(fields))
+            elif "=" in line:
+                name, generics = line.split("=", 1)
+                aliases[name.strip()] = [g.strip() for g in generics.split(",") if g.strip()]
+            else:
+                raise ValueError(f"{path}:{number}: expected a pair or an alias")
+    return aliases, pairs
+
+
+def _u32(values) -> bytes:
+    part = array.array("I", values)
+    if sys.byteorder != "little":
+        part.byteswap()
+    return part.tobytes()
+
+
+def _blob(strings):
+    blob = bytearray()
+    offsets = [0]
+    for text in strings:
+        blob += text.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+def build_index(source: str = SOURCE_FILE, target: str = INDEX_FILE) -> int:
+    """Compile the interaction list into the binary pair index; returns the pair count"""
+    aliases, pairs = read_source(source)
+
+    drugs = []
+    drug_ids = {}
+
+    def drug_id(name):
+        key = normalize(name)
+        if key not in drug_ids:
+            drug_ids[key] = len(drugs)
+            drugs.append(name)
+        return drug_ids[key]
+
+    entries = {}
+    for first, second, severity, note in pairs:
+        a, b = sorted((drug_id(first), drug_id(second)))
+        if a == b:
+            raise ValueError(f"{source}: {first} is paired with itself")
+        previous = entries.get((a, b))
+        # A pair listed twice keeps its most severe entry
+        if previous is None or SEVERITIES.index(severity) > SEVERITIES.index(previous[0]):
+            entries[(a, b)] = (severity, note)
+
+    terms = {normalize(name): (drug_id,) for name, drug_id in drug_ids.items()}
+    for name, generics in aliases.items():
+        key = normalize(name)
+        if key in terms:
+            raise ValueError(f"{source}: alias {name} is also a drug name")
+        terms[key] = tuple(drug_id(generic) for generic in generics)
+    if len(drugs) > MAX_DRUGS:
+        raise ValueError(f"{source}: more than {MAX_DRUGS} drugs")
+
+    sorted_terms = sorted(terms)
+    term_offs, term_blob = _blob(sorted_terms)
+    term_drugs, term_ids = [0], []
+    for term in sorted_terms:
+        term_ids.extend(terms[term])
+        term_drugs.append(len(term_ids))
+    drug_offs, drug_blob = _blob(drugs)
+
+    notes = []
+    note_ids = {}
+    pair_keys, pair_info = [], []
+    for a, b in sorted(entries):
+        severity, note = entries[(a, b)]
+        if note not in note_ids:
+            note_ids[note] = len(notes)
+            notes.append(note)
+        pair_keys.append(a << 16 | b)
+        pair_info.append(SEVERITIES.index(severity) << 24 | note_ids[note])
+    note_offs, note_blob = _blob(notes)
+
+    tmp_path = target + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(sorted_terms), len(drugs), len(pair_keys), len(notes)))
+        for part in (term_offs, term_drugs, term_ids, drug_offs, pair_keys, pair_info, note_offs):
+            file.write(_u32(part))
+        for blob in (term_blob, drug_blob, note_blob):
+            file.write(blob)
+    os.replace(tmp_path, target)
+    return len(pair_keys)
+
+
+class InteractionIndex:
+    """Read-only view over a memory-mapped interaction index"""
+
+    def __init__(self, path: str = INDEX_FILE):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_terms, self.drug_count, self.size, n_notes = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a drug interaction index (version {VERSION})")
+
+        view = memoryview(self._mm)
+        offset = HEADER.size
+
+        def u32_array(count):
+            nonlocal offset
+            part = view[offset:offset + count * 4].cast("I")
+            offset += count * 4
+            return part
+
+        self._n_terms = n_terms
+        self._term_offs = u32_array(n_terms + 1)
+        self._term_drugs = u32_array(n_terms + 1)
+        self._term_ids = u32_array(self._term_drugs[n_terms])
+        self._drug_offs = u32_array(self.drug_count + 1)
+        self._pair_keys = u32_array(self.size)
+        self._pair_info = u32_array(self.size)
+        self._note_offs = u32_array(n_notes + 1)
+        self._term_start = offset
+        self._drug_start = self._term_start + self._term_offs[n_terms]
+        self._note_start = self._drug_start + self._drug_offs[self.drug_count]
+        self._cache = {}
+
+    def _text(self, start: int, offsets, i: int) -> str:
+        return self._mm[start + offsets[i]:start + offsets[i + 1]].decode("utf-8")
+
+    def drug_name(self, drug_id: int) -> str:
+        return self._text(self._drug_start, self._drug_offs, drug_id)
+
+    def _term_drug_ids(self, key: str) -> tuple:
+        encoded = key.encode("utf-8")
+        lo, hi = 0, self._n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self._term_start + self._term_offs[mid]
+            term = self._mm[start:self._term_start + self._term_offs[mid + 1]]
+            if term < encoded:
+                lo = mid + 1
+            elif term > encoded:
+                hi = mid
+            else:
+                return tuple(self._term_ids[self._term_drugs[mid]:self._term_drugs[mid + 1]])
+        return ()
+
+    def drugs(self, name: str) -> tuple:
+        """Drug ids for a medicine name ("Tab Combiflam 400" -> ibuprofen, paracetamol)"""
+        ids = []
+        for word in WORD_RE.findall(name):
+            key = normalize(word)
+            if key not in self._cache:
+                if len(self._cache) >= 50_000:
+                    self._cache.clear()
+                self._cache[key] = self._term_drug_ids(key)
+            ids.extend(drug_id for drug_id in self._cache[key] if drug_id not in ids)
+        return tuple(ids)
+
+    def pair(self, a: int, b: int):
+        """(severity, note) for two drug ids, or None"""
+        if a > b:
+            a, b = b, a
+        key = a << 16 | b
+        i = bisect.bisect_left(self._pair_keys, key)
+        if i == self.size or self._pair_keys[i] != key:
+            return None
+        info = self._pair_info[i]
+        return SEVERITIES[info >> 24], self._text(self._note_start, self._note_offs, info & 0xFFFFFF)
+
+    def check(self, new_medicines, active_medicines=()):
+        """Interactions of new medicines with each other and with the active ones, worst first.
+
+        Medicines are matched by name case-insensitively, so a new entry for
+        a medicine already active replaces it rather than pairing with it.
+        """
+        new = {}
+        for name in new_medicines:
+            new.setdefault(name.strip().lower(), (name.strip(), self.drugs(name)))
+        others = [(name.strip(), self.drugs(name)) for name in active_medicines
+                  if name.strip().lower() not in new]
+        new = list(new.values())
+
+        found = []
+        seen = set()
+        for i, (name, ids) in enumerate(new):
+            for other, other_ids in new[i + 1:] + others:
+                for a in ids:
+                    for b in other_ids:
+                        if a == b:
+                            continue
+                        key = (min(a, b), max(a, b))
+                        result = self.pair(a, b)
+                        if result and key not in seen:
+                            seen.add(key)
+                            found.append(Interaction(name, other, *result))
+        found.sort(key=lambda interaction: -SEVERITIES.index(interaction.severity))
+        for interaction in found:
+            INTERACTIONS_FOUND.inc(severity=interaction.severity)
+        return found
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def load_index(path: str = INDEX_FILE, source: str = SOURCE_FILE):
+    """Map the index, rebuilding it first if it is missing or older than the interaction list"""
+    try:
+        if not os.path.exists(path) or (
+            os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(path)
+        ):
+            count = build_index(source, path)
+            logger.info(f"Built drug interaction index with {count} pairs")
+        return InteractionIndex(path)
+    except Exception as e:
+        logger.error(f"Drug interaction index unavailable: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        print(f"Indexed {build_index()} interactions into {INDEX_FILE}")
+    else:
+        index = load_index()
+        for interaction in index.check(sys.argv[1:]):
+            print(f"{interaction.severity}: {interaction.first} + {interaction.second} - {interaction.note}")
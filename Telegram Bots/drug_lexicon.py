@@ -0,0 +1,229 @@
+"""Fuzzy drug-name lexicon for correcting OCR output.
+
+The bundled name list (data/drug_names.txt) is compiled into a compact
+trigram index (data/drug_names.idx) that is memory-mapped at startup, so
+lookups touch only the postings for a token's trigrams.
+
+File layout, all integers little-endian uint32:
+    header      magic "DRGX", version, name count, trigram count
+    name_offs   (names + 1) offsets into the name blob
+    tri_keys    sorted trigram keys
+    tri_offs    (trigrams + 1) offsets into postings
+    postings    name ids per trigram
+    name blob   UTF-8 canonical names
+"""
+import os
+import re
+import sys
+import mmap
+import array
+import struct
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_FILE = os.path.join(BASE_DIR, "data", "drug_names.txt")
+INDEX_FILE = os.path.join(BASE_DIR, "data", "drug_names.idx")
+
+MAGIC = b"DRGX"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")
+
+WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+
+# Words OCR produces constantly that must never be "corrected" into drug names
+COMMON_WORDS = {
+    "tablet", "tablets", "capsule", "capsules", "daily", "twice", "thrice", "once", "morning",
+    "night", "evening", "after", "before", "food", "meals", "days", "weeks", "patient", "doctor",
+    "date", "name", "hospital", "clinic", "take", "with", "water", "syrup", "dose", "times",
+}
+
+
+def normalize(word: str) -> str:
+    return "".join(ch for ch in word.lower() if ch.isalnum())
+
+
+def trigrams(word: str):
+    padded = f"$${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _trigram_key(trigram: str) -> int:
+    data = trigram.encode("ascii", "replace")[:3].ljust(3, b"$")
+    return (data[0] << 16) | (data[1] << 8) | data[2]
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up early once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        best = i
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            current.append(cost)
+            best = min(best, cost)
+        if best > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def read_names(path: str = SOURCE_FILE):
+    names = []
+    seen = set()
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            name = line.strip()
+            if not name or name.startswith("#"):
+                continue
+            key = normalize(name)
+            if key and key not in seen:
+                seen.add(key)
+                names.append(name)
+    return names
+
+
+def build_index(source: str = SOURCE_FILE, target: str = INDEX_FILE) -> int:
+    """Compile the name list into the binary trigram index; returns the name count"""
+    names = read_names(source)
+    postings = {}
+    for name_id, name in enumerate(names):
+        for trigram in trigrams(normalize(name)):
+            postings.setdefault(_trigram_key(trigram), []).append(name_id)
+
+    blob = bytearray()
+    name_offs = array.array("I", [0])
+    for name in names:
+        blob += name.encode("utf-8")
+        name_offs.append(len(blob))
+
+    tri_keys = array.array("I", sorted(postings))
+    tri_offs = array.array("I", [0])
+    flat = array.array("I")
+    for key in tri_keys:
+        flat.extend(postings[key])
+        tri_offs.append(len(flat))
+
+    tmp_path = target + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(names), len(tri_keys)))
+        for part in (name_offs, tri_keys, tri_offs, flat):
+            if sys.byteorder != "little":
+                part.byteswap()
+            file.write(part.tobytes())
+        file.write(bytes(blob))
+    os.replace(tmp_path, target)
+    return len(names)
+
+
+class DrugLexicon:
+    """Read-only view over a memory-mapped drug-name index"""
+
+    def __init__(self, path: str = INDEX_FILE):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, n_trigrams = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a drug lexicon index (version {VERSION})")
+
+        view = memoryview(self._mm)
+        offset = HEADER.size
+
+        def u32_array(count):
+            nonlocal offset
+            part = view[offset:offset + count * 4].cast("I")
+            offset += count * 4
+            return part
+
+        self._name_offs = u32_array(self.size + 1)
+        self._tri_keys = u32_array(n_trigrams)
+        self._tri_offs = u32_array(n_trigrams + 1)
+        self._postings = u32_array(self._tri_offs[n_trigrams] if n_trigrams else 0)
+        self._blob_start = offset
+        self._cache = {}
+
+    def name(self, name_id: int) -> str:
+        start = self._blob_start + self._name_offs[name_id]
+        end = self._blob_start + self._name_offs[name_id + 1]
+        return self._mm[start:end].decode("utf-8")
+
+    def _candidates(self, word: str):
+        counts = {}
+        for trigram in trigrams(word):
+            key = _trigram_key(trigram)
+            i = bisect.bisect_left(self._tri_keys, key)
+            if i < len(self._tri_keys) and self._tri_keys[i] == key:
+                for name_id in self._postings[self._tri_offs[i]:self._tri_offs[i + 1]]:
+                    counts[name_id] = counts.get(name_id, 0) + 1
+        return sorted(counts.items(), key=lambda item: -item[1])[:20]
+
+    def lookup(self, word: str):
+        """Canonical drug name for an (OCR-mangled) word, or None"""
+        key = normalize(word)
+        if key in self._cache:
+            return self._cache[key]
+        result = None
+        if len(key) >= 3 and key not in COMMON_WORDS:
+            limit = 0 if len(key) < 5 else (1 if len(key) < 8 else 2)
+            best_distance = limit + 1
+            for name_id, _ in self._candidates(key):
+                candidate = self.name(name_id)
+                distance = edit_distance(key, normalize(candidate), limit)
+                if distance < best_distance:
+                    result, best_distance = candidate, distance
+                    if distance == 0:
+                        break
+        if len(self._cache) < 50_000:
+            self._cache[key] = result
+        return result
+
+    def canonical(self, name: str) -> str:
+        """Canonicalise a medicine name word by word, keeping unknown words as-is"""
+        return WORD_RE.sub(lambda m: self.lookup(m.group(0)) or m.group(0), name.strip())
+
+    def correct_text(self, text: str):
+        """Replace near-miss drug names in OCR text; returns (text, corrections)"""
+        corrections = 0
+
+        def replace(match):
+            nonlocal corrections
+            word = match.group(0)
+            canonical = self.lookup(word)
+            if canonical and canonical.lower() != word.lower():
+                corrections += 1
+                return canonical
+            return word
+
+        return WORD_RE.sub(replace, text), corrections
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def load_lexicon(path: str = INDEX_FILE, source: str = SOURCE_FILE):
+    """Map the index, rebuilding it first if it is missing or older than the name list"""
+    try:
+        if not os.path.exists(path) or (
+            os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(path)
+        ):
+            count = build_index(source, path)
+            logger.info(f"Built drug lexicon index with {count} names")
+        return DrugLexicon(path)
+    except Exception as e:
+        logger.error(f"Drug lexicon unavailable: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        print(f"Indexed {build_index()} names into {INDEX_FILE}")
+    else:
+        lexicon = load_lexicon()
+        for word in sys.argv[1:]:
+            print(f"{word} -> {lexicon.lookup(word)}")
@@ -0,0 +1,129 @@
+"""Backends that turn an uploaded photo into an analysed document.
+
+OcrBackend reads the text with EasyOCR on our CPUs and hands it to the
+document's text analyser (a text-only Gemini call, or a local parser).
+MultimodalBackend sends the image itself to a multimodal model in a single
+request, so the only local work is the upload.
+
+Each bot picks a mode with EXTRACTION_BACKEND_<BOT>: "ocr", "multimodal"
+or "auto". Auto sends large images, and every image while the upload queue
+is backed up, to the multimodal model and keeps the rest on OCR. A
+multimodal request that fails or returns nothing usable falls back to OCR.
+"""
+import os
+import time
+import logging
+from typing import Callable, NamedTuple, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OCR, MULTIMODAL, AUTO = "ocr", "multimodal", "auto"
+MODES = (OCR, MULTIMODAL, AUTO)
+# auto: images with at least this many pixels skip local OCR...
+MULTIMODAL_MIN_PIXELS = int(os.getenv("MULTIMODAL_MIN_PIXELS", "6000000"))
+# ...and so does everything while this many uploads are waiting for a worker
+MULTIMODAL_QUEUE_DEPTH = int(os.getenv("MULTIMODAL_QUEUE_DEPTH", "4"))
+
+EXTRACTIONS = metrics.REGISTRY.counter("document_extractions_total", "Uploaded documents extracted, by backend")
+EXTRACTION_FALLBACKS = metrics.REGISTRY.counter(
+    "document_extraction_fallbacks_total", "Multimodal extractions that fell back to OCR"
+)
+EXTRACTION_SECONDS = metrics.REGISTRY.histogram(
+    "document_extraction_seconds", "End-to-end time to read and analyse an uploaded document",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60),
+)
+
+
+class DocumentType(NamedTuple):
+    """How one kind of document is analysed"""
+    name: str
+    joiner: str  # joins OCR fragments
+    from_text: Callable  # OCR text -> result
+    from_image: Callable  # (image bytes, mime type) -> (text, result); text may be ""
+    clean: Optional[Callable] = None  # OCR text -> corrected text, before analysis
+
+
+class Photo(NamedTuple):
+    data: bytes  # encoded, as uploaded
+    image: object  # decoded RGB array
+    mime_type: str
+    languages: tuple  # EasyOCR language list
+
+
+class Extraction(NamedTuple):
+    text: str  # what was read; "" when the model didn't transcribe it
+    result: object  # None when nothing could be read
+    backend: str
+
+
+def mime_type(extension: str) -> str:
+    return "image/png" if extension.lower() == "png" else "image/jpeg"
+
+
+def choose_backend(mode: str, photo: Photo, queue_depth: int = 0) -> str:
+    if mode != AUTO:
+        return mode
+    shape = getattr(photo.image, "shape", None)
+    pixels = shape[0] * shape[1] if shape else 0
+    if pixels >= MULTIMODAL_MIN_PIXELS or queue_depth >= MULTIMODAL_QUEUE_DEPTH:
+        return MULTIMODAL
+    return OCR
+
+
+class OcrBackend:
+    name = OCR
+
+    def __init__(self, readers, bot: str):
+        self.readers = readers
+        self.bot = bot
+
+    def extract(self, document: DocumentType, photo: Photo) -> Extraction:
+        with metrics.track(metrics.OCR_SECONDS, metrics.OCR_ERRORS, bot=self.bot, document=document.name):
+            with self.readers.use(photo.languages) as reader:
+                text = document.joiner.join(reader.readtext(photo.image, detail=0))
+        if not text.strip():
+            return Extraction("", None, self.name)
+        if document.clean:
+            text = document.clean(text)
+        return Extraction(text, document.from_text(text), self.name)
+
+
+class MultimodalBackend:
+    name = MULTIMODAL
+
+    def extract(self, document: DocumentType, photo: Photo) -> Extraction:
+        text, result = document.from_image(photo.data, photo.mime_type)
+        return Extraction(text or "", result, self.name)
+
+
+class Extractor:
+    def __init__(self, bot: str, mode: str, readers):
+        if mode not in MODES:
+            logger.error(f"Unknown extraction backend {mode!r}, using {OCR}")
+            mode = OCR
+        self.bot = bot
+        self.mode = mode
+        self.backends = {OCR: OcrBackend(readers, bot), MULTIMODAL: MultimodalBackend()}
+
+    def extract(self, document: DocumentType, photo: Photo, queue_depth: int = 0) -> Extraction:
+        backend = choose_backend(self.mode, photo, queue_depth)
+        if backend == MULTIMODAL:
+            try:
+                extraction = self._run(MULTIMODAL, document, photo)
+                if extraction.result is not None:
+                    return extraction
+                logger.warning(f"Multimodal {document.name} extraction returned nothing, falling back to OCR")
+            except Exception as e:
+                logger.error(f"Multimodal {document.name} extraction failed, falling back to OCR: {e}")
+            EXTRACTION_FALLBACKS.inc(bot=self.bot, document=document.name)
+        return self._run(OCR, document, photo)
+
+    def _run(self, backend: str, document: DocumentType, photo: Photo) -> Extraction:
+        start = time.perf_counter()
+        try:
+            return self.backends[backend].extract(document, photo)
+        finally:
+            EXTRACTIONS.inc(bot=self.bot, backend=backend, document=document.name)
+            EXTRACTION_SECONDS.observe(time.perf_counter() - start, bot=self.bot, backend=backend)
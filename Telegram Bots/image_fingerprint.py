@@ -0,0 +1,73 @@
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class FingerprintIndex:
+    """Per-chat index of processed photos, by Telegram file_unique_id and exact SHA-256.
+
+    Each entry keeps the OCR text and analysis result, so a repeat upload
+    can be answered without downloading, OCR or Gemini work. Only
+    byte-identical photos match: reports or prescriptions on the same
+    letterhead or pad look alike, so a near match can't be trusted.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS photo_fingerprints ("
+                " chat_id TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " sha256 TEXT NOT NULL,"
+                " file_unique_id TEXT,"
+                " ocr_text TEXT,"
+                " result TEXT,"
+                " created_at REAL,"
+                " PRIMARY KEY (chat_id, kind, sha256))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_photo_fingerprints_file ON photo_fingerprints (chat_id, kind, file_unique_id)"
+            )
+
+    def _fetch(self, chat_id: str, kind: str, sha256: str):
+        row = self._conn.execute(
+            "SELECT ocr_text, result FROM photo_fingerprints WHERE chat_id = ? AND kind = ? AND sha256 = ?",
+            (chat_id, kind, sha256),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"ocr_text": row[0], "result": json.loads(row[1]) if row[1] else None}
+
+    def find_by_file_id(self, chat_id, kind: str, file_unique_id: str):
+        """Telegram keeps file_unique_id for re-sent or forwarded files, so this needs no download"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256 FROM photo_fingerprints WHERE chat_id = ? AND kind = ? AND file_unique_id = ?",
+                (str(chat_id), kind, file_unique_id),
+            ).fetchone()
+            return self._fetch(str(chat_id), kind, row[0]) if row else None
+
+    def find_exact(self, chat_id, kind: str, sha256: str):
+        with self._lock:
+            return self._fetch(str(chat_id), kind, sha256)
+
+    def store(self, chat_id, kind: str, sha256: str, file_unique_id, ocr_text: str, result):
+        chat_id = str(chat_id)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO photo_fingerprints"
+                " (chat_id, kind, sha256, file_unique_id, ocr_text, result, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (chat_id, kind, sha256, file_unique_id, ocr_text, json.dumps(result), time.time()),
+            )
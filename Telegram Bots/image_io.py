@@ -0,0 +1,22 @@
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def decode_image(buffer):
+    """Decode downloaded image bytes straight into an RGB array, or None.
+
+    np.frombuffer wraps bytes/bytearray/memoryview without copying, so the
+    only allocation is the decoded pixel array itself.
+    """
+    encoded = np.frombuffer(memoryview(buffer), dtype=np.uint8)
+    if encoded.size == 0:
+        return None
+    image = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    # OpenCV decodes to BGR; EasyOCR and PIL expect RGB
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
@@ -0,0 +1,53 @@
+"""Languages users can pick for OCR and spoken reminders.
+
+Each entry maps our language code to its display name, the EasyOCR
+language list to read documents with, the gTTS voice, and the spoken
+reminder phrase. Non-English readers also load English, since
+prescriptions mix local script with Latin drug names.
+"""
+
+DEFAULT_LANGUAGE = "en"
+
+LANGUAGES = {
+    "en": ("English", ("en",), "en", "Reminder: Take {medicine} {dosage}"),
+    "hi": ("हिन्दी (Hindi)", ("hi", "en"), "hi", "{medicine} लेने का समय हो गया है, {dosage}"),
+    "bn": ("বাংলা (Bengali)", ("bn", "en"), "bn", "{medicine} খাওয়ার সময় হয়েছে, {dosage}"),
+    "mr": ("मराठी (Marathi)", ("mr", "en"), "mr", "{medicine} घेण्याची वेळ झाली आहे, {dosage}"),
+    "ta": ("தமிழ் (Tamil)", ("ta", "en"), "ta", "{medicine} எடுத்துக்கொள்ள வேண்டிய நேரம், {dosage}"),
+    "te": ("తెలుగు (Telugu)", ("te", "en"), "te", "{medicine} వేసుకునే సమయం అయింది, {dosage}"),
+    "kn": ("ಕನ್ನಡ (Kannada)", ("kn", "en"), "kn", "{medicine} ತೆಗೆದುಕೊಳ್ಳುವ ಸಮಯ, {dosage}"),
+    "ur": ("اردو (Urdu)", ("ur", "en"), "ur", "{medicine} لینے کا وقت ہو گیا ہے، {dosage}"),
+    "ar": ("العربية (Arabic)", ("ar", "en"), "ar", "حان وقت تناول {medicine}، {dosage}"),
+    "es": ("Español (Spanish)", ("es", "en"), "es", "Es hora de tomar {medicine}, {dosage}"),
+    "fr": ("Français (French)", ("fr", "en"), "fr", "C'est l'heure de prendre {medicine}, {dosage}"),
+    "de": ("Deutsch (German)", ("de", "en"), "de", "Zeit, {medicine} einzunehmen, {dosage}"),
+    "pt": ("Português (Portuguese)", ("pt", "en"), "pt", "Hora de tomar {medicine}, {dosage}"),
+}
+
+
+def resolve_language(value: str):
+    """Language code for a code or English name ("hi", "Hindi"), or None"""
+    value = value.strip().lower()
+    if value in LANGUAGES:
+        return value
+    for code, (name, _, _, _) in LANGUAGES.items():
+        if value == name.lower() or f"({value})" in name.lower():
+            return code
+    return None
+
+
+def ocr_languages(code) -> tuple:
+    return LANGUAGES.get(code or DEFAULT_LANGUAGE, LANGUAGES[DEFAULT_LANGUAGE])[1]
+
+
+def tts_language(code) -> str:
+    return LANGUAGES.get(code or DEFAULT_LANGUAGE, LANGUAGES[DEFAULT_LANGUAGE])[2]
+
+
+def spoken_reminder(code, medicine: str, dosage: str) -> str:
+    phrase = LANGUAGES.get(code or DEFAULT_LANGUAGE, LANGUAGES[DEFAULT_LANGUAGE])[3]
+    return phrase.format(medicine=medicine, dosage=dosage or "").rstrip(", ،")
+
+
+def menu() -> str:
+    return "\n".join(f"{code} – {name}" for code, (name, _, _, _) in LANGUAGES.items())
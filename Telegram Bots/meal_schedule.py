@@ -0,0 +1,62 @@
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class MealScheduleStore:
+    """Persistent meal reminders, one row per (chat, meal).
+
+    The bot schedules one daily job per distinct reminder time rather than
+    per user; each job reads the chats due at its time from here, so adding
+    a user costs one upsert no matter how many users there are.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meal_reminders ("
+                " chat_id INTEGER NOT NULL,"
+                " meal TEXT NOT NULL,"
+                " remind_at TEXT NOT NULL,"
+                " meal_name TEXT,"
+                " PRIMARY KEY (chat_id, meal))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_meal_reminders_time ON meal_reminders (remind_at)"
+            )
+
+    def set_reminders(self, chat_id: int, meals) -> None:
+        """Replace a chat's reminders with [(meal, "HH:MM", meal name)]"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM meal_reminders WHERE chat_id = ?", (chat_id,))
+            self._conn.executemany(
+                "INSERT INTO meal_reminders (chat_id, meal, remind_at, meal_name) VALUES (?, ?, ?, ?)",
+                [(chat_id, meal, remind_at, meal_name) for meal, remind_at, meal_name in meals],
+            )
+
+    def cancel(self, chat_id: int) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM meal_reminders WHERE chat_id = ?", (chat_id,)).rowcount
+
+    def times(self):
+        """Distinct "HH:MM" reminder times that have at least one chat"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT remind_at FROM meal_reminders ORDER BY remind_at"
+            )]
+
+    def due_at(self, remind_at: str):
+        """[(chat_id, meal, meal name)] for every reminder at remind_at"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT chat_id, meal, meal_name FROM meal_reminders WHERE remind_at = ?", (remind_at,)
+            ).fetchall()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM meal_reminders").fetchone()[0]
@@ -1,20 +1,46 @@
 import telebot
 import easyocr
 import cv2
-import numpy as np
-from PIL import Image
 import os
+import sys
 import json
 import time
-import re
 import uuid
 import logging
+import calendar
+import socket
+import threading
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import google.generativeai as genai
-from telebot.types import ReplyKeyboardMarkup, KeyboardButton
+from telebot.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from gtts import gTTS
 import shutil
+import tempfile
+import metrics
+import profiling
+import prompts
+import resilience
+import structured_output
+import sig_parser
+import drug_lexicon
+import drug_interactions
+from structured_output import PrescriptionResult, MedicalReport
+from medical_search import MedicalSearchIndex, best_snippet
+from report_store import ReportStore
+from image_fingerprint import FingerprintIndex, content_hash
+from image_io import decode_image
+from reminder_store import ReminderStore, resolve_timezone, parse_clock, utc_now, TIME_FORMAT
+import adherence
+from adherence import AdherenceStore
+import work_queue
+from work_queue import ChatWorkQueue
+import languages
+import data_export
+from model_cache import ModelCache
+import extraction
+from extraction import Extractor, DocumentType, Photo, Extraction
+from update_ledger import UpdateLedger
 
 # Configure logging
 logging.basicConfig(
@@ -28,36 +54,131 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN_MED")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY_MED")
+METRICS_PORT = int(os.getenv("METRICS_PORT_MED", "9101"))
+BOT_NAME = "med_remind"
+# Optional overrides so the bot can run against local stand-ins (see bench/loadtest.py)
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE")
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE")
+# Ask Gemini for schema-constrained JSON instead of parsing free text
+STRUCTURED_OUTPUT = os.getenv("GEMINI_STRUCTURED_OUTPUT", "1") != "0"
+# Local sig parses at or above this confidence skip the Gemini call
+LOCAL_PARSE_MIN_CONFIDENCE = float(os.getenv("LOCAL_PARSE_MIN_CONFIDENCE", sig_parser.MIN_CONFIDENCE))
+
+# Keep uploaded photos on disk under prescriptions/ and medical_records/ (off by default)
+ARCHIVE_UPLOADS = os.getenv("ARCHIVE_UPLOADS", "0") == "1"
+
+PRESCRIPTION_PARSES = metrics.REGISTRY.counter(
+    "prescription_parse_total", "Prescriptions analysed, by path (local or gemini)"
+)
+DRUG_NAME_CORRECTIONS = metrics.REGISTRY.counter(
+    "ocr_drug_name_corrections_total", "OCR words replaced by a canonical drug name"
+)
+REMINDER_PARTITIONS_OWNED = metrics.REGISTRY.gauge(
+    "reminder_partitions_owned", "Reminder partitions leased by this process's workers"
+)
+PHOTO_DEDUP_HITS = metrics.REGISTRY.counter(
+    "photo_dedup_hits_total", "Uploaded photos answered from a stored analysis, by match type"
+)
 
 # Validate environment variables
 if not TELEGRAM_TOKEN or not GEMINI_API_KEY:
     logger.error("Missing environment variables. Please check your .env file.")
     raise ValueError("Telegram Token or Gemini API Key is missing")
 
-bot = telebot.TeleBot(TELEGRAM_TOKEN, threaded=False)
+if TELEGRAM_API_BASE:
+    telebot.apihelper.API_URL = TELEGRAM_API_BASE + "/bot{0}/{1}"
+    telebot.apihelper.FILE_URL = TELEGRAM_API_BASE + "/file/bot{0}/{1}"
+
+if profiling.ENABLED:
+    # Time Bot API calls as their own stage in the slow-request log
+    telebot.apihelper.CUSTOM_REQUEST_SENDER = profiling.timed_request_sender
+
+class LedgerTeleBot(telebot.TeleBot):
+    """TeleBot that handles each update once, across restarts too (see update_ledger)"""
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            # Skipped updates still have to be confirmed, or polling would fetch them forever
+            self.last_update_id = max(self.last_update_id, update.update_id)
+            if not update_ledger.begin(update.update_id):
+                continue
+            with update_ledger.dispatch(update.update_id):
+                super().process_new_updates([update])
+
+bot = LedgerTeleBot(TELEGRAM_TOKEN, threaded=False)
 
 # File paths
 REMINDER_FILE = "medicine_reminders.json"
 MEDICAL_RECORDS_FILE = "user_medical_records.json"
 BACKUP_DIR = "backups"
-
-# Define standard meal times
+STATE_DB = "med_remind.db"
+# Reminder state shared by every worker; point all instances at the same file
+REMINDER_DB = os.getenv("REMINDER_DB", STATE_DB)
+REMINDER_PARTITIONS = int(os.getenv("REMINDER_PARTITIONS", "16"))
+REMINDER_LEASE_SECONDS = int(os.getenv("REMINDER_LEASE_SECONDS", "90"))
+# Reminder worker threads in this process (0 runs a bot-only instance)
+REMINDER_WORKERS = int(os.getenv("REMINDER_WORKERS", "1"))
+REMINDER_POLL_SECONDS = 20
+# How far back a poll still sends due reminders. A dead worker's partitions are only taken
+# over once its lease lapses and another worker polls, so a shorter window loses those doses
+REMINDER_CATCHUP_SECONDS = REMINDER_LEASE_SECONDS + 2 * REMINDER_POLL_SECONDS
+# Reminders sent more than this after their time are marked late
+REMINDER_LATE_SECONDS = 60
+SNOOZE_MINUTES = 15
+RECORDS_PAGE_SIZE = 5
+# Threads shared by every chat's OCR/Gemini jobs, and the per-chat upload limit
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+UPLOAD_RATE_LIMIT = int(os.getenv("UPLOAD_RATE_LIMIT", "5"))  # per minute
+# Memory allowed for loaded OCR language models, and how long an unused one is kept
+OCR_MEMORY_BUDGET_MB = float(os.getenv("OCR_MEMORY_BUDGET_MB", "1024"))
+OCR_MODEL_IDLE_SECONDS = float(os.getenv("OCR_MODEL_IDLE_SECONDS", "1800"))
+# How photos are read: "ocr" (EasyOCR, then text-only Gemini), "multimodal" (the image to Gemini) or "auto"
+EXTRACTION_BACKEND = os.getenv("EXTRACTION_BACKEND_MED", extraction.OCR)
+
+# Timezone for users who haven't set one with /timezone (empty: the server's local time)
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE")
+
+# Default meal times, in each user's own timezone; /mealtimes overrides them per user
 MEAL_TIMES = {
     "morning": "08:00:00",  # After breakfast
     "afternoon": "13:00:00",  # After lunch
-    "night": "20:00:00"  # After dinner
+    "night": "20:00:00",  # After dinner
+    "bedtime": "22:00:00"  # Fourth dose for QID / q6h
 }
 
 # Create necessary directories
-os.makedirs('medical_records', exist_ok=True)
-os.makedirs('prescriptions', exist_ok=True)
 os.makedirs('reminders_audio', exist_ok=True)
 os.makedirs(BACKUP_DIR, exist_ok=True)
 
+# Per-chat full-text index over stored reports, built lazily on first search
+search_index = MedicalSearchIndex()
+
+# Memory-mapped drug-name index used to repair OCR'd names (None if unavailable)
+drug_names = drug_lexicon.load_lexicon()
+
+# Memory-mapped interaction pairs checked when reminders are set (None if unavailable)
+interaction_index = drug_interactions.load_index()
+
+# EasyOCR readers by language list, loaded on demand and evicted when idle or over budget
+ocr_readers = ModelCache(
+    "ocr", lambda langs: easyocr.Reader(list(langs)),
+    budget_mb=OCR_MEMORY_BUDGET_MB, idle_seconds=OCR_MODEL_IDLE_SECONDS,
+)
+extractor = Extractor(BOT_NAME, EXTRACTION_BACKEND, ocr_readers)
+
+# Fingerprints of processed photos, so re-sent documents skip OCR and Gemini
+photo_index = FingerprintIndex(STATE_DB)
+
+# Updates already handled, so ones redelivered after a restart aren't processed twice
+update_ledger = UpdateLedger(STATE_DB, BOT_NAME)
+
+# One expensive job per chat at a time, shared fairly between chats
+upload_queue = ChatWorkQueue("uploads", workers=UPLOAD_WORKERS, max_jobs=UPLOAD_RATE_LIMIT, per_seconds=60)
+
 def backup_data():
     try:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        for filename in [REMINDER_FILE, MEDICAL_RECORDS_FILE]:
+        for filename in [MEDICAL_RECORDS_FILE]:
             if os.path.exists(filename):
                 backup_path = os.path.join(BACKUP_DIR, f"{os.path.basename(filename)}.bak_{timestamp}")
                 shutil.copyfile(filename, backup_path)
@@ -68,7 +189,7 @@ def backup_data():
 def load_json_data(filename):
     try:
         if os.path.exists(filename):
-            with open(filename, 'r') as file:
+            with profiling.stage("file_io"), open(filename, 'r') as file:
                 data = json.load(file)
                 if data is None:  # Handle empty files
                     return []
@@ -89,7 +210,7 @@ def save_json_data(data, filename, append=False):
                 existing_data.extend(data)
                 data = existing_data
         
-        with open(filename, "w") as file:
+        with profiling.stage("file_io"), open(filename, "w") as file:
             json.dump(data, file, indent=4)
         
         backup_data()
@@ -100,119 +221,258 @@ def save_json_data(data, filename, append=False):
 
 def clean_old_reminders():
     try:
-        reminders = load_json_data(REMINDER_FILE)
-        if not reminders:
-            return
-        
-        now = datetime.now()
-        cutoff = now - timedelta(days=30)  # Keep reminders for 30 days
-        
-        cleaned = [
-            r for r in reminders 
-            if datetime.strptime(r["time"], "%Y-%m-%d %H:%M:%S") > cutoff
-        ]
-        
-        if len(cleaned) < len(reminders):
-            save_json_data(cleaned, REMINDER_FILE, append=False)
-            logger.info(f"Cleaned {len(reminders) - len(cleaned)} old reminders")
+        cutoff = utc_now() - timedelta(days=30)  # Keep reminders for 30 days
+        removed = reminder_store.delete_older_than(cutoff)
+        if removed:
+            logger.info(f"Cleaned {removed} old reminders")
     except Exception as e:
         logger.error(f"Error cleaning old reminders: {e}")
 
+def configure_gemini():
+    if GEMINI_API_BASE:
+        genai.configure(api_key=GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_BASE})
+    else:
+        genai.configure(api_key=GEMINI_API_KEY)
+
+def gemini_json_model(schema):
+    configure_gemini()
+    config = structured_output.json_generation_config(schema) if STRUCTURED_OUTPUT else None
+    return genai.GenerativeModel(prompts.DEFAULT_MODEL, generation_config=config)
+
+def gemini_text(model, image=None):
+    """prompt -> text generator that runs behind the Gemini circuit breaker and update deadline.
+
+    image ({"mime_type": ..., "data": bytes}) is sent along with every prompt.
+    """
+    def generate(prompt):
+        contents = [prompt, image] if image else prompt
+        return resilience.call(
+            "gemini",
+            lambda timeout: model.generate_content(contents, request_options={"timeout": timeout}).text,
+            timeout=60,
+        )
+    return generate
+
+# Asked for in the prompt when the API isn't constraining output to a schema
+PRESCRIPTION_FORMAT_HINT = (
+    "Use exactly this structure and return only the JSON:\n"
+    '{"medicines": [{"name": "", "dosage": "", "frequency": "", "duration": ""}], "notes": ""}\n'
+)
+MEDICAL_RECORD_FORMAT_HINT = (
+    "Use exactly this structure and return only the JSON:\n"
+    '{"type": "Report type (e.g., Blood Test, X-Ray)", "date": "Report date if available", '
+    '"patient_info": "Brief patient info if present", "key_findings": ["..."], '
+    '"diagnosis": ["..."], "recommendations": ["..."], "summary": "Concise overall summary"}\n'
+)
+
 def analyze_prescription_with_gemini(text: str) -> dict:
     if not text or len(text) < 5:
         logger.warning("Insufficient prescription text")
         return {"medicines": []}
 
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-1.5-pro")
-        prompt = (
-            "Extract structured medical information from this prescription text. "
-            "Provide details in JSON format with the following structure:\n"
-            "{\n"
-            "  'medicines': [\n"
-            "    {'name': '', 'dosage': '', 'frequency': ''}\n"
-            "  ],\n"
-            "  'notes': ''\n"
-            "}\n\n"
-            "Rules:\n"
-            "1. If frequency is not clear, assume 'twice daily'\n"
-            "2. If dosage is not clear, assume '1 tablet'\n"
-            "3. Return empty array if no medicines found\n\n"
-            "Prescription Text:\n" + text
-        )
+        model = gemini_json_model(structured_output.PRESCRIPTION_SCHEMA)
+        format_hint = "" if STRUCTURED_OUTPUT else PRESCRIPTION_FORMAT_HINT
+        prompt = prompts.PRESCRIPTION.render(format_hint=format_hint, text=prompts.compact_ocr(text))
 
-        response = model.generate_content(prompt)
-        raw_response = response.text.strip()
+        result, raw_response = structured_output.generate_structured(
+            gemini_text(model),
+            prompt, PrescriptionResult, call="prescription", bot=BOT_NAME
+        )
         logger.info(f"Gemini Raw Response: {raw_response}")
 
-        # Clean the response and extract JSON
-        json_match = re.search(r'\{[\s\S]*\}', raw_response)
-        if not json_match:
-            logger.warning("No JSON found in Gemini response")
-            return {"medicines": []}
-
-        json_text = json_match.group(0)
-        # Remove markdown code blocks if present
-        json_text = re.sub(r'```json|```', '', json_text).strip()
-        
-        try:
-            result = json.loads(json_text)
-            if not isinstance(result.get("medicines", []), list):
-                result["medicines"] = []
-            return result
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON Parsing Error: {e}\nText: {json_text}")
+        if result is None:
+            logger.warning("No valid JSON found in Gemini response")
             return {"medicines": []}
+        return result.to_dict()
 
     except Exception as e:
         logger.error(f"Gemini analysis error: {e}")
         return {"medicines": []}
 
-def save_medical_record(chat_id, file_name, record_details):
+def analyze_prescription(text: str) -> dict:
+    """Parse standard sig notation locally, asking Gemini only when unsure"""
+    local_result = sig_parser.parse_prescription(text, lexicon=drug_names)
+    confidence = local_result.pop("confidence")
+    if local_result["medicines"] and confidence >= LOCAL_PARSE_MIN_CONFIDENCE:
+        PRESCRIPTION_PARSES.inc(bot=BOT_NAME, path="local")
+        logger.info(f"Parsed prescription locally (confidence {confidence})")
+        return local_result
+
+    PRESCRIPTION_PARSES.inc(bot=BOT_NAME, path="gemini")
+    return analyze_prescription_with_gemini(text)
+
+def prescription_from_image(data: bytes, mime_type: str):
+    """Medicines straight from a prescription photo in one multimodal call; returns ("", result or None)"""
+    model = gemini_json_model(structured_output.PRESCRIPTION_SCHEMA)
+    format_hint = "" if STRUCTURED_OUTPUT else PRESCRIPTION_FORMAT_HINT
+    result, raw_response = structured_output.generate_structured(
+        gemini_text(model, image={"mime_type": mime_type, "data": data}),
+        prompts.PRESCRIPTION_IMAGE.render(format_hint=format_hint),
+        PrescriptionResult, call="prescription_image", bot=BOT_NAME
+    )
+    logger.info(f"Gemini Raw Response: {raw_response}")
+    PRESCRIPTION_PARSES.inc(bot=BOT_NAME, path="gemini_image")
+    # An empty list falls back to OCR, which may still find something
+    return "", result.to_dict() if result is not None and result.medicines else None
+
+def correct_drug_names(text: str) -> str:
+    if drug_names:
+        text, corrections = drug_names.correct_text(text)
+        DRUG_NAME_CORRECTIONS.inc(corrections, bot=BOT_NAME)
+    return text
+
+def record_details_from(report, raw_response: str) -> dict:
+    if report is not None:
+        return report.to_dict()
+    if raw_response.strip():
+        return {
+            "type": "Medical Record",
+            "summary": raw_response[:500] + ("..." if len(raw_response) > 500 else "")
+        }
+    return {
+        "type": "Medical Record",
+        "summary": "Could not automatically analyze this document. Please consult your doctor."
+    }
+
+def analyze_medical_record(text: str) -> dict:
+    """Summarise OCR'd medical record text with Gemini"""
+    try:
+        model = gemini_json_model(structured_output.MEDICAL_RECORD_SCHEMA)
+        format_hint = "" if STRUCTURED_OUTPUT else MEDICAL_RECORD_FORMAT_HINT
+        # Cut on the template's token budget rather than a raw character count
+        summary_prompt = prompts.MEDICAL_RECORD.render(format_hint=format_hint, text=prompts.compact_ocr(text))
+
+        report, raw_response = structured_output.generate_structured(
+            gemini_text(model),
+            summary_prompt, MedicalReport, call="medical_record", bot=BOT_NAME
+        )
+        logger.info(f"Gemini Medical Record Analysis: {raw_response}")
+        return record_details_from(report, raw_response)
+
+    except Exception as gemini_error:
+        logger.error(f"Gemini analysis error: {gemini_error}")
+        return {
+            "type": "Medical Record",
+            "summary": "Could not analyze document due to technical error."
+        }
+
+def medical_record_from_image(data: bytes, mime_type: str):
+    """Summary straight from a medical record photo in one multimodal call; returns ("", details or None)"""
+    model = gemini_json_model(structured_output.MEDICAL_RECORD_SCHEMA)
+    format_hint = "" if STRUCTURED_OUTPUT else MEDICAL_RECORD_FORMAT_HINT
+    report, raw_response = structured_output.generate_structured(
+        gemini_text(model, image={"mime_type": mime_type, "data": data}),
+        prompts.MEDICAL_RECORD_IMAGE.render(format_hint=format_hint),
+        MedicalReport, call="medical_record_image", bot=BOT_NAME
+    )
+    logger.info(f"Gemini Medical Record Analysis: {raw_response}")
+    return "", report.to_dict() if report is not None else None
+
+# Prescriptions stay space-joined: sig_parser reads newlines as entry separators.
+# Medical records get one OCR fragment per line so compaction can drop repeated headers and footers.
+PRESCRIPTION_DOCUMENT = DocumentType(
+    "prescription", " ", analyze_prescription, prescription_from_image, clean=correct_drug_names
+)
+MEDICAL_RECORD_DOCUMENT = DocumentType("medical_record", "\n", analyze_medical_record, medical_record_from_image)
+
+def extract_photo(document, download, chat_id):
+    photo = Photo(
+        download["data"], download["image"], extraction.mime_type(download["extension"]),
+        languages.ocr_languages(reminder_store.get_language(chat_id)),
+    )
+    # Kept with the update, so a restart mid-job doesn't pay for OCR and Gemini twice; a
+    # photo nothing was read from is tried again
+    extracted = update_ledger.memo(
+        update_ledger.current(), f"extract:{document.name}",
+        lambda: tuple(extractor.extract(document, photo, queue_depth=upload_queue.pending())),
+        keep=lambda extracted: extracted[1] is not None,
+    )
+    return Extraction(*extracted)
+
+def save_medical_record(chat_id, file_name, record_details, content_sha256=None):
     try:
         records = load_json_data(MEDICAL_RECORDS_FILE)
         if not isinstance(records, list):
             records = []
 
         user_record = next((r for r in records if str(r["chat_id"]) == str(chat_id)), None)
+        report = {
+            "file_name": file_name,
+            "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "record_details": record_details
+        }
+        if content_sha256:
+            report["content_hash"] = content_sha256
 
         if user_record:
             if "medical_reports" not in user_record:
                 user_record["medical_reports"] = []
             
-            # Check for duplicate file names
-            if not any(report["file_name"] == file_name for report in user_record["medical_reports"]):
-                user_record["medical_reports"].append({
-                    "file_name": file_name,
-                    "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "record_details": record_details
-                })
+            # Check for duplicate uploads (same image content, or same file name)
+            if content_sha256:
+                is_duplicate = any(r.get("content_hash") == content_sha256 for r in user_record["medical_reports"])
+            else:
+                is_duplicate = any(r["file_name"] == file_name for r in user_record["medical_reports"])
+            if not is_duplicate:
+                user_record["medical_reports"].append(report)
             else:
-                logger.warning(f"Duplicate file name detected: {file_name}")
+                logger.warning(f"Duplicate upload detected: {file_name}")
                 return False
         else:
             user_record = {
                 "chat_id": str(chat_id),
-                "medical_reports": [{
-                    "file_name": file_name,
-                    "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "record_details": record_details
-                }]
+                "medical_reports": [report]
             }
             records.append(user_record)
 
-        return save_json_data(records, MEDICAL_RECORDS_FILE, append=False)
+        if not save_json_data(records, MEDICAL_RECORDS_FILE, append=False):
+            return False
+        report_id = report_store.add(chat_id, report)
+        search_index.add_report(chat_id, report_id, report)
+        return True
     except Exception as e:
         logger.error(f"Error saving medical record: {e}")
         return False
 
-def set_medicine_reminders(prescription_data, chat_id):
+def init_report_store():
+    store = ReportStore(STATE_DB)
+    try:
+        # One-time backfill of the chat-keyed index from the JSON records file
+        if store.is_empty() and os.path.exists(MEDICAL_RECORDS_FILE):
+            imported = store.import_records(load_json_data(MEDICAL_RECORDS_FILE))
+            logger.info(f"Indexed {imported} existing medical reports")
+    except Exception as e:
+        logger.error(f"Failed to index existing medical records: {e}")
+    return store
+
+report_store = init_report_store()
+
+def init_reminder_store():
+    store = ReminderStore(
+        REMINDER_DB, partitions=REMINDER_PARTITIONS, lease_seconds=REMINDER_LEASE_SECONDS,
+        default_meal_times=MEAL_TIMES, default_timezone=DEFAULT_TIMEZONE
+    )
     try:
-        reminders = load_json_data(REMINDER_FILE)
-        if not isinstance(reminders, list):
-            reminders = []
+        # One-time move of the JSON reminder file into the shared store
+        if os.path.exists(REMINDER_FILE):
+            imported = store.import_reminders(load_json_data(REMINDER_FILE))
+            os.replace(REMINDER_FILE, REMINDER_FILE + ".imported")
+            logger.info(f"Moved {imported} reminders into {REMINDER_DB}")
+    except Exception as e:
+        logger.error(f"Failed to import existing reminders: {e}")
+    return store
 
+reminder_store = init_reminder_store()
+
+# Dose confirmations and running adherence counters, shared with the reminder workers
+adherence_store = AdherenceStore(REMINDER_DB)
+
+def get_user_reports(chat_id):
+    return report_store.iter_reports(chat_id)
+
+def set_medicine_reminders(prescription_data, chat_id):
+    try:
         chat_id = str(chat_id)
         reminder_messages = []
         medicines_added = []
@@ -224,109 +484,187 @@ def set_medicine_reminders(prescription_data, chat_id):
             medicine_name = medicine['name'].strip()
             if not medicine_name:
                 continue
-
-            # Check if this medicine already has reminders
-            existing_indices = [
-                i for i, r in enumerate(reminders)
-                if str(r["chat_id"]) == chat_id and r["medicine"].lower() == medicine_name.lower()
-            ]
-
-            # Remove existing reminders for this medicine
-            for i in sorted(existing_indices, reverse=True):
-                reminders.pop(i)
+            if drug_names:
+                medicine_name = drug_names.canonical(medicine_name)
 
             frequency = medicine.get('frequency', 'twice daily').lower()
             dosage = medicine.get('dosage', '1 tablet')
-            times = []
-
-            if "morning" in frequency or "twice daily" in frequency or "bd" in frequency:
-                times.append(MEAL_TIMES["morning"])
-            if "afternoon" in frequency or "thrice daily" in frequency or "tid" in frequency:
-                times.append(MEAL_TIMES["afternoon"])
-            if "night" in frequency or "evening" in frequency or "twice daily" in frequency or "bd" in frequency:
-                times.append(MEAL_TIMES["night"])
-            if "once daily" in frequency or "od" in frequency:
-                times.append(MEAL_TIMES["morning"])  # Default to morning if "once daily"
+            slots = sig_parser.frequency_slots(frequency)
 
             # If no times detected, default to morning and night
-            if not times:
-                times = [MEAL_TIMES["morning"], MEAL_TIMES["night"]]
-
-            for reminder_time in times:
-                reminder_datetime = datetime.strptime(reminder_time, "%H:%M:%S").replace(
-                    year=datetime.now().year,
-                    month=datetime.now().month,
-                    day=datetime.now().day
-                )
+            if slots is None:
+                slots = ["morning", "night"]
 
-                reminder = {
-                    "chat_id": chat_id,
-                    "medicine": medicine_name,
-                    "dosage": dosage,
-                    "message": f"Take {medicine_name} {dosage}",
-                    "time": reminder_datetime.strftime("%Y-%m-%d %H:%M:%S"),
-                    "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-                reminders.append(reminder)
+            # A course ("for 5 days") stops reminding once it is over
+            duration = (medicine.get('duration') or '').strip()
+            days = sig_parser.duration_days(duration)
+            ends_at = utc_now() + timedelta(days=days) if days else None
 
+            # Daily reminders at the user's own meal times, replacing any existing ones for this medicine
+            times = reminder_store.replace_medicine(
+                chat_id, medicine_name, dosage, f"Take {medicine_name} {dosage}", slots, ends_at
+            )
             medicines_added.append(medicine_name)
-            reminder_messages.append(f"- {medicine_name} ({dosage}) – {frequency.capitalize()}")
+            line = f"- {medicine_name} ({dosage}) – {frequency.capitalize()}"
+            if times:
+                line += f" at {', '.join(times)}"
+                if days:
+                    line += f" for {duration}"
+            elif sig_parser.is_non_daily(frequency):
+                line += " (not a daily dose, no reminder set; follow your doctor's schedule)"
+            else:
+                line += " (as needed, no reminder)"
+            reminder_messages.append(line)
 
-        if save_json_data(reminders, REMINDER_FILE, append=False):
-            return True, "\n".join(reminder_messages) if reminder_messages else "No reminders set"
-        else:
-            return False, "Failed to save reminders"
+        return True, "\n".join(reminder_messages) if reminder_messages else "No reminders set"
 
     except Exception as e:
         logger.error(f"Error setting reminders: {e}")
         return False, f"Error: {str(e)}"
 
+INTERACTION_ICONS = {"major": "🔴", "moderate": "🟠", "minor": "🟡"}
+
+def interaction_warnings(prescription_data, chat_id):
+    """Warning text for the prescription's medicines against each other and the chat's current ones"""
+    if interaction_index is None:
+        return ""
+    try:
+        names = [(medicine.get("name") or "").strip() for medicine in prescription_data.get("medicines", [])]
+        names = [drug_names.canonical(name) if drug_names else name for name in names if name]
+        found = interaction_index.check(names, reminder_store.medicines(chat_id))
+    except Exception as e:
+        logger.error(f"Interaction check failed: {e}")
+        return ""
+    if not found:
+        return ""
+    lines = [
+        f"{INTERACTION_ICONS[i.severity]} {i.first} + {i.second} ({i.severity}): {i.note}" for i in found
+    ]
+    return (
+        "⚠️ Possible interactions:\n" + "\n".join(lines) +
+        "\n\nPlease check with your doctor or pharmacist before changing how you take them."
+    )
+
+def wants_reprocess(message):
+    caption = (message.caption or "").lower()
+    return "reprocess" in caption or "#force" in caption
+
+def lookup_or_download_photo(message, kind):
+    """Return (stored entry, None) for a photo seen before in this chat, else (None, download)"""
+    chat_id = message.chat.id
+    photo = message.photo[-1]
+    force = wants_reprocess(message)
+
+    if not force:
+        cached = photo_index.find_by_file_id(chat_id, kind, photo.file_unique_id)
+        if cached:
+            PHOTO_DEDUP_HITS.inc(bot=BOT_NAME, kind=kind, match="file_id")
+            return cached, None
+
+    file_info = bot.get_file(photo.file_id)
+    data = bot.download_file(file_info.file_path)
+    download = {
+        "data": data,
+        "extension": file_info.file_path.split('.')[-1].lower(),
+        "sha256": content_hash(data),
+        "file_unique_id": photo.file_unique_id,
+        "image": None,
+    }
+
+    if not force:
+        cached = photo_index.find_exact(chat_id, kind, download["sha256"])
+        if cached:
+            PHOTO_DEDUP_HITS.inc(bot=BOT_NAME, kind=kind, match="sha256")
+            return cached, download
+
+    download["image"] = decode_image(data)
+    return None, download
+
+def archive_upload(folder, file_name, data):
+    """Keep a copy of an uploaded photo when ARCHIVE_UPLOADS is enabled"""
+    if not ARCHIVE_UPLOADS:
+        return
+    try:
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, file_name), 'wb') as new_file:
+            new_file.write(data)
+    except Exception as e:
+        logger.error(f"Could not archive {file_name}: {e}")
+
+def remember_photo(chat_id, kind, download, ocr_text, result):
+    if download is None:
+        return
+    try:
+        photo_index.store(chat_id, kind, download["sha256"], download["file_unique_id"], ocr_text, result)
+    except Exception as e:
+        logger.error(f"Could not store photo fingerprint: {e}")
+
+def submit_upload(message, kind, fn, *args):
+    """Queue an OCR/Gemini job for the chat and tell the user if it has to wait"""
+    chat_id = message.chat.id
+    update_id = update_ledger.current()
+    outcome, future = upload_queue.submit(chat_id, kind, update_ledger.call_with, update_id, fn, *args)
+    if future is not None and update_id is not None:
+        # The update is done when the job is, or when a newer upload replaces it
+        update_ledger.defer()
+        future.add_done_callback(lambda _: update_ledger.finish(update_id))
+    if outcome == work_queue.THROTTLED:
+        bot.send_message(
+            chat_id,
+            f"🐢 You're sending uploads faster than I can read them. "
+            f"Please try again in {upload_queue.retry_after(chat_id)} seconds."
+        )
+    elif outcome == work_queue.SUPERSEDED:
+        bot.send_message(chat_id, "⏳ Still working on your previous upload. I'll read this newer one next instead of the one before it.")
+    elif outcome == work_queue.QUEUED:
+        bot.send_message(chat_id, "⏳ Still working on your previous upload. This one is next in line.")
+
 def process_prescription(message, is_photo=False):
     try:
         chat_id = message.chat.id
+        prescription_data = None
+        download = None
+        reused = False
         if is_photo:
             if not message.photo:
                 bot.send_message(chat_id, "❌ Please send a clear photo of your prescription.")
                 return
 
-            file_info = bot.get_file(message.photo[-1].file_id)
-            downloaded_file = bot.download_file(file_info.file_path)
-            
-            file_extension = file_info.file_path.split('.')[-1].lower()
-            if file_extension not in ['jpg', 'jpeg', 'png']:
-                bot.send_message(chat_id, "❌ Unsupported file format. Please send JPG or PNG.")
-                return
+            cached, download = lookup_or_download_photo(message, "prescription")
+            if cached:
+                extracted_text = cached["ocr_text"]
+                prescription_data = cached["result"]
+                reused = True
+            else:
+                file_extension = download["extension"]
+                if file_extension not in ['jpg', 'jpeg', 'png'] or download["image"] is None:
+                    bot.send_message(chat_id, "❌ Unsupported file format. Please send JPG or PNG.")
+                    return
 
-            unique_filename = f"prescription_{str(uuid.uuid4())}.{file_extension}"
-            file_path = os.path.join('prescriptions', unique_filename)
-            
-            with open(file_path, 'wb') as new_file:
-                new_file.write(downloaded_file)
-            
-            try:
-                image = np.array(Image.open(file_path))
-                reader = easyocr.Reader(['en'])
-                extracted_text = " ".join(reader.readtext(image, detail=0))
+                archive_upload('prescriptions', f"prescription_{str(uuid.uuid4())}.{file_extension}", download["data"])
                 
-                if not extracted_text.strip():
-                    bot.send_message(chat_id, "⚠️ Couldn't read text from the image. Please send a clearer photo.")
+                try:
+                    extracted = extract_photo(PRESCRIPTION_DOCUMENT, download, chat_id)
+                    if extracted.result is None:
+                        bot.send_message(chat_id, "⚠️ Couldn't read text from the image. Please send a clearer photo.")
+                        return
+
+                    extracted_text = extracted.text
+                    prescription_data = extracted.result
+                    if extracted_text:
+                        bot.send_message(chat_id, "🔍 Extracted prescription text:\n\n" + extracted_text[:1000] + ("..." if len(extracted_text) > 1000 else ""))
+                except Exception as e:
+                    logger.error(f"OCR Error: {e}")
+                    bot.send_message(chat_id, "❌ Error processing the image. Please try again.")
                     return
-                
-                bot.send_message(chat_id, "🔍 Extracted prescription text:\n\n" + extracted_text[:1000] + ("..." if len(extracted_text) > 1000 else ""))
-            except Exception as e:
-                logger.error(f"OCR Error: {e}")
-                bot.send_message(chat_id, "❌ Error processing the image. Please try again.")
-                return
-            finally:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
         else:
             extracted_text = message.text
             if len(extracted_text) < 10:
                 bot.send_message(chat_id, "❌ Prescription text is too short. Please provide more details.")
                 return
 
-        prescription_data = analyze_prescription_with_gemini(extracted_text)
+        if prescription_data is None:
+            prescription_data = analyze_prescription(extracted_text)
         
         if not prescription_data.get('medicines'):
             bot.send_message(
@@ -338,7 +676,15 @@ def process_prescription(message, is_photo=False):
             )
             return
 
-        success, reminder_text = set_medicine_reminders(prescription_data, chat_id)
+        if not reused:
+            remember_photo(chat_id, "prescription", download, extracted_text, prescription_data)
+
+        # Checked before the reminders are replaced, against what the chat was already taking
+        warnings = interaction_warnings(prescription_data, chat_id)
+        success, reminder_text = update_ledger.memo(
+            update_ledger.current(), "reminders", set_medicine_reminders, prescription_data, chat_id,
+            keep=lambda result: result[0],
+        )
         
         if success:
             response = (
@@ -350,6 +696,15 @@ def process_prescription(message, is_photo=False):
             
             if prescription_data.get('notes'):
                 response += f"\n\n📝 Doctor's Notes:\n{prescription_data['notes']}"
+
+            if warnings:
+                response += f"\n\n{warnings}"
+
+            if reused:
+                response += (
+                    "\n\n♻️ You've sent this prescription before, so I reused the earlier analysis. "
+                    "Send it again with the caption \"prescription reprocess\" to analyse it from scratch."
+                )
             
             bot.send_message(chat_id, response)
         else:
@@ -359,203 +714,144 @@ def process_prescription(message, is_photo=False):
         logger.error(f"Prescription processing error: {e}")
         bot.send_message(message.chat.id, f"❌ Error processing prescription: {str(e)}")
 
+def format_record_reply(record_details, header="✅ Medical Record Uploaded Successfully!"):
+    response_text = (
+        f"{header}\n\n"
+        f"📄 Type: {record_details.get('type', 'Unknown')}\n"
+    )
+    
+    if 'date' in record_details:
+        response_text += f"📅 Date: {record_details['date']}\n"
+    
+    if 'key_findings' in record_details and record_details['key_findings']:
+        response_text += "\n🔍 Key Findings:\n"
+        response_text += "\n".join(f"- {finding}" for finding in record_details['key_findings']) + "\n"
+    
+    if 'diagnosis' in record_details and record_details['diagnosis']:
+        response_text += "\n🩺 Diagnosis:\n"
+        response_text += "\n".join(f"- {d}" for d in record_details['diagnosis']) + "\n"
+    
+    if 'recommendations' in record_details and record_details['recommendations']:
+        response_text += "\n💡 Recommendations:\n"
+        response_text += "\n".join(f"- {r}" for r in record_details['recommendations']) + "\n"
+    
+    response_text += f"\n📋 Summary: {record_details.get('summary', 'No summary available')}"
+    return response_text
+
 def process_medical_record(message):
     try:
         chat_id = message.chat.id
         if not message.photo:
             bot.send_message(chat_id, "❌ Please upload a valid medical report (JPG/PNG).")
             return
-        
-        file_info = bot.get_file(message.photo[-1].file_id)
-        downloaded_file = bot.download_file(file_info.file_path)
-        
-        file_extension = file_info.file_path.split('.')[-1].lower()
-        if file_extension not in ['jpg', 'jpeg', 'png']:
+
+        cached, download = lookup_or_download_photo(message, "medical_record")
+        if cached:
+            response_text = format_record_reply(
+                cached["result"] or {}, header="♻️ This report is already in your records."
+            )
+            response_text += (
+                "\n\nSend it again with the caption \"reprocess\" if you want it analysed from scratch."
+            )
+            bot.reply_to(message, response_text)
+            return
+
+        file_extension = download["extension"]
+        if file_extension not in ['jpg', 'jpeg', 'png'] or download["image"] is None:
             bot.send_message(chat_id, "❌ Unsupported file format. Please send JPG or PNG.")
             return
 
         unique_filename = f"medical_record_{str(uuid.uuid4())}.{file_extension}"
-        file_path = os.path.join('medical_records', unique_filename)
-        
-        with open(file_path, 'wb') as new_file:
-            new_file.write(downloaded_file)
+        archive_upload('medical_records', unique_filename, download["data"])
 
-        # Extract text using OCR
+        # Read the document with OCR plus Gemini, or Gemini alone
         try:
-            image = np.array(Image.open(file_path))
-            reader = easyocr.Reader(['en'])
-            extracted_text = " ".join(reader.readtext(image, detail=0))
-
-            if not extracted_text.strip():
+            extracted = extract_photo(MEDICAL_RECORD_DOCUMENT, download, chat_id)
+            if extracted.result is None:
                 bot.send_message(chat_id, "⚠️ No text detected in the image. Please upload a clearer document.")
                 return
         except Exception as e:
             logger.error(f"OCR Error: {e}")
             bot.send_message(chat_id, "❌ Error processing the document. Please try again.")
             return
-
-        # Analyze the extracted text with Gemini
-        try:
-            genai.configure(api_key=GEMINI_API_KEY)
-            model = genai.GenerativeModel("gemini-1.5-pro")
-            
-            summary_prompt = (
-                "Analyze this medical document thoroughly and provide a detailed summary. "
-                "Structure the response as JSON with these fields:\n"
-                "{\n"
-                "  'type': 'Report type (e.g., Blood Test, X-Ray)',\n"
-                "  'date': 'Report date if available',\n"
-                "  'patient_info': 'Brief patient info if present',\n"
-                "  'key_findings': ['List of important findings'],\n"
-                "  'diagnosis': ['List of diagnoses if any'],\n"
-                "  'recommendations': ['List of recommendations'],\n"
-                "  'summary': 'Concise overall summary'\n"
-                "}\n\n"
-                "Document Text:\n" + extracted_text[:10000]  # Limit to first 10k characters
-            )
-
-            response = model.generate_content(summary_prompt)
-            raw_response = response.text.strip()
-            logger.info(f"Gemini Medical Record Analysis: {raw_response}")
-
-            # Extract JSON from response
-            json_match = re.search(r'\{[\s\S]*\}', raw_response)
-            
-            if not json_match:
-                record_details = {
-                    "type": "Medical Record",
-                    "summary": "Could not automatically analyze this document. Please consult your doctor."
-                }
-            else:
-                json_text = json_match.group(0)
-                # Clean the JSON string
-                json_text = re.sub(r'```json|```', '', json_text).strip()
-                try:
-                    record_details = json.loads(json_text)
-                except json.JSONDecodeError:
-                    record_details = {
-                        "type": "Medical Record",
-                        "summary": raw_response[:500] + ("..." if len(raw_response) > 500 else "")
-                    }
-
-        except Exception as gemini_error:
-            logger.error(f"Gemini analysis error: {gemini_error}")
-            record_details = {
-                "type": "Medical Record",
-                "summary": "Could not analyze document due to technical error."
-            }
+        extracted_text = extracted.text
+        record_details = extracted.result
 
         # Store structured data
-        if save_medical_record(chat_id, unique_filename, record_details):
-            # Prepare response message
-            response_text = (
-                f"✅ Medical Record Uploaded Successfully!\n\n"
-                f"📄 Type: {record_details.get('type', 'Unknown')}\n"
-            )
-            
-            if 'date' in record_details:
-                response_text += f"📅 Date: {record_details['date']}\n"
-            
-            if 'key_findings' in record_details and record_details['key_findings']:
-                response_text += "\n🔍 Key Findings:\n"
-                response_text += "\n".join(f"- {finding}" for finding in record_details['key_findings']) + "\n"
-            
-            if 'diagnosis' in record_details and record_details['diagnosis']:
-                response_text += "\n🩺 Diagnosis:\n"
-                response_text += "\n".join(f"- {d}" for d in record_details['diagnosis']) + "\n"
-            
-            if 'recommendations' in record_details and record_details['recommendations']:
-                response_text += "\n💡 Recommendations:\n"
-                response_text += "\n".join(f"- {r}" for r in record_details['recommendations']) + "\n"
-            
-            response_text += f"\n📋 Summary: {record_details.get('summary', 'No summary available')}"
-            
-            bot.reply_to(message, response_text)
+        saved = update_ledger.memo(
+            update_ledger.current(), "save", save_medical_record,
+            chat_id, unique_filename, record_details, download["sha256"], keep=bool,
+        )
+        if saved:
+            remember_photo(chat_id, "medical_record", download, extracted_text, record_details)
+            bot.reply_to(message, format_record_reply(record_details))
         else:
             bot.reply_to(message, "❌ Failed to save medical record. Please try again.")
 
     except Exception as e:
         logger.error(f"Medical record processing error: {e}")
         bot.send_message(message.chat.id, f"❌ Error processing medical record: {str(e)}")
-    finally:
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
-
-def view_medical_records(message):
-    try:
-        # Load medical records data with proper error handling
-        try:
-            medical_records = load_json_data(MEDICAL_RECORDS_FILE)
-            if not isinstance(medical_records, list):
-                logger.warning("Medical records data is not a list, converting to empty list")
-                medical_records = []
-        except Exception as e:
-            logger.error(f"Failed to load medical records: {e}")
-            medical_records = []
-
-        user_id = str(message.chat.id)
-        user_records = []
-
-        # Find all records for this user
-        for record in medical_records:
-            try:
-                if str(record.get("chat_id")) == user_id:
-                    user_records.append(record)
-            except Exception as e:
-                logger.error(f"Error processing record: {e}")
-                continue
-
-        if not user_records:
-            bot.send_message(
-                message.chat.id,
-                "📭 You don't have any medical records stored yet.\n\n"
-                "Use /upload_medical to add your first medical report."
-            )
-            return
-
-        # Prepare and send the records
-        response_text = "🏥 Your Medical Records:\n\n"
-        records_found = False
-
-        for record in user_records:
-            if not record.get("medical_reports"):
-                continue
 
-            records_found = True
-            for report in record["medical_reports"]:
-                details = report.get("record_details", {})
-                response_text += (
-                    f"📄 File: {report.get('file_name', 'Unknown')}\n"
-                    f"📅 Uploaded: {report.get('upload_time', 'Unknown date')}\n"
-                    f"🔍 Type: {details.get('type', 'Unspecified')}\n"
-                )
-
-                if 'date' in details:
-                    response_text += f"🗓 Report Date: {details['date']}\n"
+def format_report_entry(report, max_findings=5):
+    details = report.get("record_details", {})
+    text = (
+        f"📄 File: {report.get('file_name', 'Unknown')}\n"
+        f"📅 Uploaded: {report.get('upload_time', 'Unknown date')}\n"
+        f"🔍 Type: {details.get('type', 'Unspecified')}\n"
+    )
 
-                if 'key_findings' in details and details['key_findings']:
-                    if isinstance(details['key_findings'], list):
-                        response_text += "📌 Key Findings:\n" + "\n".join(f"- {f}" for f in details['key_findings']) + "\n"
-                    else:
-                        response_text += f"📌 Key Findings: {details['key_findings']}\n"
+    if 'date' in details:
+        text += f"🗓 Report Date: {details['date']}\n"
 
-                response_text += "-------------------------\n"
+    if 'key_findings' in details and details['key_findings']:
+        if isinstance(details['key_findings'], list):
+            findings = details['key_findings'][:max_findings]
+            more = len(details['key_findings']) - len(findings)
+            text += "📌 Key Findings:\n" + "\n".join(f"- {f}" for f in findings) + "\n"
+            if more > 0:
+                text += f"  (+{more} more)\n"
+        else:
+            text += f"📌 Key Findings: {details['key_findings']}\n"
+
+    return text
+
+def render_records_page(chat_id, before=None, after=None):
+    """Build the text and Older/Newer buttons for one page of a chat's reports"""
+    reports, has_older, has_newer = report_store.page(chat_id, before=before, after=after, size=RECORDS_PAGE_SIZE)
+    if not reports:
+        return None, None
+
+    total = report_store.count(chat_id)
+    entries = [format_report_entry(report) for _, report in reports]
+    # Keep whole entries together: shrink each one evenly if the page is too long
+    budget = 3900 // len(entries)
+    entries = [e if len(e) <= budget else e[:budget - 2] + "…\n" for e in entries]
+    response_text = f"🏥 Your Medical Records ({total} total, newest first):\n\n"
+    response_text += "-------------------------\n".join(entries)
+
+    buttons = []
+    if has_newer:
+        buttons.append(InlineKeyboardButton("⬅️ Newer", callback_data=f"med_page:after:{reports[0][0]}"))
+    if has_older:
+        buttons.append(InlineKeyboardButton("Older ➡️", callback_data=f"med_page:before:{reports[-1][0]}"))
+    markup = None
+    if buttons:
+        markup = InlineKeyboardMarkup()
+        markup.row(*buttons)
+    return response_text, markup
 
-        if not records_found:
+def view_medical_records(message):
+    try:
+        response_text, markup = render_records_page(message.chat.id)
+        if response_text is None:
             bot.send_message(
                 message.chat.id,
-                "📭 You don't have any complete medical records yet.\n\n"
+                "📭 You don't have any medical records stored yet.\n\n"
                 "Use /upload_medical to add your first medical report."
             )
             return
 
-        # Split long messages to avoid Telegram's limit
-        if len(response_text) > 4000:
-            parts = [response_text[i:i+4000] for i in range(0, len(response_text), 4000)]
-            for part in parts:
-                bot.send_message(message.chat.id, part)
-        else:
-            bot.send_message(message.chat.id, response_text)
+        bot.send_message(message.chat.id, response_text, reply_markup=markup)
 
     except Exception as e:
         logger.error(f"Error in view_medical_records: {str(e)}", exc_info=True)
@@ -566,65 +862,138 @@ def view_medical_records(message):
             "Please try again later or contact support if the problem persists."
         )
 
-def check_reminders():
-    while True:
-        try:
-            reminders = load_json_data(REMINDER_FILE)
-            now = datetime.now()
+def search_medical_records(message):
+    chat_id = message.chat.id
+    query = (message.text or "").partition(" ")[2].strip()
+    if not query:
+        bot.send_message(
+            chat_id,
+            "🔎 Search your medical records\n\n"
+            "Usage: /search_medical <terms>\n"
+            "Examples:\n"
+            "/search_medical glucose\n"
+            "/search_medical x-ray from:2024-01-01 to:2024-06-30"
+        )
+        return
 
-            reminders_to_keep = []
-            reminders_sent = 0
+    try:
+        if not search_index.is_loaded(chat_id):
+            search_index.load_chat(chat_id, get_user_reports(chat_id))
 
-            for reminder in reminders:
-                try:
-                    reminder_time = datetime.strptime(reminder["time"], "%Y-%m-%d %H:%M:%S")
-
-                    # Check if it's time to send this reminder (within 1 minute window)
-                    if 0 <= (now - reminder_time).total_seconds() < 60:
-                        chat_id = reminder["chat_id"]
-                        reminder_text = f"⏰ Reminder: {reminder['message']}"
-
-                        # Send text reminder
-                        bot.send_message(chat_id, reminder_text)
-
-                        # Generate and send voice reminder
-                        try:
-                            tts = gTTS(text=reminder_text, lang="en")
-                            audio_filename = f"reminder_{reminder['chat_id']}_{reminder_time.strftime('%Y%m%d_%H%M')}.mp3"
-                            audio_path = os.path.join("reminders_audio", audio_filename)
-
-                            tts.save(audio_path)
-                            with open(audio_path, "rb") as audio:
-                                bot.send_voice(chat_id, audio)
-                            
-                            os.remove(audio_path)
-                        except Exception as e:
-                            logger.error(f"Voice reminder error: {e}")
-
-                        reminders_sent += 1
-                    
-                    # Keep only future reminders
-                    if now < reminder_time:
-                        reminders_to_keep.append(reminder)
+        results = search_index.search(chat_id, query)
+        if not results:
+            bot.send_message(chat_id, f"📭 No medical records match \"{query}\".")
+            return
 
-                except Exception as e:
-                    logger.error(f"Error processing reminder: {e}")
-                    reminders_to_keep.append(reminder)  # Keep it to avoid data loss
+        response_text = f"🔎 Top matches for \"{query}\":\n\n"
+        for rank, (_, _, report) in enumerate(results, start=1):
+            details = report.get("record_details", {})
+            response_text += (
+                f"{rank}. {details.get('type', 'Medical Record')} – {report.get('upload_time', 'Unknown date')}\n"
+                f"   {best_snippet(report, query)}\n"
+            )
+        bot.send_message(chat_id, response_text)
 
-            # Save only the reminders we're keeping
-            if reminders_sent > 0 or len(reminders_to_keep) != len(reminders):
-                save_json_data(reminders_to_keep, REMINDER_FILE, append=False)
+    except Exception as e:
+        logger.error(f"Error in search_medical_records: {e}", exc_info=True)
+        bot.send_message(chat_id, "❌ An error occurred while searching your medical records.")
+
+def dose_keyboard(reminder_id, dose_at):
+    markup = InlineKeyboardMarkup()
+    markup.row(
+        InlineKeyboardButton("✅ Taken", callback_data=f"dose:taken:{reminder_id}:{dose_at}"),
+        InlineKeyboardButton(f"⏰ Snooze {SNOOZE_MINUTES}m", callback_data=f"dose:snooze:{reminder_id}:{dose_at}"),
+        InlineKeyboardButton("⏭ Skip", callback_data=f"dose:skip:{reminder_id}:{dose_at}"),
+    )
+    return markup
+
+def send_reminder(reminder):
+    chat_id = reminder["chat_id"]
+    reminder_time = datetime.strptime(reminder["time"], "%Y-%m-%d %H:%M:%S")  # UTC
+    reminder_text = f"⏰ Reminder: {reminder['message']}"
+    if reminder.get("snoozed"):
+        reminder_text = f"⏰ Snoozed reminder: {reminder['message']}"
+    if (utc_now() - reminder_time).total_seconds() > REMINDER_LATE_SECONDS:
+        reminder_text += f" (late, due at {reminder_time.strftime('%H:%M')} UTC)"
+    # The scheduled dose, as epoch seconds, identifies this dose across snoozes
+    dose_at = calendar.timegm(datetime.strptime(reminder.get("dose_at") or reminder["time"], TIME_FORMAT).timetuple())
+
+    # Send text reminder
+    bot.send_message(chat_id, reminder_text, reply_markup=dose_keyboard(reminder["id"], dose_at))
+    if not reminder.get("snoozed"):
+        try:
+            adherence_store.record_sent(chat_id, reminder["id"], reminder["medicine"], dose_at)
+        except Exception as e:
+            logger.error(f"Error recording sent dose: {e}")
+    metrics.REMINDER_LAG_SECONDS.observe((utc_now() - reminder_time).total_seconds(), bot=BOT_NAME)
+    metrics.REMINDERS_SENT.inc(bot=BOT_NAME)
 
-            # Clean old reminders weekly
-            if now.weekday() == 0 and now.hour == 1:  # Every Monday at 1 AM
-                clean_old_reminders()
+    # Generate and send voice reminder
+    try:
+        audio_filename = f"reminder_{chat_id}_{reminder['id']}_{reminder_time.strftime('%Y%m%d_%H%M')}.mp3"
+        audio_path = os.path.join("reminders_audio", audio_filename)
+
+        language = reminder_store.get_language(chat_id)
+        spoken = languages.spoken_reminder(language, reminder["medicine"], reminder.get("dosage"))
+        with metrics.track(metrics.TTS_SECONDS, metrics.TTS_ERRORS, bot=BOT_NAME):
+            tts = gTTS(text=spoken, lang=languages.tts_language(language))
+            tts.save(audio_path)
+        with open(audio_path, "rb") as audio:
+            bot.send_voice(chat_id, audio)
+        
+        os.remove(audio_path)
+    except Exception as e:
+        logger.error(f"Voice reminder error: {e}")
 
+def check_reminders(worker_id, owned_partitions):
+    """Dispatch due reminders for the partitions this worker holds a lease on"""
+    while True:
+        try:
+            with profiling.request(BOT_NAME, "check_reminders"):
+                check_reminders_once(worker_id, owned_partitions)
         except Exception as e:
             logger.error(f"Reminder checking error: {e}")
 
-        time.sleep(60)  # Check every minute
+        time.sleep(REMINDER_POLL_SECONDS)
+
+def check_reminders_once(worker_id, owned_partitions):
+    partitions = reminder_store.acquire_partitions(worker_id)
+    owned_partitions[worker_id] = len(partitions)
+    now = utc_now()
+
+    # Dispatch records stop repeats across polls; the window reaches back past a lease
+    # so partitions taken over from a dead worker still send what it missed
+    catch_up = now - timedelta(seconds=REMINDER_CATCHUP_SECONDS)
+    for reminder in reminder_store.due(partitions, catch_up, now):
+        try:
+            if not reminder_store.claim_dispatch(reminder, worker_id):
+                continue
+            send_reminder(reminder)
+            reminder_store.mark_sent(reminder)
+        except Exception as e:
+            logger.error(f"Error processing reminder: {e}")
+
+    reminder_store.skip_missed(partitions, catch_up)
+
+    # Clean old reminders weekly
+    if now.weekday() == 0 and now.hour == 1 and 0 in partitions:  # Every Monday at 1 AM UTC
+        clean_old_reminders()
+
+def start_reminder_workers(count):
+    """Start count lease-holding reminder workers; more processes or hosts can run their own"""
+    owned_partitions = {}
+    REMINDER_PARTITIONS_OWNED.set_function(lambda: sum(owned_partitions.values()), bot=BOT_NAME)
+    metrics.QUEUE_DEPTH.set_function(reminder_store.count, bot=BOT_NAME, queue="reminders")
+    workers = []
+    for i in range(count):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{i}"
+        thread = threading.Thread(target=check_reminders, args=(worker_id, owned_partitions), daemon=True)
+        thread.start()
+        workers.append(worker_id)
+    return workers
 
 @bot.message_handler(commands=['start'])
+@metrics.instrument_handler(BOT_NAME)
 def send_welcome(message):
     welcome_text = (
         "👋 Welcome to MedGuardian - Your Personal Medication Assistant!\n\n"
@@ -636,11 +1005,18 @@ def send_welcome(message):
         "/medicine - Upload a prescription\n"
         "/upload_medical - Store medical reports\n"
         "/view_medical - View your records\n"
-        "/remove_pres - Remove a medication reminder"
+        "/search_medical - Search your records\n"
+        "/remove_pres - Remove a medication reminder\n"
+        "/adherence - See how consistently you take your medicines\n"
+        "/timezone - Set your timezone\n"
+        "/mealtimes - Set when you eat, for reminder times\n"
+        "/language - Set the language for documents and voice reminders\n"
+        "/export - Download all your data"
     )
     bot.send_message(message.chat.id, welcome_text)
 
 @bot.message_handler(commands=['medicine', 'prescription'])
+@metrics.instrument_handler(BOT_NAME)
 def handle_medicine_command(message):
     bot.send_message(
         message.chat.id,
@@ -653,9 +1029,14 @@ def handle_medicine_command(message):
         "- Dosages\n"
         "- Frequencies (e.g., 'twice daily')"
     )
-    bot.register_next_step_handler(message, lambda m: process_prescription(m, is_photo=False))
+    bot.register_next_step_handler(message, receive_prescription)
+
+@metrics.instrument_handler(BOT_NAME)
+def receive_prescription(message):
+    submit_upload(message, "prescription", process_prescription, message, False)
 
 @bot.message_handler(commands=['upload_medical', 'uploadMedical'])
+@metrics.instrument_handler(BOT_NAME)
 def handle_upload_medical(message):
     bot.send_message(
         message.chat.id,
@@ -666,18 +1047,218 @@ def handle_upload_medical(message):
         "- One file at a time\n\n"
         "I'll analyze and store it for you!"
     )
-    bot.register_next_step_handler(message, process_medical_record)
+    bot.register_next_step_handler(message, receive_medical_record)
+
+@metrics.instrument_handler(BOT_NAME)
+def receive_medical_record(message):
+    submit_upload(message, "medical_record", process_medical_record, message)
 
 @bot.message_handler(commands=['view_medical', 'viewMedical'])
+@metrics.instrument_handler(BOT_NAME)
 def handle_view_medical(message):
     view_medical_records(message)
 
+@bot.callback_query_handler(func=lambda call: call.data.startswith("med_page:"))
+@metrics.instrument_handler(BOT_NAME)
+def handle_records_page(call):
+    try:
+        _, direction, cursor = call.data.split(":")
+        cursor = int(cursor)
+        chat_id = call.message.chat.id
+        if direction == "before":
+            response_text, markup = render_records_page(chat_id, before=cursor)
+        else:
+            response_text, markup = render_records_page(chat_id, after=cursor)
+
+        bot.answer_callback_query(call.id)
+        if response_text is None:
+            return
+        bot.edit_message_text(response_text, chat_id, call.message.message_id, reply_markup=markup)
+    except Exception as e:
+        logger.error(f"Error paging medical records: {e}")
+        bot.answer_callback_query(call.id, "❌ Couldn't load that page.")
+
+@bot.callback_query_handler(func=lambda call: call.data.startswith("dose:"))
+@metrics.instrument_handler(BOT_NAME)
+def handle_dose_response(call):
+    try:
+        _, action, reminder_id, dose_at = call.data.split(":")
+        reminder_id, dose_at = int(reminder_id), int(dose_at)
+        chat_id = call.message.chat.id
+
+        # The dose as it was sent: a one-shot reminder, or the last dose of a course, has no row by now
+        medicine = adherence_store.sent_medicine(chat_id, reminder_id, dose_at)
+        reminder = reminder_store.get(reminder_id)
+        if reminder is not None and str(reminder["chat_id"]) != str(chat_id):
+            reminder = None
+        if medicine is None and reminder is not None:
+            # Sent before doses recorded their medicine
+            medicine = reminder["medicine"]
+        # Only a live reminder can fire again
+        if medicine is None or (action == "snooze" and reminder is None):
+            bot.answer_callback_query(call.id, "This reminder is no longer active.")
+            bot.edit_message_reply_markup(chat_id, call.message.message_id, reply_markup=None)
+            return
+
+        if not adherence_store.record_response(chat_id, reminder_id, medicine, dose_at, adherence.ACTIONS[action]):
+            bot.answer_callback_query(call.id, "You've already answered this reminder.")
+            bot.edit_message_reply_markup(chat_id, call.message.message_id, reply_markup=None)
+            return
+
+        if action == "snooze":
+            dose_time = time.strftime(TIME_FORMAT, time.gmtime(dose_at))
+            reminder_store.snooze(reminder_id, dose_time, utc_now() + timedelta(minutes=SNOOZE_MINUTES))
+            status = f"⏰ Snoozed for {SNOOZE_MINUTES} minutes."
+        elif action == "taken":
+            status = "✅ Marked as taken."
+        else:
+            status = "⏭ Skipped."
+
+        bot.answer_callback_query(call.id, status)
+        bot.edit_message_text(f"{call.message.text}\n\n{status}", chat_id, call.message.message_id, reply_markup=None)
+    except Exception as e:
+        logger.error(f"Error handling dose response: {e}")
+        bot.answer_callback_query(call.id, "❌ Couldn't save your response.")
+
+def send_export(message):
+    """Stream the chat's data into a temporary ZIP and send it as a document"""
+    chat_id = message.chat.id
+    try:
+        with tempfile.TemporaryFile() as archive:
+            counts = data_export.export(archive, reminder_store, report_store, adherence_store, chat_id=chat_id)
+            archive.seek(0)
+            bot.send_document(
+                chat_id, archive, visible_file_name=f"medguardian_export_{chat_id}.zip",
+                caption=(f"📦 Your data: {counts['reminder']} reminder(s), {counts['report']} report(s), "
+                         f"{counts['dose_event']} dose event(s).")
+            )
+    except Exception as e:
+        logger.error(f"Export error: {e}")
+        bot.send_message(chat_id, "❌ Couldn't build your export. Please try again later.")
+
+@bot.message_handler(commands=['export'])
+@metrics.instrument_handler(BOT_NAME)
+def handle_export(message):
+    bot.send_message(message.chat.id, "📦 Preparing your data export...")
+    submit_upload(message, "export", send_export, message)
+
+@bot.message_handler(commands=['adherence'])
+@metrics.instrument_handler(BOT_NAME)
+def handle_adherence(message):
+    chat_id = message.chat.id
+    stats = adherence_store.stats(chat_id)
+    if not stats:
+        bot.send_message(chat_id, "📊 No doses recorded yet. Tap ✅ Taken on your reminders to track adherence.")
+        return
+
+    response_text = "📊 Your Medication Adherence:\n\n"
+    for medicine, sent, taken, skipped, snoozed, streak, best_streak in stats:
+        rate = f"{taken / sent:.0%}" if sent else "–"
+        response_text += (
+            f"💊 {medicine}: {rate} taken ({taken}/{sent})\n"
+            f"   Skipped: {skipped} | Snoozed: {snoozed}\n"
+            f"   🔥 Streak: {streak} (best {best_streak})\n\n"
+        )
+    bot.send_message(chat_id, response_text.strip())
+
+@bot.message_handler(commands=['search_medical', 'searchMedical'])
+@metrics.instrument_handler(BOT_NAME)
+def handle_search_medical(message):
+    search_medical_records(message)
+
+@bot.message_handler(commands=['timezone'])
+@metrics.instrument_handler(BOT_NAME)
+def handle_timezone(message):
+    chat_id = message.chat.id
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        tz_name, tz, _ = reminder_store.get_profile(chat_id)
+        now = datetime.now(tz).strftime("%H:%M")
+        bot.send_message(
+            chat_id,
+            f"🌍 Your timezone: {tz_name or 'default'} (local time {now})\n\n"
+            "Usage: /timezone <zone or UTC offset>\n"
+            "Examples: /timezone Asia/Kolkata, /timezone Europe/London, /timezone +05:30"
+        )
+        return
+
+    tz_name = parts[1].strip()
+    tz = resolve_timezone(tz_name)
+    if tz is None:
+        bot.send_message(chat_id, "⚠️ Unknown timezone. Try a name like Asia/Kolkata or an offset like +05:30.")
+        return
+    try:
+        moved = reminder_store.set_profile(chat_id, timezone_name=tz_name)
+        bot.send_message(
+            chat_id,
+            f"✅ Timezone set to {tz_name} (local time {datetime.now(tz).strftime('%H:%M')}).\n"
+            f"⏰ {moved} reminder(s) rescheduled."
+        )
+    except Exception as e:
+        logger.error(f"Error setting timezone: {e}")
+        bot.send_message(chat_id, "❌ Failed to save your timezone. Please try again.")
+
+@bot.message_handler(commands=['language'])
+@metrics.instrument_handler(BOT_NAME)
+def handle_language(message):
+    chat_id = message.chat.id
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        current = reminder_store.get_language(chat_id) or languages.DEFAULT_LANGUAGE
+        bot.send_message(
+            chat_id,
+            f"🗣 Your language: {languages.LANGUAGES[current][0]}\n"
+            "It is used to read your documents and for voice reminders.\n\n"
+            "Usage: /language <code>\n" + languages.menu()
+        )
+        return
+
+    code = languages.resolve_language(parts[1])
+    if code is None:
+        bot.send_message(chat_id, "⚠️ Unknown language. Send /language to see the ones available.")
+        return
+    try:
+        reminder_store.set_language(chat_id, code)
+        bot.send_message(chat_id, f"✅ Language set to {languages.LANGUAGES[code][0]}.")
+    except Exception as e:
+        logger.error(f"Error setting language: {e}")
+        bot.send_message(chat_id, "❌ Failed to save your language. Please try again.")
+
+@bot.message_handler(commands=['mealtimes', 'meal_times'])
+@metrics.instrument_handler(BOT_NAME)
+def handle_mealtimes(message):
+    chat_id = message.chat.id
+    slots = list(MEAL_TIMES)
+    values = message.text.split()[1:]
+    if not values:
+        _, _, meal_times = reminder_store.get_profile(chat_id)
+        current = "\n".join(f"- {slot.capitalize()}: {meal_times[slot][:5]}" for slot in slots)
+        bot.send_message(
+            chat_id,
+            f"🍽 Your reminder times:\n{current}\n\n"
+            f"Usage: /mealtimes <{'> <'.join(slots)}>\n"
+            "Example: /mealtimes 07:30 13:30 20:30 22:30 (later times can be left out)"
+        )
+        return
+
+    times = [parse_clock(value) for value in values[:len(slots)]]
+    if None in times:
+        bot.send_message(chat_id, "⚠️ Please use HH:MM times, e.g. /mealtimes 07:30 13:30 20:30")
+        return
+    try:
+        meal_times = dict(zip(slots, times))
+        moved = reminder_store.set_profile(chat_id, meal_times=meal_times)
+        updated = "\n".join(f"- {slot.capitalize()}: {value[:5]}" for slot, value in meal_times.items())
+        bot.send_message(chat_id, f"✅ Reminder times updated:\n{updated}\n\n⏰ {moved} reminder(s) rescheduled.")
+    except Exception as e:
+        logger.error(f"Error setting meal times: {e}")
+        bot.send_message(chat_id, "❌ Failed to save your meal times. Please try again.")
+
 @bot.message_handler(commands=['remove_pres', 'removePres'])
+@metrics.instrument_handler(BOT_NAME)
 def list_prescriptions_to_remove(message):
     chat_id = message.chat.id
-    reminders = load_json_data(REMINDER_FILE)
-
-    user_reminders = [r for r in reminders if str(r["chat_id"]) == str(chat_id)]
+    user_reminders = reminder_store.for_chat(chat_id)
 
     if not user_reminders:
         bot.send_message(chat_id, "✅ You don't have any active medication reminders.")
@@ -692,7 +1273,7 @@ def list_prescriptions_to_remove(message):
                 "dosage": reminder.get("dosage", "1 tablet"),
                 "times": set()
             }
-        medicine_map[name]["times"].add(reminder["time"].split()[1][:5])  # Just the time part
+        medicine_map[name]["times"].add(reminder["local_time"].split()[1][:5])  # Just the time part
 
     response_text = "💊 Your Active Medications:\n\n"
     keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
@@ -706,10 +1287,10 @@ def list_prescriptions_to_remove(message):
     bot.send_message(chat_id, response_text, reply_markup=keyboard)
     bot.register_next_step_handler(message, remove_selected_prescription)
 
+@metrics.instrument_handler(BOT_NAME)
 def remove_selected_prescription(message):
     chat_id = message.chat.id
-    reminders = load_json_data(REMINDER_FILE)
-    user_reminders = [r for r in reminders if str(r["chat_id"]) == str(chat_id)]
+    user_reminders = reminder_store.for_chat(chat_id)
 
     if not user_reminders:
         bot.send_message(chat_id, "❌ No active medication reminders found.")
@@ -734,12 +1315,7 @@ def remove_selected_prescription(message):
         medicine_to_remove = medicine_names[selected_index]
         
         # Remove all reminders for this medicine
-        new_reminders = [
-            r for r in reminders 
-            if not (str(r["chat_id"]) == str(chat_id) and r["medicine"] == medicine_to_remove)
-        ]
-
-        if save_json_data(new_reminders, REMINDER_FILE, append=False):
+        if reminder_store.remove_medicine(chat_id, medicine_to_remove):
             bot.send_message(
                 chat_id,
                 f"✅ Successfully removed all reminders for {medicine_to_remove}.",
@@ -760,23 +1336,25 @@ def remove_selected_prescription(message):
         )
 
 @bot.message_handler(content_types=['photo'])
+@metrics.instrument_handler(BOT_NAME)
 def handle_photo(message):
     # Check if this is likely a prescription or medical record
     if message.caption and ('prescription' in message.caption.lower() or 'medicine' in message.caption.lower()):
-        process_prescription(message, is_photo=True)
+        submit_upload(message, "prescription", process_prescription, message, True)
     else:
-        process_medical_record(message)
+        submit_upload(message, "medical_record", process_medical_record, message)
 
 @bot.message_handler(content_types=['text'])
+@metrics.instrument_handler(BOT_NAME)
 def handle_text(message):
     if message.text.startswith('/'):
         bot.send_message(message.chat.id, "❌ Unrecognized command. Type /start to see available commands.")
         return
     
     # Check if this looks like a prescription (medicine names, dosages, etc.)
-    medicine_keywords = ['mg', 'tablet', 'capsule', 'twice', 'daily', 'bd', 'tid', 'qid']
-    if any(keyword in message.text.lower() for keyword in medicine_keywords):
-        process_prescription(message, is_photo=False)
+    medicine_keywords = {'mg', 'tablet', 'capsule', 'twice', 'daily', 'bd', 'tid', 'qid'}
+    if medicine_keywords.intersection(sig_parser.tokenize(message.text)):
+        submit_upload(message, "prescription", process_prescription, message, False)
     else:
         bot.send_message(
             message.chat.id,
@@ -789,14 +1367,24 @@ def handle_text(message):
 def main():
     # Initial cleanup
     clean_old_reminders()
+
+    metrics.start_metrics_server(METRICS_PORT)
     
-    # Start reminder checker in a separate thread
-    import threading
-    reminder_thread = threading.Thread(target=check_reminders, daemon=True)
-    reminder_thread.start()
+    # Start reminder workers; partitions are shared with any other running instance
+    workers = start_reminder_workers(REMINDER_WORKERS)
+    upload_queue.start()
     
     logger.info("MedGuardian Bot started successfully!")
-    bot.polling(none_stop=True)
+    try:
+        if len(sys.argv) > 1 and sys.argv[1] == "worker":
+            # Reminder-only process: scale delivery out without another polling bot
+            while True:
+                time.sleep(3600)
+        else:
+            bot.polling(none_stop=True)
+    finally:
+        for worker_id in workers:
+            reminder_store.release(worker_id)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,184 @@
+import re
+import math
+import threading
+from datetime import datetime
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+FILTER_RE = re.compile(r"\b(from|since|after|to|until|before):(\d{4}-\d{2}-\d{2})\b", re.IGNORECASE)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is",
+    "it", "of", "on", "or", "the", "to", "was", "were", "with", "no", "not", "this", "that",
+}
+
+# Fields indexed per report and how much a match in each one counts
+FIELD_WEIGHTS = {
+    "type": 2.0,
+    "diagnosis": 2.0,
+    "key_findings": 1.5,
+    "recommendations": 1.0,
+    "summary": 1.0,
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def stem(word: str) -> str:
+    """Light suffix-stripping stemmer, enough to match plurals and verb forms"""
+    if len(word) <= 3 or word[0].isdigit():
+        return word
+    for suffix, replacement in (
+        ("ational", "ate"), ("ization", "ize"), ("fulness", "ful"), ("iveness", "ive"),
+        ("ements", ""), ("ement", ""), ("ments", ""), ("ment", ""),
+        ("ities", "ity"), ("ies", "y"), ("ing", ""), ("edly", ""), ("ed", ""),
+        ("ness", ""), ("ly", ""), ("es", ""), ("s", ""),
+    ):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            if suffix == "s" and word.endswith("ss"):
+                return word
+            word = word[: len(word) - len(suffix)] + replacement
+            break
+    return word
+
+
+def tokenize(text: str):
+    return [stem(t) for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _field_text(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(v) for v in value)
+    return str(value or "")
+
+
+def _parse_date(value: str):
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def parse_query(query: str):
+    """Split a query into search terms and an optional (since, until) date window"""
+    since = until = None
+    for key, value in FILTER_RE.findall(query):
+        date = datetime.strptime(value, "%Y-%m-%d")
+        if key.lower() in ("from", "since", "after"):
+            since = date
+        else:
+            until = date.replace(hour=23, minute=59, second=59)
+    terms = tokenize(FILTER_RE.sub(" ", query))
+    return terms, since, until
+
+
+class _ChatIndex:
+    __slots__ = ("postings", "docs", "total_length")
+
+    def __init__(self):
+        self.postings = {}  # term -> {doc_id: weighted term frequency}
+        self.docs = {}  # doc_id -> (length, upload datetime, report)
+        self.total_length = 0.0
+
+
+class MedicalSearchIndex:
+    """Per-chat inverted index over stored medical reports.
+
+    A chat's index is built from its stored reports on first search and is
+    then kept current by add_report(), so queries never rescan the records
+    file.
+    """
+
+    def __init__(self):
+        self._chats = {}
+        self._lock = threading.Lock()
+
+    def is_loaded(self, chat_id) -> bool:
+        return str(chat_id) in self._chats
+
+    def load_chat(self, chat_id, reports):
+        """(Re)build a chat's index from its stored (report_id, report) pairs"""
+        index = _ChatIndex()
+        for doc_id, report in reports:
+            self._index_report(index, doc_id, report)
+        with self._lock:
+            self._chats[str(chat_id)] = index
+
+    def add_report(self, chat_id, doc_id: int, report: dict):
+        """Index a newly saved report; ignored until the chat has been loaded"""
+        with self._lock:
+            index = self._chats.get(str(chat_id))
+            if index is not None and doc_id not in index.docs:
+                self._index_report(index, doc_id, report)
+
+    @staticmethod
+    def _index_report(index: _ChatIndex, doc_id: int, report: dict):
+        details = report.get("record_details") or {}
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(_field_text(details.get(field))):
+                weights[term] = weights.get(term, 0.0) + weight
+        length = sum(weights.values())
+        for term, tf in weights.items():
+            index.postings.setdefault(term, {})[doc_id] = tf
+        index.docs[doc_id] = (length, _parse_date(report.get("upload_time", "")), report)
+        index.total_length += length
+
+    def search(self, chat_id, query: str, limit: int = 5):
+        """Return [(doc_id, score, report)] best first, honouring from:/to: date filters"""
+        terms, since, until = parse_query(query)
+        with self._lock:
+            index = self._chats.get(str(chat_id))
+            if index is None or not index.docs:
+                return []
+            n_docs = len(index.docs)
+            avg_length = index.total_length / n_docs or 1.0
+
+            def in_window(doc_id):
+                uploaded = index.docs[doc_id][1]
+                if uploaded is None:
+                    return since is None and until is None
+                return (since is None or uploaded >= since) and (until is None or uploaded <= until)
+
+            if not terms:
+                # Only a date filter: newest matching reports first
+                matches = sorted((d for d in index.docs if in_window(d)), reverse=True)
+                return [(doc_id, 0.0, index.docs[doc_id][2]) for doc_id in matches[:limit]]
+
+            scores = {}
+            for term in set(terms):
+                postings = index.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = index.docs[doc_id][0]
+                    score = idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+
+            ranked = sorted(
+                ((doc_id, score, index.docs[doc_id][2]) for doc_id, score in scores.items() if in_window(doc_id)),
+                key=lambda item: (-item[1], -item[0]),
+            )
+        return ranked[:limit]
+
+
+def best_snippet(report: dict, query: str, max_length: int = 160) -> str:
+    """Pick the finding or diagnosis line sharing the most terms with the query"""
+    terms = set(parse_query(query)[0])
+    details = report.get("record_details") or {}
+    best, best_hits = "", 0
+    for field in ("diagnosis", "key_findings", "recommendations", "summary"):
+        value = details.get(field)
+        for line in value if isinstance(value, list) else [value]:
+            if not line:
+                continue
+            hits = len(terms.intersection(tokenize(str(line))))
+            if hits > best_hits:
+                best, best_hits = str(line), hits
+    if not best:
+        best = str(details.get("summary") or "")
+    return best if len(best) <= max_length else best[: max_length - 1] + "…"
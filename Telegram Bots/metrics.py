@@ -0,0 +1,289 @@
+import time
+import asyncio
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import deadlines
+import profiling
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, wide enough for OCR and Gemini round-trips
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, key, value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._functions = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        """Evaluate fn() at scrape time instead of storing a value"""
+        with self._lock:
+            self._functions[_label_key(labels)] = fn
+
+    def value(self, **labels) -> float:
+        key = _label_key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+            functions = list(self._functions.items())
+        for key, value in items:
+            yield self.name, key, value
+        for key, fn in functions:
+            try:
+                yield self.name, key, fn()
+            except Exception as e:
+                logger.error(f"Gauge {self.name} callback failed: {e}")
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_label_key(labels))
+        return series[-1] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                yield f"{self.name}_bucket", key + (("le", _format_value(bound)),), cumulative
+            yield f"{self.name}_sum", key, series[-2]
+            yield f"{self.name}_count", key, series[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, key, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Shared metric families used by all bots
+HANDLER_SECONDS = REGISTRY.histogram("bot_handler_seconds", "Telegram handler latency")
+HANDLER_ERRORS = REGISTRY.counter("bot_handler_errors_total", "Telegram handler calls that raised")
+GEMINI_SECONDS = REGISTRY.histogram("gemini_request_seconds", "Gemini API call latency")
+GEMINI_ERRORS = REGISTRY.counter("gemini_errors_total", "Gemini API calls that failed")
+OCR_SECONDS = REGISTRY.histogram("ocr_seconds", "EasyOCR job latency")
+OCR_ERRORS = REGISTRY.counter("ocr_errors_total", "EasyOCR jobs that failed")
+TTS_SECONDS = REGISTRY.histogram("tts_seconds", "gTTS voice reminder render latency")
+TTS_ERRORS = REGISTRY.counter("tts_errors_total", "gTTS renders that failed")
+REMINDER_LAG_SECONDS = REGISTRY.histogram(
+    "reminder_delivery_lag_seconds",
+    "Delay between a reminder's scheduled time and its delivery",
+    buckets=(0.5, 1, 5, 10, 30, 60, 120, 300, 600),
+)
+REMINDERS_SENT = REGISTRY.counter("reminders_sent_total", "Reminders delivered")
+QUEUE_DEPTH = REGISTRY.gauge("queue_depth", "Items waiting in a bot queue")
+
+
+@contextmanager
+def track(histogram: Histogram, errors: Counter, **labels):
+    """Time a block and count it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        errors.inc(**labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        if profiling.ENABLED and histogram is not HANDLER_SECONDS:
+            profiling.record_stage(histogram.name.replace("_request_seconds", "").replace("_seconds", ""), elapsed)
+
+
+def instrument_handler(bot_name: str, handler_name: str = None):
+    """Decorator recording latency and errors for a sync or async handler.
+
+    Each call also runs under the per-update deadline, which outbound API
+    calls made through resilience.call() inherit.
+    """
+    def decorator(func):
+        labels = {"bot": bot_name, "handler": handler_name or func.__name__}
+        # No-op unless PROFILE_SAMPLE_RATE or SLOW_REQUEST_MS is set
+        inner = profiling.wrap(func, bot_name, labels["handler"])
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with deadlines.deadline(deadlines.UPDATE_DEADLINE_SECONDS), \
+                        track(HANDLER_SECONDS, HANDLER_ERRORS, **labels):
+                    return await inner(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with deadlines.deadline(deadlines.UPDATE_DEADLINE_SECONDS), \
+                    track(HANDLER_SECONDS, HANDLER_ERRORS, **labels):
+                return inner(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """Serve /metrics on a daemon thread; a port of 0 or None disables it"""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, int(port)), _MetricsRequestHandler)
+    except OSError as e:
+        logger.error(f"Could not start metrics server on {host}:{port}: {e}")
+        return None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Metrics available at http://{host}:{server.server_port}/metrics")
+    return server
@@ -0,0 +1,124 @@
+"""LRU cache for heavyweight models (EasyOCR readers) under a memory budget.
+
+Models are loaded on first use and kept while they fit in budget_mb.
+When a load takes the total over budget, the least recently used models
+not currently borrowed are evicted until it fits again. Models left
+unused for idle_seconds are dropped on the next access. A model's size is
+the growth in process RSS while it loaded, falling back to default_mb
+where RSS can't be read.
+"""
+import gc
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MODELS_LOADED = metrics.REGISTRY.gauge("models_loaded", "Models held in a model cache")
+MODEL_MEMORY_MB = metrics.REGISTRY.gauge("model_memory_mb", "Estimated memory held by cached models")
+MODEL_LOADS = metrics.REGISTRY.counter("model_loads_total", "Models loaded into a model cache")
+MODEL_EVICTIONS = metrics.REGISTRY.counter("model_evictions_total", "Models evicted, by reason (budget or idle)")
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Entry:
+    __slots__ = ("model", "size_mb", "last_used", "users")
+
+    def __init__(self, model, size_mb: float):
+        self.model = model
+        self.size_mb = size_mb
+        self.last_used = time.monotonic()
+        self.users = 0
+
+
+class ModelCache:
+    def __init__(self, name: str, loader, budget_mb: float, idle_seconds: float, default_mb: float = 250.0):
+        self.name = name
+        self.loader = loader
+        self.budget_mb = budget_mb
+        self.idle_seconds = idle_seconds
+        self.default_mb = default_mb
+        self._entries = OrderedDict()  # key -> _Entry, least recently used first
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        MODELS_LOADED.set_function(lambda: len(self._entries), cache=name)
+        MODEL_MEMORY_MB.set_function(self.memory_mb, cache=name)
+
+    def memory_mb(self) -> float:
+        with self._lock:
+            return sum(entry.size_mb for entry in self._entries.values())
+
+    @contextmanager
+    def use(self, key):
+        """Borrow the model for key, loading it if needed; it can't be evicted while borrowed"""
+        entry = self._acquire(key)
+        try:
+            yield entry.model
+        finally:
+            with self._lock:
+                entry.users -= 1
+                entry.last_used = time.monotonic()
+
+    def _acquire(self, key) -> _Entry:
+        with self._lock:
+            self._evict_idle()
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.users += 1
+                self._entries.move_to_end(key)
+                return entry
+
+        # One load at a time: RSS deltas only mean something if loads don't overlap
+        with self._load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.users += 1
+                    self._entries.move_to_end(key)
+                    return entry
+            before = _rss_mb()
+            model = self.loader(key)
+            after = _rss_mb()
+            size_mb = after - before if before is not None and after is not None and after > before else self.default_mb
+            MODEL_LOADS.inc(cache=self.name)
+            logger.info(f"Loaded {self.name} model {key} (~{size_mb:.0f} MB)")
+
+            with self._lock:
+                entry = self._entries[key] = _Entry(model, size_mb)
+                entry.users += 1
+                self._evict_over_budget()
+                return entry
+
+    def _evict(self, key, reason: str) -> None:
+        del self._entries[key]
+        MODEL_EVICTIONS.inc(cache=self.name, reason=reason)
+        logger.info(f"Evicted {self.name} model {key} ({reason})")
+        gc.collect()
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items()
+                    if entry.users == 0 and now - entry.last_used > self.idle_seconds]:
+            self._evict(key, "idle")
+
+    def _evict_over_budget(self) -> None:
+        total = sum(entry.size_mb for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.budget_mb:
+                break
+            entry = self._entries[key]
+            if entry.users == 0:
+                total -= entry.size_mb
+                self._evict(key, "budget")
@@ -0,0 +1,151 @@
+"""Opt-in request profiling for the bots.
+
+PROFILE_SAMPLE_RATE (0-1) runs that fraction of handler calls under
+cProfile and writes each profile to PROFILE_DIR. SLOW_REQUEST_MS logs any
+request slower than the threshold to slow_requests.log with per-stage
+timings (ocr, gemini, tts, telegram, ...). With both unset, ENABLED is
+False and instrumented code paths are exactly what they were without it.
+"""
+import os
+import json
+import time
+import random
+import itertools
+import asyncio
+import cProfile
+import logging
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+SLOW_REQUEST_LOG = os.getenv("SLOW_REQUEST_LOG", "slow_requests.log")
+
+ENABLED = PROFILE_SAMPLE_RATE > 0 or SLOW_REQUEST_MS > 0
+
+_current = contextvars.ContextVar("profiling_request", default=None)
+_slow_logger = None
+_profile_seq = itertools.count()
+
+
+def _get_slow_logger():
+    global _slow_logger
+    if _slow_logger is None:
+        _slow_logger = logging.getLogger("slow_requests")
+        _slow_logger.propagate = False
+        handler = logging.FileHandler(SLOW_REQUEST_LOG)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _slow_logger.addHandler(handler)
+        _slow_logger.setLevel(logging.INFO)
+    return _slow_logger
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Add time spent in a stage to the request being profiled, if any"""
+    stages = _current.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def _timed_stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def stage(name: str):
+    """Time a block as a named stage of the current request"""
+    return _timed_stage(name) if ENABLED else nullcontext()
+
+
+def _start(bot: str, name: str):
+    profiler = None
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler, _current.set({}), time.perf_counter()
+
+
+def _finish(bot: str, name: str, state) -> None:
+    profiler, token, start = state
+    elapsed = time.perf_counter() - start
+    stages = _current.get() or {}
+    _current.reset(token)
+    if profiler is not None:
+        profiler.disable()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{bot}.{name}.{time.strftime('%Y%m%d-%H%M%S')}.{os.getpid()}.{next(_profile_seq)}.prof")
+            profiler.dump_stats(path)
+        except Exception as e:
+            logger.error(f"Could not write profile for {name}: {e}")
+    if SLOW_REQUEST_MS > 0 and elapsed * 1000 >= SLOW_REQUEST_MS:
+        timings = {key: round(value * 1000, 1) for key, value in stages.items()}
+        timings["other"] = round(max(elapsed - sum(stages.values()), 0.0) * 1000, 1)
+        _get_slow_logger().info(json.dumps({
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "bot": bot,
+            "handler": name,
+            "total_ms": round(elapsed * 1000, 1),
+            "stages_ms": timings,
+        }))
+
+
+@contextmanager
+def request(bot: str, name: str):
+    """Profile one unit of work (a handler call or a scheduler tick)"""
+    if not ENABLED or _current.get() is not None:
+        # Off, or nested inside a handler that is already being measured
+        yield
+        return
+    state = _start(bot, name)
+    try:
+        yield
+    finally:
+        _finish(bot, name, state)
+
+
+def wrap(func, bot: str, name: str):
+    """Wrap a sync or async handler in request(); returns func itself when disabled.
+
+    cProfile on a coroutine also sees whatever else the event loop runs
+    while it awaits, so async profiles are best read with that in mind.
+    """
+    if not ENABLED:
+        return func
+
+    if asyncio.iscoroutinefunction(func):
+        async def async_wrapper(*args, **kwargs):
+            with request(bot, name):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    def wrapper(*args, **kwargs):
+        with request(bot, name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def timed_request_sender(method, url, **kwargs):
+    """telebot apihelper.CUSTOM_REQUEST_SENDER that books Bot API calls as the telegram stage"""
+    import requests
+    with stage("telegram"):
+        return requests.request(method, url, **kwargs)
+
+
+def ptb_request(connection_pool_size: int = 256):
+    """HTTPXRequest for python-telegram-bot that books Bot API calls as the telegram stage"""
+    from telegram.request import HTTPXRequest
+
+    class TimedHTTPXRequest(HTTPXRequest):
+        async def do_request(self, *args, **kwargs):
+            with stage("telegram"):
+                return await super().do_request(*args, **kwargs)
+
+    return TimedHTTPXRequest(connection_pool_size=connection_pool_size)
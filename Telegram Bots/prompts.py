@@ -0,0 +1,249 @@
+"""Versioned prompt templates with token budgets.
+
+Each template renders with str.format. A template may name one field as
+its fit field (usually OCR text); that field is cut on line and word
+boundaries so the whole prompt stays within the template's token budget.
+Rendered sizes are recorded per template and version in
+prompt_tokens, and compact_ocr() removes repeated letterhead lines, stray
+symbols and boilerplate from OCR output before it goes into a prompt.
+"""
+import os
+import re
+import math
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-1.5-pro"
+# Average characters per token; Gemini's tokenizer lands close to 4 for English text
+CHARS_PER_TOKEN = {
+    "gemini-1.5-pro": 4.0,
+    "gemini-1.5-flash": 4.0,
+}
+
+PROMPT_TOKENS = metrics.REGISTRY.histogram(
+    "prompt_tokens", "Estimated input tokens per rendered prompt",
+    buckets=(50, 100, 250, 500, 1000, 1500, 2000, 3000, 4000, 8000),
+)
+PROMPT_TRUNCATIONS = metrics.REGISTRY.counter("prompt_truncations_total", "Prompts whose fit field was cut to the budget")
+OCR_COMPACTION_TOKENS = metrics.REGISTRY.counter("ocr_compaction_tokens_saved_total", "Estimated tokens removed by OCR compaction")
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+# Stray marks OCR picks up from borders, stamps and bullets
+_NOISE_TOKEN_RE = re.compile(r"^[|~`^_=*•·»«©®¦\[\]{}<>\\]+$")
+# Contact details are cut out wherever they appear
+_CONTACT_RE = re.compile(
+    r"(?:https?://|www\.)\S+"
+    r"|(?:\be-?mail\b\s*(?:id)?\s*[:#-]?\s*)?\S+@\S+\.\w+"
+    r"|\b(?:ph(?:one)?|tel|mob(?:ile)?|fax)\b\.?\s*(?:no\.?)?\s*[:#-]?\s*\+?\d[\d\s()/-]{5,}\d"
+    r"|\bpage\s+\d+\s*(?:of|/)\s*\d+\b",
+    re.IGNORECASE,
+)
+# Letterhead and footer lines are dropped whole, but only when short; a long
+# line is body text that happens to mention one of these
+_BOILERPLATE_RE = re.compile(
+    r"\b(?:gstin|reg(?:istration)?\.?\s*no|timings?\s*:|clinic hours|not valid for medico)",
+    re.IGNORECASE,
+)
+MAX_BOILERPLATE_WORDS = 12
+# Lines this long that recur are a letterhead or footer printed on every page. Shorter
+# ones are values ("Nil", "2") that legitimately repeat down a report, so all are kept
+MIN_REPEATED_WORDS = 6
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """Estimate the tokens text costs for model, without a network round-trip"""
+    chars = CHARS_PER_TOKEN.get(model, 4.0)
+    return sum(math.ceil(len(piece) / chars) for piece in _PIECE_RE.findall(text))
+
+
+def compact_ocr(text: str, model: str = DEFAULT_MODEL) -> str:
+    """Drop repeated long lines, stray symbols and contact/letterhead lines from OCR text"""
+    seen = set()
+    kept = []
+    for line in text.splitlines():
+        line = _CONTACT_RE.sub(" ", line)
+        words = [word for word in line.split() if not _NOISE_TOKEN_RE.match(word)]
+        if not words:
+            continue
+        line = " ".join(words)
+        if len(words) <= MAX_BOILERPLATE_WORDS and _BOILERPLATE_RE.search(line):
+            continue
+        key = re.sub(r"\W+", "", line).lower()
+        if not key:
+            continue
+        if len(words) >= MIN_REPEATED_WORDS:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    compacted = "\n".join(kept)
+    saved = count_tokens(text, model) - count_tokens(compacted, model)
+    if saved > 0:
+        OCR_COMPACTION_TOKENS.inc(saved)
+    return compacted
+
+
+def truncate_to_tokens(text: str, budget: int, model: str = DEFAULT_MODEL) -> str:
+    """Longest prefix of text within budget tokens, cut at a line or word boundary"""
+    if count_tokens(text, model) <= budget:
+        return text
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        cost = count_tokens(line, model)
+        if used + cost <= budget:
+            kept.append(line)
+            used += cost
+            continue
+        words = []
+        for word in line.split():
+            cost = count_tokens(word, model)
+            if used + cost > budget:
+                break
+            words.append(word)
+            used += cost
+        if words:
+            kept.append(" ".join(words))
+        break
+    return "\n".join(kept)
+
+
+class PromptTemplate:
+    def __init__(self, name: str, version: int, text: str, max_tokens: int = None, fit_field: str = None):
+        self.name = name
+        self.version = version
+        self.text = text
+        self.max_tokens = max_tokens
+        self.fit_field = fit_field
+
+    def render(self, model: str = DEFAULT_MODEL, **fields) -> str:
+        if self.fit_field and self.max_tokens:
+            fixed = self.text.format(**{**fields, self.fit_field: ""})
+            room = max(self.max_tokens - count_tokens(fixed, model), 0)
+            original = fields[self.fit_field]
+            fields[self.fit_field] = truncate_to_tokens(original, room, model)
+            if fields[self.fit_field] != original:
+                PROMPT_TRUNCATIONS.inc(prompt=self.name)
+                logger.info(f"Cut {self.fit_field} of {self.name} v{self.version} to {room} tokens")
+        prompt = self.text.format(**fields)
+        PROMPT_TOKENS.observe(count_tokens(prompt, model), prompt=self.name, version=str(self.version))
+        return prompt
+
+
+PRESCRIPTION = PromptTemplate(
+    "prescription", 3,
+    "Extract the medicines from this prescription text as JSON.\n"
+    "{format_hint}"
+    "Rules:\n"
+    "1. If frequency is not clear, assume 'twice daily'\n"
+    "2. Keep weekly, alternate-day and one-time frequencies as written (e.g. 'once weekly'), never as daily\n"
+    "3. Put a course length such as '5 days' in duration; leave it empty if none is given\n"
+    "4. If dosage is not clear, assume '1 tablet'\n"
+    "5. Return empty array if no medicines found\n\n"
+    "Prescription Text:\n{text}",
+    max_tokens=int(os.getenv("PRESCRIPTION_PROMPT_TOKENS", "1500")),
+    fit_field="text",
+)
+
+MEDICAL_RECORD = PromptTemplate(
+    "medical_record", 2,
+    "Analyze this medical document thoroughly and summarise it as JSON.\n"
+    "{format_hint}"
+    "\nDocument Text:\n{text}",
+    max_tokens=int(os.getenv("MEDICAL_RECORD_PROMPT_TOKENS", "2500")),
+    fit_field="text",
+)
+
+PRESCRIPTION_IMAGE = PromptTemplate(
+    "prescription_image", 2,
+    "Read the attached photo of a prescription and extract the medicines as JSON.\n"
+    "{format_hint}"
+    "Rules:\n"
+    "1. If frequency is not clear, assume 'twice daily'\n"
+    "2. Keep weekly, alternate-day and one-time frequencies as written (e.g. 'once weekly'), never as daily\n"
+    "3. Put a course length such as '5 days' in duration; leave it empty if none is given\n"
+    "4. If dosage is not clear, assume '1 tablet'\n"
+    "5. Ignore the letterhead, doctor and patient details\n"
+    "6. Return empty array if no medicines found\n",
+)
+
+MEDICAL_RECORD_IMAGE = PromptTemplate(
+    "medical_record_image", 1,
+    "Read the attached photo of a medical document thoroughly and summarise it as JSON.\n"
+    "{format_hint}",
+)
+
+DIET_PLAN = PromptTemplate(
+    "diet_plan", 2,
+    "Create a detailed personalized diet plan for a {diet_type} person with these characteristics:\n"
+    "- Chronic disease: {chronic_disease}\n"
+    "- Favorite meals: {meal_prefs}\n"
+    "- Spice preference: {spice_level}\n"
+    "- Allergies: {allergies}\n\n"
+    "Provide the response in this EXACT format:\n\n"
+    "**Overview:** [2-3 sentence overview of the diet plan]\n\n"
+    "**Breakfast:**\n"
+    "**Meal Name:** [name]\n"
+    "**Ingredients:**\n"
+    "- [ingredient 1]\n"
+    "- [ingredient 2]\n"
+    "**Instructions:**\n"
+    "1. [step 1]\n"
+    "2. [step 2]\n\n"
+    "**Lunch:** [same format as breakfast]\n\n"
+    "**Dinner:** [same format as breakfast]\n\n"
+    "**Snacks:**\n"
+    "* [snack 1]\n"
+    "* [snack 2]\n\n"
+    "**Important Notes:**\n"
+    "* [note 1]\n"
+    "* [note 2]\n",
+)
+
+# Shared by the text and photo recipe prompts
+_RECIPE_REQUIREMENTS = (
+    "Dietary Requirements:\n"
+    "- Diet: {diet_type}\n"
+    "- Allergies: {allergies}\n"
+    "- Health Condition: {chronic_disease}\n"
+    "- Spice Level: {spice_level}\n\n"
+    "Format:\n\n"
+    "🍴 **Recipe Name**: [Creative name]\n\n"
+    "📝 **Ingredients**:\n"
+    "- [Ingredient 1]\n"
+    "- [Ingredient 2]\n\n"
+    "👩‍🍳 **Instructions**:\n"
+    "1. [Step 1]\n"
+    "2. [Step 2]\n\n"
+    "⏱ **Prep Time**: [X mins]\n"
+    "🔥 **Difficulty**: [Easy/Medium/Hard]\n"
+)
+
+RECIPE = PromptTemplate(
+    "recipe", 1,
+    "Create a healthy recipe using these ingredients: {ingredients}\n\n" + _RECIPE_REQUIREMENTS,
+    max_tokens=int(os.getenv("RECIPE_PROMPT_TOKENS", "800")),
+    fit_field="ingredients",
+)
+
+RECIPE_IMAGE = PromptTemplate(
+    "recipe_image", 1,
+    "Identify the ingredients in the attached photo and create a healthy recipe using them.\n\n"
+    + _RECIPE_REQUIREMENTS,
+)
+
+HEALTH_SUGGESTIONS = PromptTemplate(
+    "health_suggestions", 1,
+    "Provide exactly 3 specific suggestions to improve this daily schedule "
+    "for someone with chronic health conditions. Focus on:\n"
+    "1. Better activity timing\n"
+    "2. Healthier alternatives\n"
+    "3. Important additions\n"
+    "Format each suggestion as a short bullet point starting with '* '\n\n"
+    "Current schedule:\n{tasks}",
+    max_tokens=int(os.getenv("SUGGESTIONS_PROMPT_TOKENS", "800")),
+    fit_field="tasks",
+)
@@ -0,0 +1,599 @@
+import re
+import json
+import math
+import itertools
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_PARTITIONS = 16
+DEFAULT_LEASE_SECONDS = 90
+
+OFFSET_RE = re.compile(r"^(?:utc|gmt)?\s*([+-])(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+CLOCK_RE = re.compile(r"^([01]?\d|2[0-3])[:.]([0-5]\d)$")
+
+
+def partition_for(chat_id, partitions: int = DEFAULT_PARTITIONS) -> int:
+    """Stable chat -> partition mapping (crc32, unlike hash(), is the same in every process)"""
+    return zlib.crc32(str(chat_id).encode("utf-8")) % partitions
+
+
+def resolve_timezone(name):
+    """tzinfo for an IANA zone name ("Asia/Kolkata") or UTC offset ("+05:30"), else None"""
+    if not name:
+        return None
+    name = name.strip()
+    offset = OFFSET_RE.match(name)
+    if offset:
+        sign, hours, minutes = offset.groups()
+        delta = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        if delta > timedelta(hours=14):
+            return None
+        return timezone(-delta if sign == "-" else delta)
+    if name.lower() in ("utc", "gmt", "z"):
+        return timezone.utc
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def parse_clock(value: str):
+    """"7:30" / "19.45" -> "07:30:00", or None"""
+    match = CLOCK_RE.match(value.strip())
+    if not match:
+        return None
+    return f"{int(match.group(1)):02d}:{match.group(2)}:00"
+
+
+def next_fire_utc(local_time: str, tz, after: datetime) -> datetime:
+    """Next UTC instant strictly after `after` (naive UTC) at local_time "HH:MM:SS" in tz"""
+    clock = datetime.strptime(local_time, "%H:%M:%S").time()
+    local_after = after.replace(tzinfo=timezone.utc).astimezone(tz)
+    candidate = datetime.combine(local_after.date(), clock, tzinfo=tz)
+    if candidate <= local_after:
+        candidate = datetime.combine(local_after.date() + timedelta(days=1), clock, tzinfo=tz)
+    return candidate.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class ReminderStore:
+    """Medicine reminders shared by any number of worker processes.
+
+    Reminders are split into partitions by chat_id hash. A worker only
+    dispatches reminders of the partitions it holds a lease on; leases are
+    renewed on every poll and spread evenly over the live workers, so when
+    one stops renewing, the others pick its partitions up once the lease
+    expires. Each send is claimed in the dispatches table first, so two
+    workers never deliver the same reminder.
+
+    fire_at is always UTC. Daily reminders remember their meal slot and,
+    after each send or a profile change, move to the next fire time
+    computed from the chat's timezone and meal times.
+    """
+
+    def __init__(self, path: str, partitions: int = DEFAULT_PARTITIONS,
+                 lease_seconds: int = DEFAULT_LEASE_SECONDS, default_meal_times=None, default_timezone=None):
+        self.partitions = partitions
+        self.lease_seconds = lease_seconds
+        self.default_meal_times = dict(default_meal_times or {})
+        # None means the server's local timezone, as before per-user profiles
+        self.default_timezone = resolve_timezone(default_timezone) or datetime.now().astimezone().tzinfo
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE,
+        # which takes the database write lock so lease changes are atomic across processes
+        self._path = path
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS reminders ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " chat_id TEXT NOT NULL,"
+                " partition INTEGER NOT NULL,"
+                " medicine TEXT NOT NULL,"
+                " dosage TEXT,"
+                " message TEXT NOT NULL,"
+                " fire_at TEXT NOT NULL,"
+                " created_at TEXT);"
+                "CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (partition, fire_at);"
+                "CREATE INDEX IF NOT EXISTS idx_reminders_chat ON reminders (chat_id, medicine);"
+                "CREATE TABLE IF NOT EXISTS user_profiles ("
+                " chat_id TEXT PRIMARY KEY,"
+                " timezone TEXT,"
+                " meal_times TEXT);"
+                "CREATE TABLE IF NOT EXISTS reminder_leases ("
+                " partition INTEGER PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " expires_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS reminder_workers ("
+                " owner TEXT PRIMARY KEY,"
+                " heartbeat_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS reminder_dispatches ("
+                " reminder_id INTEGER NOT NULL,"
+                " fire_at TEXT NOT NULL,"
+                " owner TEXT NOT NULL,"
+                " claimed_at REAL NOT NULL,"
+                " sent_at REAL,"
+                " PRIMARY KEY (reminder_id, fire_at));"
+            )
+        self._transaction(self._migrate)
+
+    def _migrate(self, conn):
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(reminders)")}
+        if "slot" not in columns:
+            # Older rows are one-shot reminders stored in server-local time
+            conn.execute("ALTER TABLE reminders ADD COLUMN slot TEXT")
+            rows = conn.execute("SELECT id, fire_at FROM reminders").fetchall()
+            conn.executemany(
+                "UPDATE reminders SET fire_at = ? WHERE id = ?",
+                [(self._local_to_utc(fire_at), reminder_id) for reminder_id, fire_at in rows],
+            )
+        if "snooze_until" not in columns:
+            # A snoozed dose re-fires from these columns instead of a new row
+            conn.execute("ALTER TABLE reminders ADD COLUMN snooze_until TEXT")
+            conn.execute("ALTER TABLE reminders ADD COLUMN snooze_dose TEXT")
+        if "ends_at" not in columns:
+            # Last fire time of a course ("for 5 days"); NULL keeps reminding
+            conn.execute("ALTER TABLE reminders ADD COLUMN ends_at TEXT")
+        if "language" not in {row[1] for row in conn.execute("PRAGMA table_info(user_profiles)")}:
+            conn.execute("ALTER TABLE user_profiles ADD COLUMN language TEXT")
+
+    @staticmethod
+    def _local_to_utc(value: str) -> str:
+        local = datetime.strptime(value, TIME_FORMAT).astimezone()
+        return local.astimezone(timezone.utc).strftime(TIME_FORMAT)
+
+    def _transaction(self, fn):
+        """Run fn(conn) inside BEGIN IMMEDIATE, holding the write lock across processes"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    # Profiles
+
+    def _load_profile(self, conn, chat_id: str):
+        row = conn.execute(
+            "SELECT timezone, meal_times FROM user_profiles WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+        tz_name, meal_times = (row or (None, None))
+        merged = dict(self.default_meal_times)
+        if meal_times:
+            merged.update(json.loads(meal_times))
+        return tz_name, resolve_timezone(tz_name) or self.default_timezone, merged
+
+    def get_profile(self, chat_id):
+        """(timezone name or None, tzinfo, {slot: "HH:MM:SS"}) with defaults filled in"""
+        with self._lock:
+            return self._load_profile(self._conn, str(chat_id))
+
+    def set_profile(self, chat_id, timezone_name=None, meal_times=None) -> int:
+        """Update a chat's timezone and/or meal times and reschedule only that chat's
+        daily reminders; returns how many moved"""
+        chat_id = str(chat_id)
+
+        def update(conn):
+            row = conn.execute(
+                "SELECT timezone, meal_times FROM user_profiles WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            current_tz, current_meals = row or (None, None)
+            meals = json.loads(current_meals) if current_meals else {}
+            if meal_times:
+                meals.update(meal_times)
+            conn.execute(
+                "INSERT INTO user_profiles (chat_id, timezone, meal_times) VALUES (?, ?, ?)"
+                " ON CONFLICT(chat_id) DO UPDATE SET timezone = excluded.timezone, meal_times = excluded.meal_times",
+                (chat_id, timezone_name or current_tz, json.dumps(meals)),
+            )
+            return self._reschedule_chat(conn, chat_id)
+        return self._transaction(update)
+
+    def get_language(self, chat_id):
+        """The chat's language code, or None if it never picked one"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT language FROM user_profiles WHERE chat_id = ?", (str(chat_id),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_language(self, chat_id, language: str) -> None:
+        def update(conn):
+            conn.execute(
+                "INSERT INTO user_profiles (chat_id, language) VALUES (?, ?)"
+                " ON CONFLICT(chat_id) DO UPDATE SET language = excluded.language",
+                (str(chat_id), language),
+            )
+        self._transaction(update)
+
+    def _reschedule_chat(self, conn, chat_id: str) -> int:
+        _, tz, meal_times = self._load_profile(conn, chat_id)
+        now = utc_now()
+        rows = conn.execute(
+            "SELECT id, slot, ends_at FROM reminders WHERE chat_id = ? AND slot IS NOT NULL", (chat_id,)
+        ).fetchall()
+        updates, finished = [], []
+        for reminder_id, slot, ends_at in rows:
+            if slot not in meal_times:
+                continue
+            fire_at = next_fire_utc(meal_times[slot], tz, now).strftime(TIME_FORMAT)
+            if ends_at and fire_at > ends_at:
+                finished.append((reminder_id,))
+            else:
+                updates.append((fire_at, reminder_id))
+        conn.executemany("UPDATE reminders SET fire_at = ? WHERE id = ?", updates)
+        conn.executemany("DELETE FROM reminders WHERE id = ?", finished)
+        return len(updates)
+
+    # Reminder CRUD
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM reminders LIMIT 1").fetchone() is None
+
+    def import_reminders(self, reminders) -> int:
+        """Bulk-load one-shot reminders from the legacy medicine_reminders.json layout"""
+        rows = []
+        for reminder in reminders:
+            if not isinstance(reminder, dict) or not reminder.get("chat_id") or not reminder.get("time"):
+                continue
+            chat_id = str(reminder["chat_id"])
+            rows.append((chat_id, partition_for(chat_id, self.partitions), reminder["medicine"],
+                         reminder.get("dosage"), reminder["message"], self._local_to_utc(reminder["time"]),
+                         reminder.get("created_at")))
+
+        def insert(conn):
+            conn.executemany(
+                "INSERT INTO reminders (chat_id, partition, medicine, dosage, message, fire_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", rows,
+            )
+        self._transaction(insert)
+        return len(rows)
+
+    def replace_medicine(self, chat_id, medicine: str, dosage: str, message: str, slots, ends_at=None):
+        """Swap a chat's reminders for one medicine (matched case-insensitively) for one
+        daily reminder per slot, stopping after ends_at (naive UTC) if given; returns the
+        local "HH:MM" times used"""
+        chat_id = str(chat_id)
+        partition = partition_for(chat_id, self.partitions)
+        ends_at = ends_at.strftime(TIME_FORMAT) if ends_at else None
+
+        def replace(conn):
+            _, tz, meal_times = self._load_profile(conn, chat_id)
+            now = utc_now()
+            created_at = now.strftime(TIME_FORMAT)
+            conn.execute(
+                "DELETE FROM reminders WHERE chat_id = ? AND lower(medicine) = lower(?)", (chat_id, medicine)
+            )
+            conn.executemany(
+                "INSERT INTO reminders (chat_id, partition, medicine, dosage, message, fire_at, created_at, slot,"
+                " ends_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(chat_id, partition, medicine, dosage, message,
+                  next_fire_utc(meal_times[slot], tz, now).strftime(TIME_FORMAT), created_at, slot, ends_at)
+                 for slot in slots],
+            )
+            return [meal_times[slot][:5] for slot in slots]
+        return self._transaction(replace)
+
+    def get(self, reminder_id: int):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM reminders WHERE id = ?", (reminder_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def snooze(self, reminder_id: int, dose_at: str, until: datetime) -> bool:
+        """Re-fire a dose at `until` (naive UTC); the daily schedule itself is untouched"""
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE reminders SET snooze_until = ?, snooze_dose = ? WHERE id = ?",
+            (until.strftime(TIME_FORMAT), dose_at, reminder_id),
+        ).rowcount == 1)
+
+    def remove_medicine(self, chat_id, medicine: str) -> int:
+        return self._transaction(lambda conn: conn.execute(
+            "DELETE FROM reminders WHERE chat_id = ? AND medicine = ?", (str(chat_id), medicine)
+        ).rowcount)
+
+    COLUMNS = "id, chat_id, medicine, dosage, message, fire_at, created_at, slot"
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        reminder_id, chat_id, medicine, dosage, message, fire_at, created_at, slot = row
+        return {"id": reminder_id, "chat_id": chat_id, "medicine": medicine, "dosage": dosage,
+                "message": message, "time": fire_at, "created_at": created_at, "slot": slot}
+
+    def for_chat(self, chat_id):
+        """A chat's reminders, each with its next fire time also given in the chat's timezone"""
+        chat_id = str(chat_id)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM reminders WHERE chat_id = ? ORDER BY id", (chat_id,),
+            ).fetchall()
+            _, tz, _ = self._load_profile(self._conn, chat_id)
+        reminders = []
+        for row in rows:
+            reminder = self._to_dict(row)
+            fire_at = datetime.strptime(reminder["time"], TIME_FORMAT).replace(tzinfo=timezone.utc)
+            reminder["local_time"] = fire_at.astimezone(tz).strftime(TIME_FORMAT)
+            reminders.append(reminder)
+        return reminders
+
+    def has_chat(self, chat_id) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM reminders WHERE chat_id = ? LIMIT 1", (str(chat_id),)
+            ).fetchone() is not None
+
+    def delete_chat(self, chat_id) -> int:
+        """Drop all of a chat's reminders and their dispatch records; the profile stays"""
+        chat_id = str(chat_id)
+
+        def delete(conn):
+            conn.execute(
+                "DELETE FROM reminder_dispatches WHERE reminder_id IN (SELECT id FROM reminders WHERE chat_id = ?)",
+                (chat_id,),
+            )
+            return conn.execute("DELETE FROM reminders WHERE chat_id = ?", (chat_id,)).rowcount
+        return self._transaction(delete)
+
+    def medicines(self, chat_id):
+        """Names of the medicines a chat has reminders for"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT medicine FROM reminders WHERE chat_id = ?", (str(chat_id),)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
+
+    def delete_older_than(self, cutoff: datetime) -> int:
+        """Drop one-shot reminders and dispatch records from before cutoff (naive UTC)"""
+        cutoff_text = cutoff.strftime(TIME_FORMAT)
+
+        def delete(conn):
+            removed = conn.execute(
+                "DELETE FROM reminders WHERE slot IS NULL AND fire_at < ?", (cutoff_text,)
+            ).rowcount
+            conn.execute("DELETE FROM reminder_dispatches WHERE fire_at < ?", (cutoff_text,))
+            return removed
+        return self._transaction(delete)
+
+    # Export and import
+
+    EXPORT_COLUMNS = ("id, chat_id, medicine, dosage, message, fire_at, created_at, slot, snooze_until, snooze_dose,"
+                      " ends_at")
+
+    def _stream(self, sql: str, params=()):
+        """Iterate a query on a separate connection, so a long export never holds the store lock"""
+        conn = sqlite3.connect(self._path, timeout=30)
+        try:
+            yield from conn.execute(sql, params)
+        finally:
+            conn.close()
+
+    def export_profiles(self, chat_id=None):
+        """(chat_id, timezone, meal_times JSON, language) rows for one chat or all"""
+        sql = "SELECT chat_id, timezone, meal_times, language FROM user_profiles"
+        if chat_id is None:
+            return self._stream(sql)
+        return self._stream(sql + " WHERE chat_id = ?", (str(chat_id),))
+
+    def export_reminders(self, chat_id=None):
+        """Rows of EXPORT_COLUMNS for one chat or all, in id order"""
+        sql = f"SELECT {self.EXPORT_COLUMNS} FROM reminders"
+        if chat_id is None:
+            return self._stream(sql + " ORDER BY id")
+        return self._stream(sql + " WHERE chat_id = ? ORDER BY id", (str(chat_id),))
+
+    def import_profiles(self, rows, batch_size: int = 5000) -> int:
+        """Upsert (chat_id, timezone, meal_times JSON, language) rows, batch_size per transaction"""
+        rows = iter(rows)
+        count = 0
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return count
+            self._transaction(lambda conn: conn.executemany(
+                "INSERT INTO user_profiles (chat_id, timezone, meal_times, language) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(chat_id) DO UPDATE SET timezone = excluded.timezone,"
+                " meal_times = excluded.meal_times, language = excluded.language", batch,
+            ))
+            count += len(batch)
+
+    def import_rows(self, rows, batch_size: int = 5000) -> dict:
+        """Insert rows of EXPORT_COLUMNS under fresh ids; returns {exported id: new id}.
+        Rows exported before a column was added may stop short of it."""
+        rows = iter(rows)
+        ids = {}
+        width = len(self.EXPORT_COLUMNS.split(",")) - 2
+
+        def insert(conn, batch):
+            for old_id, chat_id, *values in batch:
+                chat_id = str(chat_id)
+                values = (values + [None] * width)[:width]
+                ids[old_id] = conn.execute(
+                    "INSERT INTO reminders (chat_id, partition, medicine, dosage, message, fire_at, created_at,"
+                    " slot, snooze_until, snooze_dose, ends_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (chat_id, partition_for(chat_id, self.partitions), *values),
+                ).lastrowid
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return ids
+            self._transaction(lambda conn: insert(conn, batch))
+
+    # Partition leases
+
+    def acquire_partitions(self, owner: str):
+        """Heartbeat, renew held leases and rebalance toward a fair share; returns owned partitions"""
+        def rebalance(conn):
+            now = time.time()
+            conn.execute(
+                "INSERT INTO reminder_workers (owner, heartbeat_at) VALUES (?, ?)"
+                " ON CONFLICT(owner) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (owner, now),
+            )
+            conn.execute("DELETE FROM reminder_workers WHERE heartbeat_at < ?", (now - self.lease_seconds,))
+            live_workers = conn.execute("SELECT COUNT(*) FROM reminder_workers").fetchone()[0]
+            fair_share = math.ceil(self.partitions / max(live_workers, 1))
+
+            owned = [p for (p,) in conn.execute(
+                "SELECT partition FROM reminder_leases WHERE owner = ? AND expires_at >= ? ORDER BY partition",
+                (owner, now),
+            )]
+            # Give back surplus partitions so newly started workers get their share
+            for partition in owned[fair_share:]:
+                conn.execute("DELETE FROM reminder_leases WHERE partition = ? AND owner = ?", (partition, owner))
+            owned = owned[:fair_share]
+
+            if len(owned) < fair_share:
+                taken = {p: (o, exp) for p, o, exp in conn.execute(
+                    "SELECT partition, owner, expires_at FROM reminder_leases"
+                )}
+                for partition in range(self.partitions):
+                    if len(owned) >= fair_share:
+                        break
+                    if partition in owned:
+                        continue
+                    holder = taken.get(partition)
+                    if holder is None or holder[1] < now:
+                        owned.append(partition)
+
+            expires_at = now + self.lease_seconds
+            conn.executemany(
+                "INSERT INTO reminder_leases (partition, owner, expires_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(partition) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                [(partition, owner, expires_at) for partition in owned],
+            )
+            return sorted(owned)
+        return self._transaction(rebalance)
+
+    def release(self, owner: str) -> None:
+        """Hand back all leases on clean shutdown so failover is immediate"""
+        def release(conn):
+            conn.execute("DELETE FROM reminder_leases WHERE owner = ?", (owner,))
+            conn.execute("DELETE FROM reminder_workers WHERE owner = ?", (owner,))
+        self._transaction(release)
+
+    # Dispatch
+
+    def due(self, partitions, since: datetime, until: datetime):
+        """Reminders in the given partitions firing in [since, until] (naive UTC) that nobody has claimed.
+
+        "time" is the instant being dispatched (the dispatch key) and
+        "dose_at" the scheduled dose it belongs to; they differ for snoozes.
+        """
+        if not partitions:
+            return []
+        placeholders = ",".join("?" * len(partitions))
+        columns = ", ".join(f"r.{column}" for column in self.COLUMNS.split(", "))
+        window = (since.strftime(TIME_FORMAT), until.strftime(TIME_FORMAT))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns}, r.fire_at, r.fire_at, 0 FROM reminders r"
+                f" WHERE r.partition IN ({placeholders}) AND r.fire_at BETWEEN ? AND ?"
+                " AND NOT EXISTS (SELECT 1 FROM reminder_dispatches d"
+                " WHERE d.reminder_id = r.id AND d.fire_at = r.fire_at)"
+                f" UNION ALL SELECT {columns}, r.snooze_until, r.snooze_dose, 1 FROM reminders r"
+                f" WHERE r.partition IN ({placeholders}) AND r.snooze_until BETWEEN ? AND ?"
+                " AND NOT EXISTS (SELECT 1 FROM reminder_dispatches d"
+                " WHERE d.reminder_id = r.id AND d.fire_at = r.snooze_until)"
+                " ORDER BY 9",
+                (*partitions, *window, *partitions, *window),
+            ).fetchall()
+        reminders = []
+        for row in rows:
+            reminder = self._to_dict(row[:8])
+            reminder["time"], reminder["dose_at"], reminder["snoozed"] = row[8], row[9], bool(row[10])
+            reminders.append(reminder)
+        return reminders
+
+    def claim_dispatch(self, reminder: dict, owner: str) -> bool:
+        """Record intent to send; False if another worker claimed it or our lease lapsed"""
+        partition = partition_for(reminder["chat_id"], self.partitions)
+
+        def claim(conn):
+            now = time.time()
+            lease = conn.execute(
+                "SELECT 1 FROM reminder_leases WHERE partition = ? AND owner = ? AND expires_at >= ?",
+                (partition, owner, now),
+            ).fetchone()
+            if lease is None:
+                return False
+            return conn.execute(
+                "INSERT OR IGNORE INTO reminder_dispatches (reminder_id, fire_at, owner, claimed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (reminder["id"], reminder["time"], owner, now),
+            ).rowcount == 1
+        return self._transaction(claim)
+
+    def _advance(self, conn, reminder_id: int, chat_id: str, slot, after: datetime):
+        """Move a daily reminder to its next fire time after `after`; delete a one-shot one,
+        or a daily one whose course ends before then"""
+        _, tz, meal_times = self._load_profile(conn, chat_id)
+        if slot in meal_times:
+            fire_at = next_fire_utc(meal_times[slot], tz, after).strftime(TIME_FORMAT)
+            row = conn.execute("SELECT ends_at FROM reminders WHERE id = ?", (reminder_id,)).fetchone()
+            if not (row and row[0] and fire_at > row[0]):
+                conn.execute("UPDATE reminders SET fire_at = ? WHERE id = ?", (fire_at, reminder_id))
+                return
+        conn.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+
+    def mark_sent(self, reminder: dict) -> None:
+        """Complete a dispatch and schedule the reminder's next occurrence"""
+        def complete(conn):
+            conn.execute(
+                "UPDATE reminder_dispatches SET sent_at = ? WHERE reminder_id = ? AND fire_at = ?",
+                (time.time(), reminder["id"], reminder["time"]),
+            )
+            if reminder.get("snoozed"):
+                conn.execute(
+                    "UPDATE reminders SET snooze_until = NULL, snooze_dose = NULL WHERE id = ?", (reminder["id"],)
+                )
+                return
+            fired_at = datetime.strptime(reminder["time"], TIME_FORMAT)
+            self._advance(conn, reminder["id"], reminder["chat_id"], reminder["slot"], fired_at)
+        self._transaction(complete)
+
+    def skip_missed(self, partitions, before: datetime) -> int:
+        """Reminders in owned partitions whose send window passed (e.g. downtime or an
+        abandoned claim): daily ones move to their next fire time, one-shot ones are dropped"""
+        if not partitions:
+            return 0
+        placeholders = ",".join("?" * len(partitions))
+
+        def skip(conn):
+            rows = conn.execute(
+                f"SELECT id, chat_id, slot FROM reminders WHERE partition IN ({placeholders}) AND fire_at < ?"
+                # A claim younger than a lease may still be sending; an older one was abandoned
+                " AND NOT EXISTS (SELECT 1 FROM reminder_dispatches d"
+                " WHERE d.reminder_id = reminders.id AND d.fire_at = reminders.fire_at AND d.claimed_at >= ?)",
+                (*partitions, before.strftime(TIME_FORMAT), time.time() - self.lease_seconds),
+            ).fetchall()
+            now = utc_now()
+            for reminder_id, chat_id, slot in rows:
+                self._advance(conn, reminder_id, chat_id, slot, now)
+            conn.execute(
+                f"UPDATE reminders SET snooze_until = NULL, snooze_dose = NULL"
+                f" WHERE partition IN ({placeholders}) AND snooze_until < ?",
+                (*partitions, before.strftime(TIME_FORMAT)),
+            )
+            return len(rows)
+        return self._transaction(skip)
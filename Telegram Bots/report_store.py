@@ -0,0 +1,168 @@
+import json
+import sqlite3
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ReportStore:
+    """SQLite index of medical reports keyed by chat.
+
+    Rows carry an autoincrement id that doubles as a pagination cursor, so a
+    page of reports is one indexed range scan no matter how many reports a
+    chat has.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS medical_reports ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " chat_id TEXT NOT NULL,"
+                " file_name TEXT,"
+                " upload_time TEXT,"
+                " details TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_medical_reports_chat ON medical_reports (chat_id, id)"
+            )
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM medical_reports LIMIT 1").fetchone() is None
+
+    def import_records(self, records) -> int:
+        """Bulk-load reports from the legacy user_medical_records.json layout"""
+        rows = []
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            for report in record.get("medical_reports") or []:
+                rows.append((
+                    str(record.get("chat_id")),
+                    report.get("file_name"),
+                    report.get("upload_time"),
+                    json.dumps(report.get("record_details") or {}),
+                ))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO medical_reports (chat_id, file_name, upload_time, details) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def add(self, chat_id, report: dict) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO medical_reports (chat_id, file_name, upload_time, details) VALUES (?, ?, ?, ?)",
+                (str(chat_id), report.get("file_name"), report.get("upload_time"),
+                 json.dumps(report.get("record_details") or {})),
+            )
+            return cursor.lastrowid
+
+    @staticmethod
+    def _to_report(row) -> tuple:
+        report_id, file_name, upload_time, details = row
+        try:
+            record_details = json.loads(details)
+        except ValueError:
+            record_details = {}
+        return report_id, {"file_name": file_name, "upload_time": upload_time, "record_details": record_details}
+
+    def count(self, chat_id) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM medical_reports WHERE chat_id = ?", (str(chat_id),)
+            ).fetchone()[0]
+
+    def delete_chat(self, chat_id) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM medical_reports WHERE chat_id = ?", (str(chat_id),)).rowcount
+
+    def iter_reports(self, chat_id):
+        """All of a chat's reports, oldest first, as (id, report)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, file_name, upload_time, details FROM medical_reports WHERE chat_id = ? ORDER BY id",
+                (str(chat_id),),
+            ).fetchall()
+        return [self._to_report(row) for row in rows]
+
+    def export_rows(self, chat_id=None):
+        """Stream (id, chat_id, file_name, upload_time, details JSON) rows for one chat or all.
+
+        Runs on its own connection, so exporting every report never holds
+        the store lock or loads the table into memory.
+        """
+        sql = "SELECT id, chat_id, file_name, upload_time, details FROM medical_reports"
+        params = ()
+        if chat_id is not None:
+            sql += " WHERE chat_id = ?"
+            params = (str(chat_id),)
+        conn = sqlite3.connect(self._path, timeout=30)
+        try:
+            yield from conn.execute(sql + " ORDER BY id", params)
+        finally:
+            conn.close()
+
+    def import_rows(self, rows, batch_size: int = 5000) -> int:
+        """Insert (chat_id, file_name, upload_time, details JSON) rows, batch_size per transaction"""
+        rows = iter(rows)
+        count = 0
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return count
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT INTO medical_reports (chat_id, file_name, upload_time, details) VALUES (?, ?, ?, ?)",
+                    batch,
+                )
+            count += len(batch)
+
+    def page(self, chat_id, before: int = None, after: int = None, size: int = 5):
+        """One page of reports, newest first.
+
+        before returns the page of reports older than that id, after the page
+        newer than it, neither the newest page. Returns
+        (reports, has_older, has_newer) with reports as [(id, report)].
+        """
+        chat_id = str(chat_id)
+        with self._lock:
+            if after is not None:
+                rows = self._conn.execute(
+                    "SELECT id, file_name, upload_time, details FROM medical_reports"
+                    " WHERE chat_id = ? AND id > ? ORDER BY id ASC LIMIT ?",
+                    (chat_id, after, size + 1),
+                ).fetchall()
+                has_newer = len(rows) > size
+                rows = list(reversed(rows[:size]))
+                has_older = bool(rows) and self._exists(chat_id, "id < ?", rows[-1][0])
+            else:
+                if before is None:
+                    rows = self._conn.execute(
+                        "SELECT id, file_name, upload_time, details FROM medical_reports"
+                        " WHERE chat_id = ? ORDER BY id DESC LIMIT ?",
+                        (chat_id, size + 1),
+                    ).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        "SELECT id, file_name, upload_time, details FROM medical_reports"
+                        " WHERE chat_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                        (chat_id, before, size + 1),
+                    ).fetchall()
+                has_older = len(rows) > size
+                rows = rows[:size]
+                has_newer = bool(rows) and self._exists(chat_id, "id > ?", rows[0][0])
+        return [self._to_report(row) for row in rows], has_older, has_newer
+
+    def _exists(self, chat_id: str, condition: str, value: int) -> bool:
+        return self._conn.execute(
+            f"SELECT 1 FROM medical_reports WHERE chat_id = ? AND {condition} LIMIT 1", (chat_id, value)
+        ).fetchone() is not None
@@ -0,0 +1,181 @@
+"""Circuit breaking, hedging and deadlines for outbound API calls.
+
+call() runs fn(timeout) where timeout is whatever is left of the current
+update's deadline (see deadlines.py), guarded by a per-endpoint circuit
+breaker. With hedging enabled, a duplicate request is started once the
+first has been outstanding longer than the endpoint's recent p95, and the
+first answer wins. Only use hedging for idempotent calls.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import metrics
+from deadlines import DeadlineExceeded, remaining
+
+logger = logging.getLogger(__name__)
+
+HEDGE_ENABLED = os.getenv("GEMINI_HEDGE", "0") == "1"
+# Calls slower than this count against the breaker like errors do
+SLOW_CALL_SECONDS = float(os.getenv("SLOW_CALL_SECONDS", "15"))
+
+CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+BREAKER_STATE = metrics.REGISTRY.gauge("circuit_breaker_state", "0 closed, 1 open, 2 half-open")
+BREAKER_REJECTIONS = metrics.REGISTRY.counter("circuit_breaker_rejections_total", "Calls refused by an open circuit")
+HEDGED_REQUESTS = metrics.REGISTRY.counter("hedged_requests_total", "Duplicate requests sent after the p95 delay")
+HEDGE_WINS = metrics.REGISTRY.counter("hedged_request_wins_total", "Hedged requests that answered first")
+FALLBACKS = metrics.REGISTRY.counter("api_fallbacks_total", "Calls answered from a fallback, by reason")
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens when at least failure_ratio of the last `window` calls failed or were slow.
+
+    After reset_timeout one probe call is let through (half-open); its
+    outcome closes the circuit again or re-opens it.
+    """
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_ratio: float = 0.5,
+                 slow_call_seconds: float = SLOW_CALL_SECONDS, reset_timeout: float = 30.0):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self._outcomes = deque(maxlen=window)
+        self._latencies = deque(maxlen=200)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        BREAKER_STATE.set_function(lambda: self._state, endpoint=name)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record(self, success: bool, latency: float) -> None:
+        failed = not success or latency > self.slow_call_seconds
+        with self._lock:
+            if success:
+                self._latencies.append(latency)
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                if failed:
+                    self._trip()
+                else:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= self.min_calls and (
+                sum(self._outcomes) / len(self._outcomes) >= self.failure_ratio
+            ):
+                self._trip()
+
+    def _trip(self) -> None:
+        if self._state != OPEN:
+            logger.error(f"Circuit for {self.name} opened")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def p95(self):
+        """Recent p95 latency of successful calls, or None until there are enough samples"""
+        with self._lock:
+            if len(self._latencies) < 20:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+
+def breaker(endpoint: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+def _timed(cb: CircuitBreaker, fn, timeout: float):
+    start = time.monotonic()
+    try:
+        result = fn(timeout)
+    except Exception:
+        cb.record(False, time.monotonic() - start)
+        raise
+    cb.record(True, time.monotonic() - start)
+    return result
+
+
+def _hedged(cb: CircuitBreaker, endpoint: str, fn, timeout: float, delay: float):
+    started = time.monotonic()
+    primary = _executor.submit(_timed, cb, fn, timeout)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    left = timeout - (time.monotonic() - started)
+    if left <= 0:
+        raise DeadlineExceeded(f"{endpoint} call exceeded its deadline")
+    HEDGED_REQUESTS.inc(endpoint=endpoint)
+    hedge = _executor.submit(_timed, cb, fn, left)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(timeout - (time.monotonic() - started), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded(f"{endpoint} call exceeded its deadline")
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    HEDGE_WINS.inc(endpoint=endpoint)
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def call(endpoint: str, fn, fallback=None, timeout: float = 30.0, hedge: bool = None):
+    """Run fn(timeout) for endpoint with breaker, deadline and optional hedging.
+
+    On an open circuit, an exhausted deadline or an error, returns
+    fallback() when one is given and raises otherwise.
+    """
+    cb = breaker(endpoint)
+    hedge = HEDGE_ENABLED if hedge is None else hedge
+    try:
+        budget = remaining(timeout)
+        if not cb.allow():
+            BREAKER_REJECTIONS.inc(endpoint=endpoint)
+            raise CircuitOpenError(f"circuit for {endpoint} is open")
+        delay = cb.p95() if hedge else None
+        if delay is not None and delay < budget:
+            return _hedged(cb, endpoint, fn, budget, delay)
+        return _timed(cb, fn, budget)
+    except Exception as e:
+        if fallback is None:
+            raise
+        reason = "circuit_open" if isinstance(e, CircuitOpenError) else (
+            "deadline" if isinstance(e, TimeoutError) else "error")
+        FALLBACKS.inc(endpoint=endpoint, reason=reason)
+        logger.error(f"{endpoint} call failed ({reason}), serving fallback: {e}")
+        return fallback()
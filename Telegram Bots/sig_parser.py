@@ -0,0 +1,341 @@
+import re
+import math
+
+# Daily dose slots understood by the reminder scheduler, in firing order
+SLOTS = ("morning", "afternoon", "night", "bedtime")
+
+TOKEN_RE = re.compile(
+    r"\d+(?:\.\d+)?(?:-\d+(?:\.\d+)?){2,3}(?![\d.])"  # 1-0-1 / 1-1-1-1 patterns
+    r"|q\d{1,2}h"                                      # q6h, q8h, q12h
+    r"|\d+/\d+"                                        # 1/2 tablet
+    r"|\d+(?:\.\d+)?"                                  # numbers
+    r"|[a-z][a-z0-9]*"                                 # words (including "d3", "b12")
+    r"|[;\n]",                                         # entry separators
+    re.IGNORECASE,
+)
+PATTERN_RE = re.compile(r"^\d+(?:\.\d+)?(?:-\d+(?:\.\d+)?){2,3}$")
+QHOURS_RE = re.compile(r"^q(\d{1,2})h$")
+NUMBER_RE = re.compile(r"^\d+(?:\.\d+)?$|^\d+/\d+$")
+
+FORMS = {"tab", "tabs", "tablet", "tablets", "cap", "caps", "capsule", "capsules", "syp", "syrup",
+         "inj", "injection", "oint", "ointment", "drops", "susp", "suspension", "t", "c"}
+
+UNITS = {
+    "mg": "mg", "mcg": "mcg", "ug": "mcg", "g": "g", "gm": "g", "ml": "ml", "iu": "IU",
+    "unit": "units", "units": "units", "tab": "tablet", "tabs": "tablet", "tablet": "tablet",
+    "tablets": "tablet", "cap": "capsule", "caps": "capsule", "capsule": "capsule",
+    "capsules": "capsule", "drop": "drops", "drops": "drops", "puff": "puffs", "puffs": "puffs",
+    "tsp": "tsp", "teaspoon": "tsp", "spoon": "tsp",
+}
+
+# Single-token frequency codes -> (canonical frequency, slots). Slots are None for doses
+# that aren't taken every day (weekly, alternate days, one-off), which daily reminders can't express
+FREQ_CODES = {
+    "od": ("once daily", ("morning",)),
+    "qd": ("once daily", ("morning",)),
+    "daily": ("once daily", ("morning",)),
+    "bd": ("twice daily", ("morning", "night")),
+    "bid": ("twice daily", ("morning", "night")),
+    "tds": ("thrice daily", ("morning", "afternoon", "night")),
+    "tid": ("thrice daily", ("morning", "afternoon", "night")),
+    "qid": ("four times daily", SLOTS),
+    "qds": ("four times daily", SLOTS),
+    "hs": ("at night", ("night",)),
+    "nightly": ("at night", ("night",)),
+    "bedtime": ("at bedtime", ("bedtime",)),
+    "morning": ("morning", ("morning",)),
+    "afternoon": ("afternoon", ("afternoon",)),
+    "evening": ("night", ("night",)),
+    "night": ("at night", ("night",)),
+    "sos": ("as needed", ()),
+    "prn": ("as needed", ()),
+    "stat": ("once only", None),
+    "weekly": ("once weekly", None),
+    "fortnightly": ("once fortnightly", None),
+    "monthly": ("once monthly", None),
+}
+
+# Multi-word frequency phrases, longest first
+FREQ_PHRASES = (
+    (("three", "times", "a", "day"), ("thrice daily", ("morning", "afternoon", "night"))),
+    (("three", "times", "daily"), ("thrice daily", ("morning", "afternoon", "night"))),
+    (("four", "times", "a", "day"), ("four times daily", SLOTS)),
+    (("four", "times", "daily"), ("four times daily", SLOTS)),
+    (("every", "other", "day"), ("alternate days", None)),
+    (("once", "a", "day"), ("once daily", ("morning",))),
+    (("twice", "a", "day"), ("twice daily", ("morning", "night"))),
+    (("thrice", "a", "day"), ("thrice daily", ("morning", "afternoon", "night"))),
+    (("once", "a", "week"), ("once weekly", None)),
+    (("twice", "a", "week"), ("twice weekly", None)),
+    (("thrice", "a", "week"), ("thrice weekly", None)),
+    (("once", "a", "month"), ("once monthly", None)),
+    (("once", "weekly"), ("once weekly", None)),
+    (("twice", "weekly"), ("twice weekly", None)),
+    (("thrice", "weekly"), ("thrice weekly", None)),
+    (("once", "fortnightly"), ("once fortnightly", None)),
+    (("once", "monthly"), ("once monthly", None)),
+    (("once", "only"), ("once only", None)),
+    (("alternate", "days"), ("alternate days", None)),
+    (("alternate", "day"), ("alternate days", None)),
+    (("every", "week"), ("once weekly", None)),
+    (("every", "month"), ("once monthly", None)),
+    (("as", "needed"), ("as needed", ())),
+    (("when", "required"), ("as needed", ())),
+    (("at", "bedtime"), ("at bedtime", ("bedtime",))),
+    (("at", "night"), ("at night", ("night",))),
+    (("once", "daily"), ("once daily", ("morning",))),
+    (("twice", "daily"), ("twice daily", ("morning", "night"))),
+    (("thrice", "daily"), ("thrice daily", ("morning", "afternoon", "night"))),
+    (("once",), ("once daily", ("morning",))),
+    (("twice",), ("twice daily", ("morning", "night"))),
+    (("thrice",), ("thrice daily", ("morning", "afternoon", "night"))),
+)
+
+TIMING_PHRASES = (
+    (("before", "food"), "before food"), (("before", "meals"), "before food"),
+    (("before", "meal"), "before food"), (("after", "food"), "after food"),
+    (("after", "meals"), "after food"), (("after", "meal"), "after food"),
+    (("with", "food"), "with food"), (("with", "meals"), "with food"),
+    (("empty", "stomach"), "on an empty stomach"), (("ac",), "before food"), (("pc",), "after food"),
+)
+
+DURATION_UNITS = {"day": "days", "days": "days", "d": "days", "week": "weeks", "weeks": "weeks",
+                  "wk": "weeks", "wks": "weeks", "month": "months", "months": "months"}
+DURATION_DAYS = {"days": 1, "weeks": 7, "months": 30}
+
+FILLER = {"x", "for", "and", "then", "take", "the", "a", "of", "to", "be", "taken", "every", "each", "per",
+          "times", "time", "orally", "po", "by", "mouth", "in", "on"}
+
+QHOUR_FREQUENCIES = {
+    6: ("four times daily", SLOTS),
+    8: ("thrice daily", ("morning", "afternoon", "night")),
+    12: ("twice daily", ("morning", "night")),
+    24: ("once daily", ("morning",)),
+}
+
+# A parse at or above this confidence can be used without asking Gemini
+MIN_CONFIDENCE = 0.75
+# Ceiling for a parse with a non-daily dose, so Gemini always reads those prescriptions
+NON_DAILY_CONFIDENCE = 0.3
+
+
+def tokenize(text: str):
+    return [t.lower() for t in TOKEN_RE.findall(text or "")]
+
+
+def _match_phrase(tokens, i, phrases):
+    for phrase, value in phrases:
+        if tuple(tokens[i:i + len(phrase)]) == phrase:
+            return len(phrase), value
+    return 0, None
+
+
+def _match_frequency(tokens, i):
+    """Match a frequency expression at tokens[i]; returns (length, (canonical, slots or None))"""
+    token = tokens[i]
+    if PATTERN_RE.match(token):
+        counts = [float(n) for n in token.split("-")]
+        slots = ("morning", "afternoon", "night") if len(counts) == 3 else SLOTS
+        return 1, (token, tuple(slot for slot, n in zip(slots, counts) if n > 0))
+    qhours = QHOURS_RE.match(token)
+    if qhours and int(qhours.group(1)) in QHOUR_FREQUENCIES:
+        return 1, QHOUR_FREQUENCIES[int(qhours.group(1))]
+    # "every 8 hours"
+    if token == "every" and i + 2 < len(tokens) and tokens[i + 1].isdigit() and tokens[i + 2] in ("hours", "hour", "hrs", "hr", "h"):
+        hours = int(tokens[i + 1])
+        if hours in QHOUR_FREQUENCIES:
+            return 3, QHOUR_FREQUENCIES[hours]
+    length, value = _match_phrase(tokens, i, FREQ_PHRASES)
+    if length:
+        return length, value
+    if token in FREQ_CODES:
+        return 1, FREQ_CODES[token]
+    return 0, None
+
+
+def _frequencies(frequency: str):
+    """(canonical, slots) of every frequency expression in the text"""
+    tokens = tokenize(frequency)
+    values = []
+    i = 0
+    while i < len(tokens):
+        length, value = _match_frequency(tokens, i)
+        if length:
+            values.append(value)
+            i += length
+        else:
+            i += 1
+    return values
+
+
+def is_non_daily(frequency: str) -> bool:
+    """True for doses not taken every day ("once weekly", "alternate days", "stat")"""
+    return any(slots is None for _, slots in _frequencies(frequency))
+
+
+def frequency_slots(frequency: str):
+    """Token-based mapping of a frequency description to daily dose slots.
+
+    Unlike substring checks, "od" inside "food" is not a frequency. Returns
+    None when nothing in the text is a recognised frequency, and no slots
+    for a dose that isn't taken every day.
+    """
+    values = _frequencies(frequency)
+    if not values:
+        return None
+    if any(slots is None for _, slots in values):
+        return []
+    slots = {slot for _, value_slots in values for slot in value_slots}
+    return [slot for slot in SLOTS if slot in slots]
+
+
+def duration_days(duration: str):
+    """Length of a course in days ("5 days" -> 5, "2 weeks" -> 14), or None if it has none"""
+    tokens = tokenize(duration)
+    for token, unit in zip(tokens, tokens[1:]):
+        if unit in DURATION_UNITS and "/" not in token and NUMBER_RE.match(token):
+            days = math.ceil(float(token) * DURATION_DAYS[DURATION_UNITS[unit]])
+            return days or None
+    return None
+
+
+def _split_entries(tokens):
+    """Split the token stream into one segment per medicine"""
+    entries, current = [], []
+    for i, token in enumerate(tokens):
+        starts_new = token in (";", "\n") or (
+            token in FORMS and token not in ("t", "c") and current
+            and not (i > 0 and NUMBER_RE.match(tokens[i - 1]))  # "1 tab" is a dose, not a new entry
+        )
+        if starts_new:
+            if current:
+                entries.append(current)
+            current = []
+            if token in (";", "\n"):
+                continue
+        current.append(token)
+    if current:
+        entries.append(current)
+    return entries
+
+
+def _parse_entry(tokens, lexicon=None):
+    """Parse one medicine segment; returns (medicine dict, tokens understood) or (None, 0)"""
+    name_parts, dose, frequency, timing, duration = [], None, None, None, None
+    understood = 0
+    i = 0
+    n = len(tokens)
+    while i < n:
+        token = tokens[i]
+        if not name_parts and dose is None and token in FORMS:
+            understood += 1
+            i += 1
+            continue
+
+        length, value = _match_frequency(tokens, i)
+        if length and frequency is None and (name_parts or dose):
+            frequency = value
+            understood += length
+            i += length
+            continue
+        if length and frequency is not None and value[1] is None:
+            # "1-0-0 weekly": the dose pattern applies only on the days given
+            frequency = (f"{frequency[0]} {value[0]}", None)
+            understood += length
+            i += length
+            continue
+
+        if NUMBER_RE.match(token):
+            unit = tokens[i + 1] if i + 1 < n else None
+            if unit in DURATION_UNITS:
+                unit = DURATION_UNITS[unit]
+                duration = f"{token} {unit[:-1] if token == '1' else unit}"
+                understood += 2
+                i += 2
+                continue
+            if unit in UNITS and dose is None:
+                dose = f"{token} {UNITS[unit]}"
+                understood += 2
+                i += 2
+                continue
+            if dose is None and name_parts:
+                dose = token
+                understood += 1
+                i += 1
+                continue
+            i += 1
+            continue
+
+        length, value = _match_phrase(tokens, i, TIMING_PHRASES)
+        if length and (name_parts or dose):
+            timing = value
+            understood += length
+            i += length
+            continue
+
+        if token in FILLER and (not name_parts or dose):
+            understood += 1
+            i += 1
+            continue
+
+        if token[0].isalpha() and dose is None and frequency is None and len(name_parts) < 4:
+            name_parts.append(token)
+            understood += 1
+        i += 1
+
+    if not name_parts or (dose is None and frequency is None):
+        return None, 0
+
+    name = " ".join(part.capitalize() for part in name_parts)
+    score = 0.4 + (0.3 if dose else 0.0) + (0.3 if frequency else 0.0)
+    if lexicon is not None:
+        # A name the drug lexicon knows is strong evidence this is a real entry
+        if any(lexicon.lookup(part) for part in name_parts):
+            name = lexicon.canonical(name)
+        else:
+            score -= 0.2
+
+    medicine = {
+        "name": name,
+        "dosage": dose or "1 tablet",
+        "frequency": frequency[0] if frequency else "twice daily",
+    }
+    if timing:
+        medicine["timing"] = timing
+    if duration:
+        medicine["duration"] = duration
+    return (medicine, score), understood
+
+
+def parse_prescription(text: str, lexicon=None) -> dict:
+    """Parse standard sig notation locally.
+
+    Returns the same {"medicines": [...], "notes": ""} shape as the Gemini
+    analysis plus a "confidence" between 0 and 1 covering how much of the
+    text was understood and how complete each medicine is. With a
+    DrugLexicon, names are canonicalised and unknown names lower the score.
+    """
+    tokens = tokenize(text)
+    words = [t for t in tokens if t not in (";", "\n")]
+    if not words:
+        return {"medicines": [], "notes": "", "confidence": 0.0}
+
+    medicines, scores, understood = [], [], 0
+    for entry in _split_entries(tokens):
+        parsed, used = _parse_entry(entry, lexicon)
+        if parsed is None:
+            continue
+        medicine, score = parsed
+        medicines.append(medicine)
+        scores.append(score)
+        understood += used
+
+    if not medicines:
+        return {"medicines": [], "notes": "", "confidence": 0.0}
+
+    coverage = min(1.0, understood / len(words))
+    confidence = (sum(scores) / len(scores)) * min(1.0, coverage / 0.8)
+    if any(is_non_daily(m["frequency"]) for m in medicines):
+        confidence = min(confidence, NON_DAILY_CONFIDENCE)
+    notes = "; ".join(sorted({m["timing"].capitalize() for m in medicines if m.get("timing")}))
+    return {"medicines": medicines, "notes": notes, "confidence": round(confidence, 3)}
@@ -0,0 +1,271 @@
+import json
+import logging
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PARSE_RESULTS = metrics.REGISTRY.counter(
+    "gemini_json_parse_total", "Structured Gemini responses by parse outcome (direct, repaired, failed)"
+)
+PARSE_RETRIES = metrics.REGISTRY.counter(
+    "gemini_json_retries_total", "Gemini calls repeated because the JSON could not be parsed"
+)
+
+# Response schemas in the OpenAPI subset accepted by Gemini's response_schema
+PRESCRIPTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "medicines": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "name": {"type": "STRING"},
+                    "dosage": {"type": "STRING"},
+                    "frequency": {"type": "STRING"},
+                    "duration": {"type": "STRING"},
+                },
+                "required": ["name"],
+            },
+        },
+        "notes": {"type": "STRING"},
+    },
+    "required": ["medicines"],
+}
+
+MEDICAL_RECORD_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "type": {"type": "STRING"},
+        "date": {"type": "STRING"},
+        "patient_info": {"type": "STRING"},
+        "key_findings": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "diagnosis": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "recommendations": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "summary": {"type": "STRING"},
+    },
+    "required": ["type", "summary"],
+}
+
+
+def json_generation_config(schema: dict) -> dict:
+    """generation_config asking Gemini for schema-constrained JSON"""
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def _as_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(_as_text(v) for v in value if v is not None)
+    return str(value).strip()
+
+
+def _as_list(value) -> List[str]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, (list, tuple)):
+        return [_as_text(v) for v in value if _as_text(v)]
+    return [_as_text(value)]
+
+
+@dataclass
+class Medicine:
+    name: str
+    dosage: str = "1 tablet"
+    frequency: str = "twice daily"
+    duration: str = ""  # course length as written ("5 days"); empty for ongoing medicines
+
+
+@dataclass
+class PrescriptionResult:
+    medicines: List[Medicine] = field(default_factory=list)
+    notes: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PrescriptionResult":
+        if not isinstance(data, dict):
+            raise ValueError("Prescription result must be an object")
+        medicines = []
+        for item in data.get("medicines") or []:
+            if not isinstance(item, dict):
+                continue
+            name = _as_text(item.get("name"))
+            if not name:
+                continue
+            medicines.append(Medicine(
+                name=name,
+                dosage=_as_text(item.get("dosage")) or "1 tablet",
+                frequency=_as_text(item.get("frequency")) or "twice daily",
+                duration=_as_text(item.get("duration")),
+            ))
+        return cls(medicines=medicines, notes=_as_text(data.get("notes")))
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class MedicalReport:
+    type: str = "Medical Record"
+    date: str = ""
+    patient_info: str = ""
+    key_findings: List[str] = field(default_factory=list)
+    diagnosis: List[str] = field(default_factory=list)
+    recommendations: List[str] = field(default_factory=list)
+    summary: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MedicalReport":
+        if not isinstance(data, dict):
+            raise ValueError("Medical report must be an object")
+        return cls(
+            type=_as_text(data.get("type")) or "Medical Record",
+            date=_as_text(data.get("date")),
+            patient_info=_as_text(data.get("patient_info")),
+            key_findings=_as_list(data.get("key_findings")),
+            diagnosis=_as_list(data.get("diagnosis")),
+            recommendations=_as_list(data.get("recommendations")),
+            summary=_as_text(data.get("summary")) or "No summary available",
+        )
+
+    def to_dict(self) -> dict:
+        # Empty optional fields are dropped so stored records keep their old shape
+        return {k: v for k, v in asdict(self).items() if v or k in ("type", "summary")}
+
+
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def repair_json(text: str) -> Optional[str]:
+    """Single-pass repair of almost-JSON model output.
+
+    Takes the first top-level object or array (ignoring code fences and any
+    prose around it), converts single-quoted strings and Python literals,
+    drops trailing commas and closes anything left open by truncation.
+    Returns None if no object or array starts in the text.
+    """
+    start = -1
+    for i, ch in enumerate(text):
+        if ch in "{[":
+            start = i
+            break
+    if start < 0:
+        return None
+
+    out = []
+    stack = []
+    quote = None  # the quote character of the string being copied
+    escaped = False
+    i = start
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if quote:
+            if escaped:
+                out.append(ch)
+                escaped = False
+            elif ch == "\\":
+                out.append(ch)
+                escaped = True
+            elif ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            while out and out[-1] in " \n\t\r,":
+                out.pop()
+            if stack:
+                out.append(stack.pop())
+            if not stack:
+                break
+        elif ch == "`":
+            pass
+        elif ch.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            if word in _LITERALS.values() or (out and out[-1][-1:].isdigit()):
+                out.append(word)  # JSON literal or a number exponent
+            elif word in _LITERALS:
+                out.append(_LITERALS[word])
+            else:
+                out.append(json.dumps(word))  # unquoted key or bare word
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if quote:
+        out.append('"')
+    while out and out[-1] in " \n\t\r,:":
+        if out[-1] == ":":
+            out.append("null")
+            break
+        out.pop()
+    while stack:
+        out.append(stack.pop())
+    return "".join(out)
+
+
+def parse_json_response(raw: str, call: str = "unknown"):
+    """Parse model output as JSON, repairing it if needed; None on failure"""
+    raw = (raw or "").strip()
+    try:
+        result = json.loads(raw)
+        PARSE_RESULTS.inc(call=call, outcome="direct")
+        return result
+    except ValueError:
+        pass
+
+    repaired = repair_json(raw)
+    if repaired is not None:
+        try:
+            result = json.loads(repaired)
+            PARSE_RESULTS.inc(call=call, outcome="repaired")
+            return result
+        except ValueError as e:
+            logger.error(f"JSON repair failed for {call}: {e}\nText: {raw[:500]}")
+    PARSE_RESULTS.inc(call=call, outcome="failed")
+    return None
+
+
+def generate_structured(generate, prompt: str, result_type, call: str, bot: str, max_attempts: int = 2):
+    """Call generate(prompt) until the reply parses into result_type.
+
+    generate must return the raw response text. Returns (result, raw_text);
+    result is None when every attempt failed to produce valid JSON.
+    """
+    raw_text = ""
+    for attempt in range(max_attempts):
+        if attempt:
+            PARSE_RETRIES.inc(call=call)
+        with metrics.track(metrics.GEMINI_SECONDS, metrics.GEMINI_ERRORS, bot=bot, call=call):
+            raw_text = generate(prompt)
+        data = parse_json_response(raw_text, call=call)
+        if data is None:
+            continue
+        try:
+            return result_type.from_dict(data), raw_text
+        except ValueError as e:
+            logger.warning(f"Invalid {call} result on attempt {attempt + 1}: {e}")
+    return None, raw_text
@@ -0,0 +1,186 @@
+"""Local library of daily-plan suggestions, searched before asking Gemini.
+
+Each entry pairs a context (the activities a tip applies to) with the
+suggestion text. Contexts are embedded as feature-hashed unigrams and
+bigrams, weighted by TF-IDF, in a float32 NumPy matrix with unit-length
+rows, so scoring a schedule against the whole library is one matrix
+product. Each task and the schedule as a whole are query rows, and an
+entry scores its best cosine similarity against any of them.
+
+Curated entries come from data/suggestions.txt. Gemini suggestions that
+users pick are stored in SQLite against the schedule they were made for
+and searched alongside them; the oldest are dropped past max_learned.
+"""
+import os
+import zlib
+import time
+import sqlite3
+import logging
+import threading
+
+import numpy as np
+
+import metrics
+from medical_search import tokenize
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_FILE = os.path.join(BASE_DIR, "data", "suggestions.txt")
+# Hashed feature space; 8 KB per entry as float32
+DIMENSIONS = 1 << 11
+TOP_K = 3
+
+SUGGESTION_LOOKUPS = metrics.REGISTRY.counter(
+    "suggestion_lookups_total", "Daily plan suggestion requests, by where the answer came from"
+)
+SUGGESTIONS_LEARNED = metrics.REGISTRY.counter(
+    "suggestions_learned_total", "Gemini suggestions added to the local suggestion library"
+)
+
+
+def features(text: str) -> list:
+    """Stemmed words and adjacent word pairs, without clock times ("8:00 AM")"""
+    words = [w for w in tokenize(text) if not w[0].isdigit() and w not in ("am", "pm")]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def hashed_counts(texts) -> np.ndarray:
+    """Signed term counts per text, hashed into DIMENSIONS columns"""
+    counts = np.zeros((len(texts), DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for term in features(text):
+            h = zlib.crc32(term.encode("utf-8"))
+            # The sign bit keeps colliding terms from only ever adding up
+            counts[row, h % DIMENSIONS] += 1.0 if h & 0x80000000 else -1.0
+    return counts
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def load_corpus(path: str = CORPUS_FILE) -> list:
+    """[(context, suggestion)] from "context | suggestion" lines"""
+    entries = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "|" not in line:
+                    continue
+                context, suggestion = (part.strip() for part in line.split("|", 1))
+                if context and suggestion:
+                    entries.append((context, suggestion))
+    except OSError as e:
+        logger.error(f"Could not read suggestion corpus {path}: {e}")
+    return entries
+
+
+class SuggestionLibrary:
+    def __init__(self, path: str, corpus_file: str = CORPUS_FILE, max_learned: int = 2000):
+        self.max_learned = max_learned
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS learned_suggestions ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " context TEXT NOT NULL,"
+                " suggestion TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " UNIQUE (context, suggestion))"
+            )
+            learned = self._conn.execute(
+                "SELECT id, context, suggestion FROM learned_suggestions ORDER BY id"
+            ).fetchall()
+
+        curated = load_corpus(corpus_file)
+        self._curated = len(curated)
+        self._learned_ids = [row[0] for row in learned]
+        entries = curated + [(context, suggestion) for _, context, suggestion in learned]
+        self._suggestions = [suggestion for _, suggestion in entries]
+        self._counts = hashed_counts([context for context, _ in entries])
+        self._idf = None
+        self._matrix = None  # weighted unit rows, rebuilt after the library changes
+
+    def __len__(self) -> int:
+        return len(self._suggestions)
+
+    def _weigh(self) -> None:
+        n = len(self._counts)
+        df = np.count_nonzero(self._counts, axis=0)
+        self._idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        self._matrix = _unit_rows(self._counts * self._idf)
+
+    def search(self, tasks, k: int = TOP_K, min_similarity: float = 0.0) -> list:
+        """Up to k distinct [(suggestion, similarity)] for a task list, best first.
+
+        Matches at or above min_similarity are spread over different tasks
+        before a second match for the same task is taken.
+        """
+        tasks = [task for task in tasks if task.strip()]
+        if not tasks or not self._suggestions:
+            return []
+        queries = tasks + ["\n".join(tasks)] if len(tasks) > 1 else tasks
+        with self._lock:
+            if self._matrix is None:
+                self._weigh()
+            query = _unit_rows(hashed_counts(queries) * self._idf)
+            similarity = query @ self._matrix.T
+            suggestions = self._suggestions
+        scores = similarity.max(axis=0)
+        best_query = similarity.argmax(axis=0)
+        order = np.argsort(-scores)[:max(k * 20, 100)]
+
+        # Spread picks over different tasks first, then fill up with the best of the rest
+        results = []
+        seen = set()
+        covered = set()
+        for spread in (True, False):
+            for index in order:
+                key = suggestions[index].lower()
+                if key in seen or (spread and (best_query[index] in covered or scores[index] < min_similarity)):
+                    continue
+                seen.add(key)
+                covered.add(best_query[index])
+                results.append((suggestions[index], float(scores[index])))
+                if len(results) == k:
+                    return sorted(results, key=lambda item: -item[1])
+        return sorted(results, key=lambda item: -item[1])
+
+    def learn(self, tasks, suggestions) -> int:
+        """Keep suggestions chosen for this task list; returns how many were new"""
+        context = "\n".join(task for task in tasks if task.strip())
+        if not context:
+            return 0
+        with self._lock, self._conn:
+            added = []
+            for suggestion in suggestions:
+                row = self._conn.execute(
+                    "INSERT OR IGNORE INTO learned_suggestions (context, suggestion, created_at) VALUES (?, ?, ?)",
+                    (context, suggestion, time.time()),
+                )
+                if row.rowcount:
+                    added.append((row.lastrowid, suggestion))
+            if not added:
+                return 0
+            # New lists rather than in-place changes: search() reads them outside the lock
+            learned_ids = self._learned_ids + [row_id for row_id, _ in added]
+            suggestions = self._suggestions + [suggestion for _, suggestion in added]
+            counts = np.vstack([self._counts, hashed_counts([context] * len(added))])
+
+            excess = len(learned_ids) - self.max_learned
+            if excess > 0:
+                # Oldest learned entries sit right after the curated ones
+                self._conn.execute("DELETE FROM learned_suggestions WHERE id <= ?", (learned_ids[excess - 1],))
+                learned_ids = learned_ids[excess:]
+                suggestions = suggestions[:self._curated] + suggestions[self._curated + excess:]
+                counts = np.delete(counts, np.s_[self._curated:self._curated + excess], axis=0)
+            self._learned_ids, self._suggestions, self._counts = learned_ids, suggestions, counts
+            self._matrix = None
+        SUGGESTIONS_LEARNED.inc(len(added))
+        return len(added)
@@ -0,0 +1,37 @@
+import calendar
+from datetime import datetime, timedelta
+
+import adherence
+from adherence import AdherenceStore
+from reminder_store import ReminderStore, TIME_FORMAT, utc_now
+
+
+def test_final_dose_of_a_course_can_be_confirmed(tmp_path):
+    path = str(tmp_path / "reminders.db")
+    reminders = ReminderStore(path, default_timezone="UTC", default_meal_times={"morning": "08:00:00"})
+    doses = AdherenceStore(path)
+    reminders.replace_medicine(1, "Amoxicillin", "500 mg", "Take Amoxicillin 500 mg", ["morning"],
+                               utc_now() + timedelta(days=1))
+
+    # Send every dose of the 1-day course, as the dispatch loop does
+    sent = []
+    while reminders.for_chat(1):
+        reminder, = reminders.for_chat(1)
+        dose_at = calendar.timegm(datetime.strptime(reminder["time"], TIME_FORMAT).timetuple())
+        doses.record_sent(1, reminder["id"], reminder["medicine"], dose_at)
+        reminders.mark_sent(reminder)
+        sent.append((reminder["id"], dose_at))
+
+    reminder_id, dose_at = sent[-1]
+    assert reminders.get(reminder_id) is None
+    assert doses.sent_medicine(1, reminder_id, dose_at) == "Amoxicillin"
+    assert doses.record_response(1, reminder_id, "Amoxicillin", dose_at, adherence.TAKEN)
+    (medicine, sent_count, taken, *_), = doses.stats(1)
+    assert (medicine, sent_count, taken) == ("Amoxicillin", len(sent), 1)
+
+
+def test_dose_sent_to_another_chat_is_not_found(tmp_path):
+    doses = AdherenceStore(str(tmp_path / "reminders.db"))
+    doses.record_sent(1, 7, "Metformin", 1_700_000_000)
+    assert doses.sent_medicine(2, 7, 1_700_000_000) is None
+    assert doses.sent_medicine(1, 7, 1_700_000_060) is None
@@ -0,0 +1,57 @@
+import io
+
+import data_export
+
+
+def seeded_stores(path):
+    reminders, reports, adherence = data_export.open_stores(str(path), str(path), 4)
+    reminder_ids = []
+    for chat_id in ("1", "2"):
+        reminders.set_profile(chat_id, "UTC", {"morning": "08:00:00", "night": "21:00:00"})
+        reminders.replace_medicine(chat_id, "Metformin", "500 mg", "Take Metformin 500 mg", ["morning", "night"])
+        reports.add(chat_id, {"file_name": f"{chat_id}.jpg", "record_details": {"type": "Blood Test"}})
+        reminder_ids.append(reminders.for_chat(chat_id)[0]["id"])
+        adherence.record_sent(chat_id, reminder_ids[-1], "Metformin", 1_700_000_000)
+    return reminders, reports, adherence
+
+
+def archive(stores):
+    out = io.BytesIO()
+    data_export.export(out, *stores, fmt="jsonl")
+    return out.getvalue().decode("utf-8").splitlines()
+
+
+def load(lines, stores, **kwargs):
+    return data_export.import_records(data_export._parse(lines), *stores, **kwargs)
+
+
+def snapshot(stores):
+    reminders, reports, adherence = stores
+    return {chat_id: (len(reminders.for_chat(chat_id)), reports.count(chat_id), adherence.stats(chat_id))
+            for chat_id in ("1", "2")}
+
+
+def test_reimport_skips_chats_with_data(tmp_path):
+    lines = archive(seeded_stores(tmp_path / "source.db"))
+    target = data_export.open_stores(str(tmp_path / "target.db"), str(tmp_path / "target.db"), 4)
+
+    first = load(lines, target)
+    assert first["reminder"] == 4 and first["dose_event"] == 2 and first["skipped_chats"] == 0
+    before = snapshot(target)
+
+    second = load(lines, target)
+    assert second["skipped_chats"] == 2
+    assert all(count == 0 for record_type, count in second.items() if record_type != "skipped_chats")
+    assert snapshot(target) == before
+
+
+def test_replace_overwrites_instead_of_appending(tmp_path):
+    lines = archive(seeded_stores(tmp_path / "source.db"))
+    target = data_export.open_stores(str(tmp_path / "target.db"), str(tmp_path / "target.db"), 4)
+    load(lines, target)
+    before = snapshot(target)
+
+    again = load(lines, target, replace=True)
+    assert again["reminder"] == 4 and again["skipped_chats"] == 0
+    assert snapshot(target) == before
+    assert sum(1 for _ in target[2].export_events()) == 2
@@ -0,0 +1,17 @@
+import prompts
+
+
+def test_short_and_repeated_values_are_kept():
+    text = "Protein\nNil\nSugar\nNil\nPus cells\n2\nRBC\n5\nEpithelial cells\n2"
+    assert prompts.compact_ocr(text) == text
+
+
+def test_repeated_letterhead_is_collapsed():
+    header = "City Diagnostic Centre, 12 MG Road, Bangalore 560001"
+    text = f"{header}\nHaemoglobin\n13.5\n{header}\nPlatelets\n2.5"
+    assert prompts.compact_ocr(text) == f"{header}\nHaemoglobin\n13.5\nPlatelets\n2.5"
+
+
+def test_noise_contacts_and_boilerplate_are_dropped():
+    text = "|||\nPh: +91 98450 12345\nGSTIN 29ABCDE1234F1Z5\nTab Metformin 500mg bd\n-"
+    assert prompts.compact_ocr(text) == "Tab Metformin 500mg bd"
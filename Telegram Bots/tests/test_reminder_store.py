@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from reminder_store import ReminderStore, TIME_FORMAT, utc_now
+
+
+def make_store(tmp_path):
+    return ReminderStore(str(tmp_path / "reminders.db"), default_timezone="UTC",
+                         default_meal_times={"morning": "08:00:00", "night": "21:00:00"})
+
+
+def test_course_stops_after_its_end(tmp_path):
+    store = make_store(tmp_path)
+    store.replace_medicine(1, "Amoxicillin", "500 mg", "Take Amoxicillin 500 mg", ["morning"],
+                           utc_now() + timedelta(days=2))
+    for _ in range(2):
+        reminder, = store.for_chat(1)
+        store.mark_sent(reminder)
+    assert store.for_chat(1) == []
+
+
+def test_ongoing_medicine_keeps_reminding(tmp_path):
+    store = make_store(tmp_path)
+    store.replace_medicine(1, "Metformin", "500 mg", "Take Metformin 500 mg", ["morning"])
+    for _ in range(5):
+        reminder, = store.for_chat(1)
+        store.mark_sent(reminder)
+    reminder, = store.for_chat(1)
+    assert reminder["time"] > (utc_now() + timedelta(days=4)).strftime(TIME_FORMAT)
+
+
+def test_reschedule_drops_finished_courses(tmp_path):
+    store = make_store(tmp_path)
+    store.replace_medicine(1, "Amoxicillin", "500 mg", "Take Amoxicillin 500 mg", ["morning"],
+                           utc_now() + timedelta(minutes=1))
+    store.replace_medicine(1, "Metformin", "500 mg", "Take Metformin 500 mg", ["night"])
+    store.set_profile(1, meal_times={"morning": "00:00:00", "night": "23:59:00"})
+    assert [r["medicine"] for r in store.for_chat(1)] == ["Metformin"]
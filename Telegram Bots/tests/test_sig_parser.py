@@ -0,0 +1,80 @@
+import pytest
+
+import sig_parser
+
+
+def only_medicine(text):
+    result = sig_parser.parse_prescription(text)
+    assert len(result["medicines"]) == 1
+    return result["medicines"][0], result["confidence"]
+
+
+@pytest.mark.parametrize("text, frequency, slots", [
+    ("Tab Metformin 500mg bd", "twice daily", ["morning", "night"]),
+    ("Tab Paracetamol 650 mg tds after food", "thrice daily", ["morning", "afternoon", "night"]),
+    ("Tab Amlodipine 5mg od", "once daily", ["morning"]),
+    ("Tab Atorvastatin 10 mg hs", "at night", ["night"]),
+    ("Tab Amoxicillin 500mg 1-0-1", "1-0-1", ["morning", "night"]),
+])
+def test_daily_doses_parse_confidently(text, frequency, slots):
+    medicine, confidence = only_medicine(text)
+    assert medicine["frequency"] == frequency
+    assert sig_parser.frequency_slots(medicine["frequency"]) == slots
+    assert confidence >= sig_parser.MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("text, frequency", [
+    ("Vitamin D3 60000 IU once a week", "once weekly"),
+    ("Cap Vitamin D3 60000 IU weekly", "once weekly"),
+    ("Inj Ceftriaxone 1g stat", "once only"),
+    ("Tab Methotrexate 7.5mg 1-0-0 weekly", "1-0-0 once weekly"),
+    ("Tab Folic Acid 5mg twice a week", "twice weekly"),
+    ("Tab Prednisolone 10mg alternate days", "alternate days"),
+    ("Tab Alendronate 70mg once a month", "once monthly"),
+])
+def test_non_daily_doses_are_left_to_gemini(text, frequency):
+    medicine, confidence = only_medicine(text)
+    assert medicine["frequency"] == frequency
+    assert sig_parser.is_non_daily(medicine["frequency"])
+    assert sig_parser.frequency_slots(medicine["frequency"]) == []
+    assert confidence < sig_parser.MIN_CONFIDENCE
+
+
+def test_one_non_daily_dose_sends_the_whole_prescription_to_gemini():
+    result = sig_parser.parse_prescription(
+        "Tab Metformin 500mg bd; Tab Amlodipine 5mg od; Tab Vitamin D3 60000 IU weekly; Tab Atorvastatin 10 mg hs"
+    )
+    assert len(result["medicines"]) == 4
+    assert result["confidence"] < sig_parser.MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("frequency, slots", [
+    ("once weekly", []),
+    ("once a week", []),
+    ("stat", []),
+    ("as needed", []),
+    ("twice daily", ["morning", "night"]),
+    ("after food", None),
+])
+def test_frequency_slots(frequency, slots):
+    assert sig_parser.frequency_slots(frequency) == slots
+
+
+def test_course_duration_is_kept():
+    medicine, confidence = only_medicine("Tab Amoxicillin 500mg 1-0-1 x 5 days")
+    assert medicine["duration"] == "5 days"
+    assert sig_parser.duration_days(medicine["duration"]) == 5
+    assert confidence >= sig_parser.MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("duration, days", [
+    ("5 days", 5),
+    ("1 week", 7),
+    ("for 2 weeks", 14),
+    ("1 month", 30),
+    ("", None),
+    (None, None),
+    ("till review", None),
+])
+def test_duration_days(duration, days):
+    assert sig_parser.duration_days(duration) == days
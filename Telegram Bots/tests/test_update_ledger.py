@@ -0,0 +1,39 @@
+import pytest
+
+from update_ledger import UpdateLedger
+
+
+def counting(result):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fn, calls
+
+
+def test_success_is_reused(tmp_path):
+    ledger = UpdateLedger(str(tmp_path / "ledger.db"), "test")
+    fn, calls = counting({"plan": "dal"})
+    assert ledger.memo(1, "plan", fn) == {"plan": "dal"}
+    assert ledger.memo(1, "plan", fn) == {"plan": "dal"}
+    assert len(calls) == 1
+
+
+def test_exception_is_not_stored(tmp_path):
+    ledger = UpdateLedger(str(tmp_path / "ledger.db"), "test")
+    fn, calls = counting(RuntimeError("Gemini is down"))
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            ledger.memo(1, "plan", fn)
+    assert len(calls) == 2
+
+
+def test_result_rejected_by_keep_is_not_stored(tmp_path):
+    ledger = UpdateLedger(str(tmp_path / "ledger.db"), "test")
+    fn, calls = counting([False, "Error: quota exceeded"])
+    for _ in range(2):
+        assert ledger.memo(1, "reminders", fn, keep=lambda result: result[0]) == [False, "Error: quota exceeded"]
+    assert len(calls) == 2
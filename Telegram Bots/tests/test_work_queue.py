@@ -0,0 +1,25 @@
+import time
+
+import deadlines
+from work_queue import ChatWorkQueue
+
+
+def test_job_runs_under_the_submitters_deadline():
+    queue = ChatWorkQueue("test", workers=1)
+    queue.start()
+    with deadlines.deadline(5):
+        _, inside = queue.submit(1, "plan", deadlines.remaining, 60)
+    _, outside = queue.submit(2, "plan", deadlines.remaining, 60)
+
+    assert inside.result(timeout=5) <= 5
+    assert outside.result(timeout=5) == 60
+
+
+def test_job_past_the_submitters_deadline_fails():
+    queue = ChatWorkQueue("test", workers=1)
+    with deadlines.deadline(0.01):
+        _, future = queue.submit(1, "plan", deadlines.remaining, 60)
+    time.sleep(0.05)
+    queue.start()
+
+    assert isinstance(future.exception(timeout=5), deadlines.DeadlineExceeded)
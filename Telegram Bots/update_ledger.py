@@ -0,0 +1,211 @@
+"""Persistent ledger of processed Telegram updates.
+
+Telegram redelivers updates the bot hadn't acknowledged when it stopped,
+so a restart mid-pipeline would download, OCR and analyse the same photo
+again. Every update is claimed here before its handlers run and marked
+done once they, and any queued job they started, have finished.
+
+begin() refuses updates already done, and updates this process is still
+working on. An update left running by a process that has since exited is
+handed out again. memo() stores the successful results of expensive steps
+under the update, so the rerun picks up where the crashed one stopped
+instead of redoing them, while a step that failed is tried again. Entries expire after ttl_seconds and the ledger keeps at
+most max_entries, pruned as updates arrive.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process; running entries owned by anyone else belong to a process that has gone
+INSTANCE = uuid.uuid4().hex
+RUNNING, DONE = "running", "done"
+PRUNE_EVERY = 1000
+# Telegram keeps unconfirmed updates for 24 hours, so remember them for longer than that
+LEDGER_TTL_HOURS = float(os.getenv("UPDATE_LEDGER_TTL_HOURS", "48"))
+LEDGER_MAX_ENTRIES = int(os.getenv("UPDATE_LEDGER_MAX_ENTRIES", "100000"))
+
+UPDATES_SKIPPED = metrics.REGISTRY.counter(
+    "updates_skipped_total", "Redelivered updates dropped by the update ledger, by reason"
+)
+UPDATES_RESUMED = metrics.REGISTRY.counter(
+    "updates_resumed_total", "Updates picked up again after the process handling them exited"
+)
+MEMO_HITS = metrics.REGISTRY.counter("update_memo_hits_total", "Expensive steps reused from a previous attempt")
+
+
+class _Dispatch:
+    __slots__ = ("key", "deferred")
+
+    def __init__(self, key):
+        self.key = key
+        self.deferred = False
+
+
+_current = contextvars.ContextVar("update_dispatch", default=None)
+
+
+class UpdateLedger:
+    def __init__(self, path: str, bot: str, ttl_seconds: float = LEDGER_TTL_HOURS * 3600,
+                 max_entries: int = LEDGER_MAX_ENTRIES):
+        self.bot = bot
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._claims = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed_updates ("
+                " update_id INTEGER PRIMARY KEY,"
+                " state TEXT NOT NULL,"
+                " owner TEXT NOT NULL,"
+                " started_at REAL NOT NULL,"
+                " finished_at REAL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_processed_updates_started ON processed_updates (started_at)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS update_results ("
+                " update_id INTEGER NOT NULL,"
+                " name TEXT NOT NULL,"
+                " result TEXT NOT NULL,"
+                " PRIMARY KEY (update_id, name))"
+            )
+
+    def begin(self, update_id: int) -> bool:
+        """Claim an update; False if it was already handled or is being handled right now"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT state, owner FROM processed_updates WHERE update_id = ?", (update_id,)
+            ).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO processed_updates (update_id, state, owner, started_at) VALUES (?, ?, ?, ?)",
+                    (update_id, RUNNING, INSTANCE, now),
+                )
+            elif row[0] == DONE or row[1] == INSTANCE:
+                UPDATES_SKIPPED.inc(bot=self.bot, reason=row[0])
+                return False
+            else:
+                self._conn.execute(
+                    "UPDATE processed_updates SET owner = ?, started_at = ? WHERE update_id = ?",
+                    (INSTANCE, now, update_id),
+                )
+                UPDATES_RESUMED.inc(bot=self.bot)
+                logger.info(f"Resuming update {update_id} left unfinished by a previous run")
+
+            self._claims += 1
+            if self._claims % PRUNE_EVERY == 0:
+                self._prune(now)
+        return True
+
+    def finish(self, update_id: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE processed_updates SET state = ?, finished_at = ? WHERE update_id = ?",
+                (DONE, time.time(), update_id),
+            )
+            self._conn.execute("DELETE FROM update_results WHERE update_id = ?", (update_id,))
+
+    def _prune(self, now: float) -> None:
+        expired = self._conn.execute(
+            "DELETE FROM processed_updates WHERE started_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        excess = self._conn.execute(
+            "DELETE FROM processed_updates WHERE update_id IN ("
+            " SELECT update_id FROM processed_updates ORDER BY started_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        self._conn.execute(
+            "DELETE FROM update_results WHERE update_id NOT IN (SELECT update_id FROM processed_updates)"
+        )
+        if expired or excess:
+            logger.info(f"Pruned {expired + excess} entries from the update ledger")
+
+    def memo(self, update_id, name: str, fn, *args, keep=None):
+        """fn(*args), or its result stored by an earlier attempt at the same update.
+
+        Only successes are stored: nothing is kept when fn raises, or when
+        keep(result) is false for a fn that reports failure in its result.
+        Results must be JSON-serialisable; tuples come back as lists. Without
+        an update_id this is just fn(*args).
+        """
+        if update_id is None:
+            return fn(*args)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM update_results WHERE update_id = ? AND name = ?", (update_id, name)
+            ).fetchone()
+        if row is not None:
+            MEMO_HITS.inc(bot=self.bot, step=name)
+            return json.loads(row[0])
+
+        result = fn(*args)
+        if keep is not None and not keep(result):
+            return result
+        try:
+            encoded = json.dumps(result, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Could not store {name} result for update {update_id}: {e}")
+            return result
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO update_results (update_id, name, result) VALUES (?, ?, ?)",
+                (update_id, name, encoded),
+            )
+        return result
+
+    # Tracking the update being dispatched
+
+    @contextmanager
+    def dispatch(self, update_id: int):
+        """Run an update's handlers; it is finished on exit unless a handler deferred it.
+
+        A handler that raised has had its go, so that finishes it too: only a
+        process that dies mid-update leaves it to be resumed.
+        """
+        dispatch = _Dispatch(update_id)
+        token = _current.set(dispatch)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+            if not dispatch.deferred:
+                self.finish(update_id)
+
+    @staticmethod
+    def current():
+        """update_id being handled in this context, or None"""
+        dispatch = _current.get()
+        return dispatch.key if dispatch else None
+
+    @staticmethod
+    def defer():
+        """Keep the current update open past its handlers (the caller finishes it); returns its id"""
+        dispatch = _current.get()
+        if dispatch is None:
+            return None
+        dispatch.deferred = True
+        return dispatch.key
+
+    @staticmethod
+    def call_with(update_id, fn, *args):
+        """fn(*args) with update_id as the current update, for work handed to another thread"""
+        token = _current.set(_Dispatch(update_id))
+        try:
+            return fn(*args)
+        finally:
+            _current.reset(token)
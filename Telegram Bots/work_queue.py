@@ -0,0 +1,154 @@
+"""Per-chat serialized queue for expensive work (OCR plus Gemini).
+
+Each chat runs at most one job at a time. Chats with waiting work take
+turns for the shared worker threads in round-robin order, so one chat
+sending a burst of photos cannot starve everyone else. A chat keeps at
+most one waiting job per kind; a newer submission replaces the older one
+if it has not started yet. Submissions beyond the per-chat rate limit are
+refused outright. Jobs run in a copy of the submitter's context, so they
+stay under the deadline of the update that queued them.
+"""
+import time
+import contextvars
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# submit() outcomes
+ACCEPTED, QUEUED, SUPERSEDED, THROTTLED = "accepted", "queued", "superseded", "throttled"
+
+WORK_SUBMISSIONS = metrics.REGISTRY.counter("work_submissions_total", "Expensive jobs submitted, by outcome")
+WORK_WAIT_SECONDS = metrics.REGISTRY.histogram("work_queue_wait_seconds", "Time jobs wait for a worker")
+
+
+class _Chat:
+    __slots__ = ("pending", "running", "ready", "recent")
+
+    def __init__(self):
+        self.pending = OrderedDict()  # kind -> (future, context, fn, args, submitted)
+        self.running = False
+        self.ready = False  # waiting in the round-robin line
+        self.recent = deque()  # submission times inside the rate window
+
+    def idle(self, now: float, per_seconds: float) -> bool:
+        while self.recent and now - self.recent[0] > per_seconds:
+            self.recent.popleft()
+        return not (self.pending or self.running or self.recent)
+
+
+class ChatWorkQueue:
+    def __init__(self, name: str, workers: int = 2, max_jobs: int = 5, per_seconds: float = 60.0):
+        self.name = name
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.per_seconds = per_seconds
+        self._chats = {}
+        self._ready = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._sweep_at = 1024
+        metrics.QUEUE_DEPTH.set_function(self.pending, queue=name)
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, chat_id, kind: str, fn, *args):
+        """Queue fn(*args) for chat_id; returns (outcome, Future or None)"""
+        now = time.monotonic()
+        context = contextvars.copy_context()
+        with self._cond:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                if len(self._chats) >= self._sweep_at:
+                    self._sweep(now)
+                chat = self._chats[chat_id] = _Chat()
+            chat.idle(now, self.per_seconds)
+            if len(chat.recent) >= self.max_jobs:
+                WORK_SUBMISSIONS.inc(queue=self.name, outcome=THROTTLED)
+                return THROTTLED, None
+            chat.recent.append(now)
+
+            if kind in chat.pending:
+                outcome = SUPERSEDED
+                chat.pending.pop(kind)[0].cancel()
+            elif chat.running or chat.pending:
+                outcome = QUEUED
+            else:
+                outcome = ACCEPTED
+            future = Future()
+            chat.pending[kind] = (future, context, fn, args, now)
+            if not chat.running and not chat.ready:
+                chat.ready = True
+                self._ready.append(chat_id)
+                self._cond.notify()
+        WORK_SUBMISSIONS.inc(queue=self.name, outcome=outcome)
+        return outcome, future
+
+    def retry_after(self, chat_id) -> int:
+        """Seconds until chat_id may submit again"""
+        with self._cond:
+            chat = self._chats.get(chat_id)
+            if chat is None or not chat.recent:
+                return 0
+            return max(int(chat.recent[0] + self.per_seconds - time.monotonic()) + 1, 0)
+
+    def _sweep(self, now: float) -> None:
+        """Forget chats with nothing queued and no recent submissions"""
+        for chat_id in [chat_id for chat_id, chat in self._chats.items() if chat.idle(now, self.per_seconds)]:
+            del self._chats[chat_id]
+        self._sweep_at = max(1024, len(self._chats) * 2)
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(len(chat.pending) for chat in self._chats.values())
+
+    def join(self, chat_id=None, timeout: float = None) -> bool:
+        """Wait until chat_id's jobs, or every chat's, have finished; False if timeout passed first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._busy(chat_id):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _busy(self, chat_id) -> bool:
+        chats = self._chats.values() if chat_id is None else [self._chats.get(chat_id)]
+        return any(chat is not None and (chat.pending or chat.running) for chat in chats)
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                chat_id = self._ready.popleft()
+                chat = self._chats[chat_id]
+                chat.ready = False
+                future, context, fn, args, submitted = chat.pending.popitem(last=False)[1]
+                chat.running = True
+
+            WORK_WAIT_SECONDS.observe(time.monotonic() - submitted, queue=self.name)
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(context.run(fn, *args))
+                except Exception as e:
+                    logger.error(f"{self.name} job for chat {chat_id} failed: {e}")
+                    future.set_exception(e)
+
+            with self._cond:
+                chat.running = False
+                if chat.pending:
+                    # Back of the line, behind every other chat that is waiting
+                    chat.ready = True
+                    self._ready.append(chat_id)
+                # Wakes a worker for the chat requeued above, and anyone in join()
+                self._cond.notify_all()